@@ -1,5 +1,4 @@
 from django.apps import AppConfig
-import threading
 
 
 class MtcmkgApiConfig(AppConfig):
@@ -10,9 +9,4 @@ class MtcmkgApiConfig(AppConfig):
         # importa i receiver perché si registrino
         from . import signals  # noqa 
 
-        from .ranked_worker import matchmaking_loop
-        # Evita di farlo partire più volte (es. con runserver --noreload)
-        if not hasattr(self, 'worker_started'):
-            self.worker_started = True
-            t = threading.Thread(target=matchmaking_loop, daemon=True)
-            t.start()
\ No newline at end of file
+        # Il matchmaking ranked gira in processi separati: `python manage.py ranked_worker`
\ No newline at end of file
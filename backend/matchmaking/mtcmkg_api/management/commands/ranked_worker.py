@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from mtcmkg_api.ranked_worker import matchmaking_loop
+
+
+class Command(BaseCommand):
+    help = "Avvia un worker del matchmaking ranked (se ne possono avviare più copie in parallelo)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bucket-size", type=int, default=100, help="Trofei per bucket")
+        parser.add_argument("--lease-ttl", type=int, default=5, help="Durata delle lease in secondi")
+        parser.add_argument("--interval", type=float, default=1.0, help="Secondi tra due giri di matchmaking")
+
+    def handle(self, *args, bucket_size, lease_ttl, interval, **options):
+        try:
+            matchmaking_loop(bucket_size=bucket_size, lease_ttl=lease_ttl, interval=interval)
+        except KeyboardInterrupt:
+            self.stdout.write("Ranked matchmaking worker stopped.")
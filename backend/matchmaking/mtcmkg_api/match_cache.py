@@ -0,0 +1,45 @@
+from django.core.cache import cache
+
+# Chiavi condivise con il servizio pong_game (stessa istanza Redis)
+MATCH_ID_KEY = "match_id_for_game_{}"
+MATCH_DESCRIPTOR_KEY = "match_descriptor_{}"
+MATCH_STATUS_KEY = "match_status_{}"
+GAME_ID_KEY = "game_id_for_match_{}"  # match.id -> game_id, per aggiornare lo stato ad ogni save
+MATCH_CACHE_TIMEOUT = 3600
+
+
+def cache_match(game_id, match):
+    """
+    Associa il game_id al match appena creato e ne salva lo stato.
+
+    Il descrittore con i giocatori lo costruisce pong_game alla prima connessione
+    (pong_game_ws.match_cache); lo stato vive in una chiave a parte, riscritta
+    ad ogni salvataggio del match (vedi cache_match_status).
+    """
+    cache.set_many({
+        MATCH_ID_KEY.format(game_id): match.id,
+        GAME_ID_KEY.format(match.id): game_id,
+        MATCH_STATUS_KEY.format(game_id): match.status,
+    }, timeout=MATCH_CACHE_TIMEOUT)
+
+
+def cache_match_status(match):
+    """
+    Riporta in cache lo stato di un match salvato (es. torneo annullato), così il game
+    server lo vede al prossimo handshake senza aspettare la scadenza della cache.
+    """
+    game_id = cache.get(GAME_ID_KEY.format(match.id))
+    if game_id is not None:
+        cache.set(MATCH_STATUS_KEY.format(game_id), match.status, timeout=MATCH_CACHE_TIMEOUT)
+
+
+def forget_match(game_id, match_id):
+    """
+    Rimuove le voci di cache di un game_id il cui match non esiste più.
+    """
+    cache.delete_many([
+        MATCH_ID_KEY.format(game_id),
+        MATCH_DESCRIPTOR_KEY.format(game_id),
+        MATCH_STATUS_KEY.format(game_id),
+        GAME_ID_KEY.format(match_id),
+    ])
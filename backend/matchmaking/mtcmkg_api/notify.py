@@ -0,0 +1,89 @@
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from .ranked_pool import RESULT_CHANNEL
+from .rendezvous import READY_CHANNEL
+
+
+class ResultListener:
+    """
+    Un'unica sottoscrizione pub/sub per processo ai canali `channel` (es. `ranked_result:{}`).
+
+    Le richieste in long-poll registrano un Event per il proprio nome (la parte variabile
+    del canale: name, game_id...) e lo attendono; il thread del listener lo segnala
+    quando viene pubblicato un esito. Nessuna connessione Redis per richiesta in attesa.
+    """
+
+    def __init__(self, redis_url, channel):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.lock = threading.Lock()
+        self.waiters = {}  # nome -> set di threading.Event
+        self.thread = None
+        self.stats = {"notified": 0, "timeouts": 0, "reconnects": 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.listen, daemon=True)
+                self.thread.start()
+
+    def listen(self):
+        pattern = self.channel.format("*")
+        prefix = len(self.channel.format(""))
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.redis_url).pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(pattern)
+                for message in pubsub.listen():
+                    name = message["channel"].decode()[prefix:]
+                    with self.lock:
+                        events = list(self.waiters.get(name, ()))
+                    for event in events:
+                        event.set()
+                    self.stats["notified"] += len(events)
+            except Exception as e:
+                print(f"[ERROR] Result listener for {pattern} failed: {e}")
+                self.stats["reconnects"] += 1
+                # Le attese in corso scadono e il client rifà la richiesta: nessun esito va perso
+                time.sleep(1)
+
+    def register(self, name):
+        self.start()
+        event = threading.Event()
+        with self.lock:
+            self.waiters.setdefault(name, set()).add(event)
+        return event
+
+    def unregister(self, name, event):
+        with self.lock:
+            events = self.waiters.get(name)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self.waiters[name]
+
+    def wait(self, name, timeout, check, done):
+        """
+        Attende al più `timeout` secondi un esito per `name`. `check()` legge lo stato
+        dopo la registrazione (un esito pubblicato un attimo prima non va perso) e dopo
+        il risveglio; se `done(stato)` è già vero non attende. Restituisce l'ultimo stato letto.
+        """
+        event = self.register(name)
+        try:
+            result = check()
+            if done(result):
+                return result
+            if event.wait(timeout):
+                return check()
+            self.stats["timeouts"] += 1
+            return result
+        finally:
+            self.unregister(name, event)
+
+
+ranked_result_listener = ResultListener(settings.CACHES["default"]["LOCATION"], RESULT_CHANNEL)
+rendezvous_listener = ResultListener(settings.CACHES["default"]["LOCATION"], READY_CHANNEL)
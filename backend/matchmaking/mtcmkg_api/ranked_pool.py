@@ -0,0 +1,196 @@
+import time
+
+# Pool ranked in Redis: sorted set username -> trofei e hash username -> istante di ingresso (epoch)
+POOL_KEY = "ranked_pool:trophies"
+JOINED_KEY = "ranked_pool:joined"
+# Chiave Redis con lo stato della ricerca di un giocatore: WAITING, PENDING (coppia prenotata,
+# match in creazione) oppure il game_id trovato
+WAIT_KEY = "ranked_wait:{}"
+WAITING = "waiting"
+PENDING = "pending"
+WAIT_TIMEOUT = 60
+# Canale pub/sub su cui viene pubblicato l'esito della ricerca di un giocatore
+RESULT_CHANNEL = "ranked_result:{}"
+
+# Prenota due giocatori: li toglie dalla pool e marca entrambe le ricerche come PENDING, in un'unica
+# operazione. Fallisce se uno dei due non è più in coda; chi ha la chiave di attesa scaduta
+# (il client non sta più cercando) viene tolto dalla pool.
+CLAIM_PAIR_LUA = """
+    local claimed = 1
+    for i = 1, 2 do
+        if not redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+            claimed = 0
+        elseif redis.call('EXISTS', KEYS[2 + i]) == 0 then
+            redis.call('ZREM', KEYS[1], ARGV[i])
+            redis.call('HDEL', KEYS[2], ARGV[i])
+            claimed = 0
+        end
+    end
+    if claimed == 0 then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('HDEL', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[4])
+    redis.call('SET', KEYS[4], ARGV[3], 'EX', ARGV[4])
+    return 1
+"""
+
+# Scrive il game_id per entrambi e lo pubblica sui loro canali, solo se nessuno dei due
+# ha annullato la ricerca dopo la prenotazione (entrambe le chiavi ancora PENDING).
+PUBLISH_MATCH_LUA = """
+    for i = 1, 2 do
+        if redis.call('GET', KEYS[i]) ~= ARGV[2] then
+            return 0
+        end
+    end
+    for i = 1, 2 do
+        redis.call('SET', KEYS[i], ARGV[1], 'EX', ARGV[3])
+        redis.call('PUBLISH', ARGV[3 + i], ARGV[1])
+    end
+    return 1
+"""
+
+# Rimette in pool (con trofei e istante di ingresso originali) un giocatore prenotato
+# il cui match non è stato creato, se non ha annullato nel frattempo.
+REQUEUE_LUA = """
+    if redis.call('GET', KEYS[3]) ~= ARGV[4] then
+        return 0
+    end
+    redis.call('SET', KEYS[3], ARGV[5], 'EX', ARGV[6])
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+    return 1
+"""
+
+
+def add_player(redis_conn, username, trophies, joined_at=None):
+    pipe = redis_conn.pipeline()
+    pipe.zadd(POOL_KEY, {username: trophies})
+    pipe.hset(JOINED_KEY, username, joined_at if joined_at is not None else time.time())
+    pipe.execute()
+
+
+def start_search(redis_conn, username):
+    """
+    Segna il giocatore come in attesa; False se ha già una ricerca in corso (o appena conclusa).
+    """
+    return bool(redis_conn.set(WAIT_KEY.format(username), WAITING, nx=True, ex=WAIT_TIMEOUT))
+
+
+def search_status(redis_conn, username):
+    """
+    WAITING, PENDING, il game_id trovato oppure None (ricerca scaduta o annullata).
+    """
+    value = redis_conn.get(WAIT_KEY.format(username))
+    return value.decode() if value else None
+
+
+def remove_player(redis_conn, username):
+    """
+    Esce dalla ricerca: pool e chiave di attesa vengono rimosse nella stessa transazione
+    (MULTI/EXEC), quindi non può intrecciarsi con un claim_pair. True se era ancora in coda.
+    """
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.zrem(POOL_KEY, username)
+    pipe.hdel(JOINED_KEY, username)
+    pipe.delete(WAIT_KEY.format(username))
+    pipe.publish(RESULT_CHANNEL.format(username), "")  # sveglia un'eventuale attesa in long-poll
+    return pipe.execute()[0] == 1
+
+
+def claim_pair(redis_conn, username_1, username_2):
+    """
+    Prenota atomicamente i due giocatori (vedi CLAIM_PAIR_LUA), prima di creare il match.
+    Più worker possono chiamarla sugli stessi giocatori: al più uno riesce.
+    """
+    claimed = redis_conn.eval(
+        CLAIM_PAIR_LUA, 4,
+        POOL_KEY, JOINED_KEY, WAIT_KEY.format(username_1), WAIT_KEY.format(username_2),
+        username_1, username_2, PENDING, WAIT_TIMEOUT,
+    )
+    return claimed == 1
+
+
+def publish_match(redis_conn, username_1, username_2, game_id):
+    """
+    Consegna `game_id` alla coppia prenotata; False se uno dei due ha annullato nel frattempo.
+    """
+    published = redis_conn.eval(
+        PUBLISH_MATCH_LUA, 2, WAIT_KEY.format(username_1), WAIT_KEY.format(username_2),
+        game_id, PENDING, WAIT_TIMEOUT,
+        RESULT_CHANNEL.format(username_1), RESULT_CHANNEL.format(username_2),
+    )
+    return published == 1
+
+
+def requeue_player(redis_conn, username, trophies, joined_at):
+    """
+    Annulla la prenotazione di un giocatore rimettendolo in pool; False se aveva annullato.
+    """
+    return redis_conn.eval(
+        REQUEUE_LUA, 3, POOL_KEY, JOINED_KEY, WAIT_KEY.format(username),
+        username, trophies, joined_at, PENDING, WAITING, WAIT_TIMEOUT,
+    ) == 1
+
+
+def load_pool(redis_conn, min_trophies="-inf", max_trophies="+inf"):
+    """
+    Restituisce i giocatori in coda con trofei tra `min_trophies` e `max_trophies` (inclusi),
+    ordinati per trofei: lista di (username, trofei, ingresso).
+    """
+    entries = redis_conn.zrangebyscore(POOL_KEY, min_trophies, max_trophies, withscores=True)
+    if not entries:
+        return []
+    joined = redis_conn.hmget(JOINED_KEY, [username for username, _ in entries])
+    now = time.time()
+    return [
+        (username.decode(), int(trophies), float(joined_at) if joined_at else now)
+        for (username, trophies), joined_at in zip(entries, joined)
+    ]
+
+
+def trophy_range(redis_conn):
+    """
+    Trofei minimi e massimi presenti nella pool, oppure None se è vuota.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.zrange(POOL_KEY, 0, 0, withscores=True)
+    pipe.zrange(POOL_KEY, -1, -1, withscores=True)
+    first, last = pipe.execute()
+    if not first:
+        return None
+    return int(first[0][1]), int(last[0][1])
+
+
+def tolerance(waited):
+    return int(waited // 10 + 1) * 5  # es: 0–10s → 5, 10–20s → 10, ecc.
+
+
+def find_pairs(pool, now=None):
+    """
+    Accoppia i giocatori di `pool` (ordinata per trofei, vedi load_pool).
+
+    Due giocatori sono compatibili se la differenza di trofei rientra nella tolleranza
+    più ampia dei due, che cresce con l'attesa. Ogni giocatore viene confrontato solo con
+    i vicini successivi finché la differenza resta entro la tolleranza massima della pool,
+    quindi il costo è quello dell'ordinamento più una finestra di vicini per giocatore.
+    """
+    now = time.time() if now is None else now
+    tolerances = [tolerance(now - joined) for _, _, joined in pool]
+    widest = max(tolerances, default=0)
+
+    matched = [False] * len(pool)
+    pairs = []
+    for i, (_, trophies, _) in enumerate(pool):
+        if matched[i]:
+            continue
+        for j in range(i + 1, len(pool)):
+            diff = pool[j][1] - trophies
+            if diff > widest:
+                break
+            if not matched[j] and diff <= max(tolerances[i], tolerances[j]):
+                matched[i] = matched[j] = True
+                pairs.append((pool[i], pool[j]))
+                break
+    return pairs
@@ -1,80 +1,233 @@
 # matchmaking_worker.py
 
-import json
+import math
+import os
+import socket
 import time
 import uuid
 import redis
-from datetime import datetime
-from django.core.cache import cache
-from django.utils.timezone import now
 from django.conf import settings
-from dateutil.parser import isoparse  # per leggere gli ISO timestamp
+from django.db import DatabaseError
 from .models import PongUser, Match
+from .match_cache import cache_match, forget_match
+from .ranked_pool import (
+    JOINED_KEY, POOL_KEY, WAIT_TIMEOUT,
+    claim_pair, find_pairs, load_pool, publish_match, remove_player, requeue_player,
+    tolerance, trophy_range,
+)
 
 redis_url = settings.CACHES["default"]["LOCATION"]
-redis_conn = redis.Redis.from_url(redis_url)
-POOL_KEY = "ranked_pool"
-
-def get_time_diff_seconds(ts_string):
-    return (now() - isoparse(ts_string)).total_seconds()
-
-def players_compatible(p1, p2):
-    t1 = get_time_diff_seconds(p1["timestamp"])
-    t2 = get_time_diff_seconds(p2["timestamp"])
-    tolerance_1 = int(t1 // 10 + 1) * 5   # es: 0–10s → 5, 10–20s → 10, ecc.
-    tolerance_2 = int(t2 // 10 + 1) * 5
-    diff = abs(p1["trophies"] - p2["trophies"])
-    return diff <= max(tolerance_1, tolerance_2)
-
-def matchmaking_loop():
-    print("Ranked matchmaking worker started.")
-    while True:
+
+
+class RankedWorker:
+    """
+    Processo di matchmaking ranked (avviato con `manage.py ranked_worker`, anche in N copie).
+
+    La pool è divisa in bucket di `bucket_size` trofei. Ogni worker prende in lease
+    (chiave Redis con scadenza, rinnovata ad ogni giro) al più la sua quota di bucket
+    attivi, calcolata sul numero di worker vivi, e accoppia solo i giocatori del proprio bucket.
+    Le coppie a cavallo di un confine vengono cercate dal bucket inferiore, che legge anche
+    i primi `overlap` trofei del successivo; claim_pair garantisce comunque che un giocatore
+    non venga preso da due worker.
+
+    Uno dei worker, eletto con una lease a parte, fa la manutenzione: toglie dal registro
+    i worker morti e dalla pool i giocatori che hanno smesso di cercare.
+    """
+    WORKERS_KEY = "ranked_workers"
+    BUCKET_KEY = "ranked_bucket:{}"
+    LEADER_KEY = "ranked_leader"
+    PRUNE_INTERVAL = 30
+
+    # Rinnova una lease solo se appartiene ancora a questo worker
+    RENEW_LUA = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('EXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    # Rilascia una lease solo se appartiene ancora a questo worker
+    RELEASE_LUA = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, redis_conn, bucket_size=100, lease_ttl=5, interval=1.0, worker_id=None):
+        self.redis = redis_conn
+        self.bucket_size = bucket_size
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Tolleranza massima raggiungibile prima che l'attesa del client scada
+        self.overlap = tolerance(WAIT_TIMEOUT)
+        self.buckets = set()  # bucket in lease
+        self.leader = False
+        self.pruned_at = 0
+        self.stats = {"cycles": 0, "matches": 0, "lost_claims": 0, "failed_matches": 0}
+
+    def acquire(self, key):
+        """
+        Prende o rinnova la lease `key`; True se ora appartiene a questo worker.
+        """
+        if self.redis.set(key, self.worker_id, nx=True, ex=self.lease_ttl):
+            return True
+        return self.redis.eval(self.RENEW_LUA, 1, key, self.worker_id, self.lease_ttl) == 1
+
+    def release(self, key):
+        self.redis.eval(self.RELEASE_LUA, 1, key, self.worker_id)
+
+    def heartbeat(self):
+        self.redis.zadd(self.WORKERS_KEY, {self.worker_id: time.time()})
+
+    def live_workers(self):
+        return max(1, self.redis.zcount(self.WORKERS_KEY, time.time() - self.lease_ttl, "+inf"))
+
+    def active_buckets(self):
+        trophies = trophy_range(self.redis)
+        if trophies is None:
+            return []
+        return list(range(trophies[0] // self.bucket_size, trophies[1] // self.bucket_size + 1))
+
+    def assign_buckets(self):
+        """
+        Rinnova i bucket già in lease e ne prende di liberi fino alla quota di questo worker.
+        """
+        active = self.active_buckets()
+        share = math.ceil(len(active) / self.live_workers())
+        owned = set()
+        for bucket in sorted(self.buckets):
+            if bucket in active and len(owned) < share and self.acquire(self.BUCKET_KEY.format(bucket)):
+                owned.add(bucket)
+        for bucket in self.buckets - owned:
+            # Bucket non più attivi o oltre la quota (sono arrivati altri worker): li cede
+            self.release(self.BUCKET_KEY.format(bucket))
+        if active and len(owned) < share:
+            # Parte da un punto diverso per ogni worker per ridurre le collisioni sulle lease
+            start = hash(self.worker_id) % len(active)
+            for bucket in active[start:] + active[:start]:
+                if len(owned) >= share:
+                    break
+                if bucket not in owned and self.acquire(self.BUCKET_KEY.format(bucket)):
+                    owned.add(bucket)
+        self.buckets = owned
+
+    def match_bucket(self, bucket):
+        low = bucket * self.bucket_size
+        high = low + self.bucket_size
+        pool = load_pool(self.redis, low, high - 1 + self.overlap)
+        for p1, p2 in find_pairs(pool):
+            if p1[1] >= high:
+                continue  # coppia interamente nel bucket successivo
+            self.create_match(p1, p2)
+
+    def create_match(self, p1, p2):
+        # Prenota la coppia prima di toccare il database: con le finestre dei bucket sovrapposte
+        # i claim persi sono normali e non devono costare scritture
+        if not claim_pair(self.redis, p1[0], p2[0]):
+            # Uno dei due ha annullato o è stato preso da un altro worker
+            self.stats["lost_claims"] += 1
+            return
+
+        game_id = str(uuid.uuid4())
+        users = {}
         try:
-            # Prende tutta la pool
-            raw_pool = redis_conn.lrange(POOL_KEY, 0, -1)
-            pool = [json.loads(p) for p in raw_pool]
+            users = PongUser.objects.in_bulk([p1[0], p2[0]], field_name="username")
+            if len(users) < 2:
+                raise PongUser.DoesNotExist(f"Unknown players {sorted({p1[0], p2[0]} - set(users))}")
+            match = Match.objects.create(
+                player_1=users[p1[0]],
+                player_2=users[p2[0]],
+                status="created"
+            )
+        except (PongUser.DoesNotExist, DatabaseError) as e:
+            print(f"[ERROR] Cannot create ranked match for {p1[0]} and {p2[0]}: {e}")
+            self.stats["failed_matches"] += 1
+            # Torna in coda chi esiste ancora (entrambi se il database non ha risposto);
+            # un utente che non esiste più esce dalla ricerca
+            for player in (p1, p2):
+                if not users or player[0] in users:
+                    self.requeue([player])
+                else:
+                    remove_player(self.redis, player[0])
+            return
+
+        # salva in cache, poi consegna il game_id ai due client
+        cache_match(game_id, match)
+        if not publish_match(self.redis, p1[0], p2[0], game_id):
+            # Uno dei due ha annullato dopo la prenotazione: il match non partirà mai
+            forget_match(game_id, match.id)
+            match.delete()
+            self.requeue((p1, p2))
+            return
+        self.stats["matches"] += 1
+        print(f"[MATCH] {p1[0]} vs {p2[0]} → {game_id}")
+
+    def requeue(self, players):
+        for username, trophies, joined_at in players:
+            requeue_player(self.redis, username, trophies, joined_at)
+
+    def maintain(self):
+        """
+        Compiti del leader: pulizia del registro dei worker e dei giocatori abbandonati.
+        """
+        now = time.time()
+        self.redis.zremrangebyscore(self.WORKERS_KEY, 0, now - self.lease_ttl * 4)
+        if now - self.pruned_at < self.PRUNE_INTERVAL:
+            return
+        self.pruned_at = now
+        # Oltre WAIT_TIMEOUT la chiave di attesa è scaduta: il client non sta più cercando
+        stale = [
+            username for username, joined_at in self.redis.hscan_iter(JOINED_KEY)
+            if now - float(joined_at) > WAIT_TIMEOUT * 2
+        ]
+        if stale:
+            pipe = self.redis.pipeline()
+            pipe.zrem(POOL_KEY, *stale)
+            pipe.hdel(JOINED_KEY, *stale)
+            pipe.execute()
+            print(f"[INFO] Removed {len(stale)} abandoned players from the ranked pool")
 
-            matched = set()
-            for i in range(len(pool)):
-                if pool[i]["username"] in matched:
+    def run_once(self):
+        self.heartbeat()
+        self.leader = self.acquire(self.LEADER_KEY)
+        if self.leader:
+            self.maintain()
+        self.assign_buckets()
+        for bucket in sorted(self.buckets):
+            self.match_bucket(bucket)
+        self.stats["cycles"] += 1
+
+    def run(self):
+        print(f"Ranked matchmaking worker {self.worker_id} started.")
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    self.run_once()
+                except redis.RedisError as e:
+                    print(f"[ERROR] {e}")
+                    time.sleep(5)
                     continue
-                for j in range(i + 1, len(pool)):
-                    if pool[j]["username"] in matched:
-                        continue
-                    if players_compatible(pool[i], pool[j]):
-                        # Match trovato!
-                        p1 = pool[i]
-                        p2 = pool[j]
-                        game_id = str(uuid.uuid4())
-
-                        # crea match
-                        player_1 = PongUser.objects.get(username=p1["username"])
-                        player_2 = PongUser.objects.get(username=p2["username"])
-
-                        match = Match.objects.create(
-                            player_1=player_1,
-                            player_2=player_2,
-                            status="created"
-                        )
-
-                        # salva in cache
-                        cache.set(f"match_id_for_game_{game_id}", match.id, timeout=3600)
-                        print(f"[MATCH] {p1['username']} vs {p2['username']} → {game_id}")
-
-                        # Scrive nella cache il risultato per ciascun player
-                        cache.set(f"ranked_wait_{p1['username']}", {"game_id": game_id}, timeout=60)
-                        cache.set(f"ranked_wait_{p2['username']}", {"game_id": game_id}, timeout=60)
-
-                        # Rimuove i player dalla lista
-                        redis_conn.lrem(POOL_KEY, 0, json.dumps(p1))
-                        redis_conn.lrem(POOL_KEY, 0, json.dumps(p2))
-
-                        matched.add(p1["username"])
-                        matched.add(p2["username"])
-                        break  # esce dal ciclo interno
-
-            time.sleep(1)
-
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            time.sleep(5)
+                except Exception as e:
+                    print(f"[ERROR] {e}")
+                time.sleep(max(0, self.interval - (time.monotonic() - started)))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """
+        Cede subito lease e posto nel registro, così gli altri worker ridistribuiscono i bucket.
+        """
+        try:
+            for bucket in self.buckets:
+                self.release(self.BUCKET_KEY.format(bucket))
+            if self.leader:
+                self.release(self.LEADER_KEY)
+            self.redis.zrem(self.WORKERS_KEY, self.worker_id)
+        except redis.RedisError as e:
+            print(f"[ERROR] Ranked worker shutdown failed: {e}")
+
+
+def matchmaking_loop(**options):
+    RankedWorker(redis.Redis.from_url(redis_url), **options).run()
@@ -0,0 +1,124 @@
+import time
+import uuid
+
+# Punto d'incontro di due giocatori (partite private, match di torneo) condiviso tra le repliche
+SLOT_KEY = "rendezvous:{}"          # hash username/game_id/since di chi attende, per nome
+RESULT_KEY = "rendezvous_result:{}"  # esito per game_id: pending, ready o failed
+READY_CHANNEL = "rendezvous_ready:{}"  # pub/sub per game_id, sveglia chi attende
+
+# Il primo giocatore occupa lo slot, il secondo lo libera e marca il game_id come "pending"
+# nella stessa operazione: due giocatori non possono mai prendere lo stesso avversario.
+CLAIM_LUA = """
+    local owner = redis.call('HGET', KEYS[1], 'username')
+    if not owner then
+        redis.call('HSET', KEYS[1], 'username', ARGV[1], 'game_id', ARGV[2], 'since', ARGV[4])
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return {'created', ARGV[2], ARGV[1]}
+    end
+    local game_id = redis.call('HGET', KEYS[1], 'game_id')
+    if owner == ARGV[1] then
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return {'waiting', game_id, owner}
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[2] .. game_id, 'pending', 'EX', ARGV[3] * 2)
+    return {'joined', game_id, owner}
+"""
+
+# Libera lo slot solo se è ancora quello di `game_id` (nessuno l'ha preso nel frattempo)
+# e sveglia un'eventuale attesa in corso su quel game_id
+ABANDON_LUA = """
+    if redis.call('HGET', KEYS[1], 'game_id') == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+        redis.call('PUBLISH', ARGV[2], '')
+        return 1
+    end
+    return 0
+"""
+
+# Rinnova la scadenza dello slot solo se è ancora quello di `game_id`
+REFRESH_LUA = """
+    if redis.call('HGET', KEYS[1], 'game_id') == ARGV[1] then
+        return redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+"""
+
+
+class Rendezvous:
+    """
+    Incontro tra due giocatori su Redis: funziona tra più processi/repliche e non tiene
+    stato in memoria. Chi arriva per primo attende l'esito sul proprio game_id tramite
+    `listener` (vedi notify.ResultListener), per al più il timeout richiesto.
+    """
+
+    def __init__(self, redis_conn, listener, ttl=60):
+        self.redis = redis_conn
+        self.listener = listener
+        self.ttl = ttl
+
+    def claim(self, name, username, ttl=None):
+        """
+        Restituisce (esito, game_id, username di chi ha creato lo slot), dove esito è
+        "created" (si attende un avversario), "waiting" (slot già nostro) o "joined".
+        Lo slot scade dopo `ttl` secondi (default self.ttl) se nessuno lo rinnova.
+        """
+        outcome, game_id, owner = self.redis.eval(
+            CLAIM_LUA, 2, SLOT_KEY.format(name), RESULT_KEY.format(""),
+            username, str(uuid.uuid4()), ttl or self.ttl, time.time(),
+        )
+        return outcome.decode(), game_id.decode(), owner.decode()
+
+    def complete(self, game_id, ok=True):
+        """
+        Chiamata da chi ha fatto "joined" dopo aver creato (o non essere riuscito a creare) il match.
+        """
+        pipe = self.redis.pipeline()
+        pipe.set(RESULT_KEY.format(game_id), "ready" if ok else "failed", ex=self.ttl * 2)
+        pipe.publish(READY_CHANNEL.format(game_id), "")
+        pipe.execute()
+
+    def status(self, name, game_id):
+        """
+        "ready", "failed", "pending", "waiting" (ancora nessun avversario) o None (slot scaduto).
+        """
+        pipe = self.redis.pipeline()
+        pipe.get(RESULT_KEY.format(game_id))
+        pipe.hget(SLOT_KEY.format(name), "game_id")
+        result, slot_game_id = pipe.execute()
+        if result:
+            return result.decode()
+        if slot_game_id and slot_game_id.decode() == game_id:
+            return "waiting"
+        return None
+
+    def wait(self, name, game_id, timeout):
+        return self.listener.wait(
+            game_id, timeout, lambda: self.status(name, game_id),
+            done=lambda status: status not in ("waiting", "pending"),
+        )
+
+    def waited(self, name, game_id):
+        """
+        Secondi trascorsi da quando lo slot di `game_id` è stato creato, anche attraverso
+        più richieste; None se lo slot non è più in attesa con quel game_id.
+        """
+        slot_game_id, since = self.redis.hmget(SLOT_KEY.format(name), "game_id", "since")
+        if not slot_game_id or slot_game_id.decode() != game_id:
+            return None
+        return time.time() - float(since)
+
+    def refresh(self, name, game_id, ttl=None):
+        """
+        Chi attende è ancora presente: lo slot resta valido per altri `ttl` secondi.
+        False se lo slot non è più suo (preso da un avversario o scaduto).
+        """
+        return self.redis.eval(REFRESH_LUA, 1, SLOT_KEY.format(name), game_id, ttl or self.ttl) == 1
+
+    def abandon(self, name, game_id):
+        """
+        Rinuncia all'attesa; False se nel frattempo un avversario ha preso lo slot.
+        """
+        return self.redis.eval(
+            ABANDON_LUA, 1, SLOT_KEY.format(name), game_id, READY_CHANNEL.format(game_id),
+        ) == 1
@@ -4,6 +4,14 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Match, Tournament, PongUser
 from .bracket import find_next_round_player
+from .match_cache import cache_match_status
+
+@receiver(post_save, sender=Match)
+def refresh_cached_match_status(sender, instance, created, **kwargs):
+    # Lo stato in cache è l'unico controllo del game server all'handshake: va tenuto allineato
+    if not created:
+        cache_match_status(instance)
+
 
 @receiver(post_save, sender=Match)
 def check_match_finished(sender, instance, **kwargs):
@@ -1,3 +1,386 @@
-from django.test import TestCase
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .ranked_pool import (
+    PENDING, WAIT_KEY, WAITING, add_player, claim_pair, find_pairs, load_pool, publish_match,
+    remove_player, search_status, start_search, tolerance, trophy_range,
+)
+from .notify import ResultListener
+from .ranked_worker import RankedWorker
+from .models import PongUser, Tournament
+from .rendezvous import READY_CHANNEL, SLOT_KEY, Rendezvous
+from .views import TournamentView
+
+
+class FindPairsTests(SimpleTestCase):
+    NOW = 1000.0
+
+    def pool(self, *players):
+        # (username, trofei, secondi di attesa) -> formato di load_pool, ordinato per trofei
+        return sorted(
+            ((username, trophies, self.NOW - waited) for username, trophies, waited in players),
+            key=lambda player: player[1],
+        )
+
+    def names(self, pairs):
+        return [(p1[0], p2[0]) for p1, p2 in pairs]
+
+    def test_tolerance_widens_with_waiting_time(self):
+        self.assertEqual([tolerance(w) for w in (0, 9.9, 10, 25, 59)], [5, 5, 10, 15, 30])
+
+    def test_players_within_tolerance_are_paired(self):
+        pool = self.pool(("a", 100, 0), ("b", 105, 0), ("c", 200, 0), ("d", 203, 0))
+        self.assertEqual(self.names(find_pairs(pool, now=self.NOW)), [("a", "b"), ("c", "d")])
+
+    def test_players_outside_tolerance_wait(self):
+        pool = self.pool(("a", 100, 0), ("b", 106, 0))
+        self.assertEqual(find_pairs(pool, now=self.NOW), [])
+
+    def test_longest_wait_widens_the_pair(self):
+        # b aspetta da 20 s: tolleranza 15, basta uno dei due
+        pool = self.pool(("a", 100, 0), ("b", 112, 20))
+        self.assertEqual(self.names(find_pairs(pool, now=self.NOW)), [("a", "b")])
+
+    def test_each_player_is_paired_once_with_nearest_neighbour(self):
+        pool = self.pool(("a", 100, 30), ("b", 101, 0), ("c", 103, 0))
+        pairs = find_pairs(pool, now=self.NOW)
+        self.assertEqual(self.names(pairs), [("a", "b")])
+
+    def test_empty_pool(self):
+        self.assertEqual(find_pairs([], now=self.NOW), [])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class RankedPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def test_load_pool_reads_trophy_window_in_order(self):
+        for username, trophies in (("c", 300), ("a", 100), ("b", 150)):
+            add_player(self.redis, username, trophies, joined_at=5.0)
+        self.assertEqual(trophy_range(self.redis), (100, 300))
+        self.assertEqual(load_pool(self.redis, 100, 200), [("a", 100, 5.0), ("b", 150, 5.0)])
+
+    def test_empty_pool_has_no_range(self):
+        self.assertIsNone(trophy_range(self.redis))
+        self.assertEqual(load_pool(self.redis), [])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class ClaimPairTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for username, trophies in (("a", 100), ("b", 102), ("c", 104)):
+            self.queue(username, trophies)
+
+    def queue(self, username, trophies):
+        start_search(self.redis, username)
+        add_player(self.redis, username, trophies, joined_at=1.0)
+
+    def test_claim_reserves_both_players_once(self):
+        self.assertTrue(claim_pair(self.redis, "a", "b"))
+        self.assertEqual(search_status(self.redis, "a"), PENDING)
+        self.assertEqual([p[0] for p in load_pool(self.redis)], ["c"])
+        # Un secondo worker con una finestra sovrapposta perde il claim
+        self.assertFalse(claim_pair(self.redis, "b", "c"))
+        self.assertEqual([p[0] for p in load_pool(self.redis)], ["c"])
+        self.assertEqual(search_status(self.redis, "c"), WAITING)
+
+    def test_expired_wait_key_drops_only_that_player(self):
+        self.redis.delete(WAIT_KEY.format("b"))  # il client di b ha smesso di cercare
+        self.assertFalse(claim_pair(self.redis, "a", "b"))
+        self.assertEqual([p[0] for p in load_pool(self.redis)], ["a", "c"])
+        self.assertTrue(claim_pair(self.redis, "a", "c"))
+
+    def test_cancel_before_claim_wins(self):
+        self.assertTrue(remove_player(self.redis, "a"))
+        self.assertFalse(claim_pair(self.redis, "a", "b"))
+        self.assertIsNone(search_status(self.redis, "a"))
+        self.assertEqual(search_status(self.redis, "b"), WAITING)
+
+    def test_cancel_after_claim_blocks_publication(self):
+        self.assertTrue(claim_pair(self.redis, "a", "b"))
+        self.assertFalse(remove_player(self.redis, "a"))  # non era più in pool
+        self.assertFalse(publish_match(self.redis, "a", "b", "g1"))
+        self.assertIsNone(search_status(self.redis, "a"))
+        self.assertEqual(search_status(self.redis, "b"), PENDING)
+
+    def test_publish_delivers_game_id_to_both(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe("ranked_result:*")
+        self.assertTrue(claim_pair(self.redis, "a", "b"))
+        self.assertTrue(publish_match(self.redis, "a", "b", "g1"))
+        self.assertEqual([search_status(self.redis, u) for u in ("a", "b")], ["g1", "g1"])
+        messages = []
+        for _ in range(10):  # get_message restituisce None anche per la conferma di psubscribe
+            message = pubsub.get_message(timeout=0.1)
+            if message:
+                messages.append(message)
+        self.assertEqual({m["channel"] for m in messages}, {b"ranked_result:a", b"ranked_result:b"})
+        self.assertEqual({m["data"] for m in messages}, {b"g1"})
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class RankedWorkerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def worker(self, worker_id, **kwargs):
+        return RankedWorker(self.redis, worker_id=worker_id, **kwargs)
+
+    def test_lease_acquire_renew_and_release(self):
+        first, second = self.worker("w1", lease_ttl=5), self.worker("w2", lease_ttl=5)
+        self.assertTrue(first.acquire("lease"))
+        self.assertFalse(second.acquire("lease"))
+
+        self.redis.expire("lease", 1)
+        self.assertTrue(first.acquire("lease"))  # rinnovo: la scadenza torna a lease_ttl
+        self.assertEqual(self.redis.ttl("lease"), 5)
+
+        second.release("lease")  # non è sua: nessun effetto
+        self.assertEqual(self.redis.get("lease"), b"w1")
+        first.release("lease")
+        self.assertTrue(second.acquire("lease"))
+
+    def test_expired_lease_passes_to_another_worker(self):
+        first, second = self.worker("w1"), self.worker("w2")
+        self.assertTrue(first.acquire("lease"))
+        self.redis.delete("lease")  # scaduta: w1 è morto
+        self.assertTrue(second.acquire("lease"))
+        self.assertFalse(first.acquire("lease"))
+
+    def test_workers_split_active_buckets(self):
+        for i, trophies in enumerate((10, 150, 250, 350)):
+            add_player(self.redis, f"p{i}", trophies)
+        workers = [self.worker(f"w{i}", bucket_size=100) for i in range(2)]
+        for worker in workers:
+            worker.heartbeat()
+        for worker in workers:
+            worker.assign_buckets()
+        self.assertEqual([len(worker.buckets) for worker in workers], [2, 2])
+        self.assertEqual(workers[0].buckets | workers[1].buckets, {0, 1, 2, 3})
+
+        workers[1].shutdown()
+        workers[0].assign_buckets()
+        self.assertEqual(workers[0].buckets, {0, 1, 2, 3})
+
+    def test_lost_claim_does_not_touch_the_database(self):
+        worker = self.worker("w1")
+        with mock.patch("mtcmkg_api.ranked_worker.PongUser.objects.in_bulk") as in_bulk:
+            worker.create_match(("a", 100, 1.0), ("b", 102, 1.0))  # nessuno dei due è in pool
+        in_bulk.assert_not_called()
+        self.assertEqual(worker.stats["lost_claims"], 1)
+
+    def test_database_failure_requeues_the_pair(self):
+        for username, trophies in (("a", 100), ("b", 102)):
+            start_search(self.redis, username)
+            add_player(self.redis, username, trophies, joined_at=1.0)
+        worker = self.worker("w1")
+        with mock.patch("mtcmkg_api.ranked_worker.PongUser.objects.in_bulk", side_effect=DatabaseError("down")):
+            worker.create_match(("a", 100, 1.0), ("b", 102, 1.0))
+        self.assertEqual(load_pool(self.redis), [("a", 100, 1.0), ("b", 102, 1.0)])
+        self.assertEqual([search_status(self.redis, u) for u in ("a", "b")], [WAITING, WAITING])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class ResultListenerTests(SimpleTestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        patcher = mock.patch("mtcmkg_api.notify.redis.Redis.from_url",
+                             lambda url: fakeredis.FakeRedis(server=server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.listener = ResultListener("redis://fake", "ranked_result:{}")
+
+    def wait_for_subscription(self):
+        self.listener.start()
+        deadline = time.monotonic() + 2
+        while self.redis.pubsub_numpat() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def wait(self, timeout):
+        return self.listener.wait(
+            "alice", timeout, lambda: search_status(self.redis, "alice"),
+            done=lambda result: result not in (WAITING, PENDING),
+        )
+
+    def test_result_published_before_the_wait_is_returned_at_once(self):
+        for username in ("alice", "bob"):
+            start_search(self.redis, username)
+            add_player(self.redis, username, 100)
+        claim_pair(self.redis, "alice", "bob")
+        publish_match(self.redis, "alice", "bob", "g1")  # nessuno in ascolto: il messaggio è perso
+
+        started = time.monotonic()
+        self.assertEqual(self.wait(5), "g1")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.listener.waiters, {})
+
+    def test_publication_during_the_wait_wakes_it(self):
+        start_search(self.redis, "alice")
+        self.wait_for_subscription()
+
+        def publish():
+            time.sleep(0.1)
+            self.redis.set(WAIT_KEY.format("alice"), "g2")
+            self.redis.publish("ranked_result:alice", "g2")
+        threading.Thread(target=publish).start()
+
+        started = time.monotonic()
+        self.assertEqual(self.wait(5), "g2")
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_timeout_returns_the_last_state(self):
+        start_search(self.redis, "alice")
+        self.assertEqual(self.wait(0.05), WAITING)
+        self.assertEqual(self.listener.stats["timeouts"], 1)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class RendezvousTests(SimpleTestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        patcher = mock.patch("mtcmkg_api.notify.redis.Redis.from_url",
+                             lambda url: fakeredis.FakeRedis(server=server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rendezvous = Rendezvous(self.redis, ResultListener("redis://fake", READY_CHANNEL), ttl=60)
+
+    def in_background(self, delay, function, *args, **kwargs):
+        def run():
+            # Dopo che il listener (avviato dalla wait) si è iscritto, altrimenti il messaggio va perso
+            deadline = time.monotonic() + 2
+            while self.redis.pubsub_numpat() == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(delay)
+            function(*args, **kwargs)
+        threading.Thread(target=run).start()
+
+    def test_second_player_joins_the_first_slot(self):
+        outcome, game_id, owner = self.rendezvous.claim("private_1", "alice")
+        self.assertEqual((outcome, owner), ("created", "alice"))
+        self.assertEqual(self.rendezvous.claim("private_1", "alice")[:2], ("waiting", game_id))
+        self.assertEqual(self.rendezvous.claim("private_1", "bob"), ("joined", game_id, "alice"))
+        self.assertEqual(self.rendezvous.status("private_1", game_id), "pending")
+        # Lo slot è libero: un terzo giocatore ne apre uno nuovo
+        self.assertEqual(self.rendezvous.claim("private_1", "carol")[0], "created")
+
+    def test_wait_wakes_on_completion(self):
+        _, game_id, _ = self.rendezvous.claim("private_1", "alice")
+        self.rendezvous.claim("private_1", "bob")
+        self.in_background(0.1, self.rendezvous.complete, game_id)
+        self.assertEqual(self.rendezvous.wait("private_1", game_id, 5), "ready")
+
+    def test_failed_creation_is_reported(self):
+        _, game_id, _ = self.rendezvous.claim("private_1", "alice")
+        self.rendezvous.claim("private_1", "bob")
+        self.rendezvous.complete(game_id, ok=False)
+        self.assertEqual(self.rendezvous.wait("private_1", game_id, 5), "failed")
+
+    def test_abandon_frees_the_slot_and_wakes_the_wait(self):
+        _, game_id, _ = self.rendezvous.claim("private_1", "alice")
+        self.in_background(0.1, self.rendezvous.abandon, "private_1", game_id)
+        started = time.monotonic()
+        self.assertIsNone(self.rendezvous.wait("private_1", game_id, 5))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.rendezvous.claim("private_1", "bob")[0], "created")
+
+    def test_opponent_arriving_at_the_deadline_wins_over_abandon(self):
+        _, game_id, _ = self.rendezvous.claim("tournament_1_0", "alice")
+        self.assertEqual(self.rendezvous.wait("tournament_1_0", game_id, 0.05), "waiting")
+        # L'avversario prende lo slot tra la fine dell'attesa e l'abbandono
+        self.rendezvous.claim("tournament_1_0", "bob")
+        self.assertFalse(self.rendezvous.abandon("tournament_1_0", game_id))
+        self.assertEqual(self.rendezvous.status("tournament_1_0", game_id), "pending")
+
+    def test_waited_counts_from_the_slot_creation(self):
+        _, game_id, _ = self.rendezvous.claim("tournament_1_0", "alice")
+        self.redis.hset(SLOT_KEY.format("tournament_1_0"), "since", time.time() - 30)
+        self.rendezvous.claim("tournament_1_0", "alice")  # una nuova richiesta non azzera l'attesa
+        self.assertGreaterEqual(self.rendezvous.waited("tournament_1_0", game_id), 30)
+        self.assertIsNone(self.rendezvous.waited("tournament_1_0", "other-game"))
+        self.rendezvous.claim("tournament_1_0", "bob")
+        self.assertIsNone(self.rendezvous.waited("tournament_1_0", game_id))
+
+    def test_refresh_extends_only_our_slot(self):
+        _, game_id, _ = self.rendezvous.claim("private_1", "alice", ttl=10)
+        self.redis.expire(SLOT_KEY.format("private_1"), 1)
+        self.assertTrue(self.rendezvous.refresh("private_1", game_id, ttl=10))
+        self.assertEqual(self.redis.ttl(SLOT_KEY.format("private_1")), 10)
+        self.assertFalse(self.rendezvous.refresh("private_1", "other-game", ttl=10))
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class TournamentShortPollTests(SimpleTestCase):
+    """
+    Il primo giocatore di un match di torneo attende con richieste brevi ripetute (202 +
+    game_id) invece di tenere occupato un thread per tutta l'attesa.
+    """
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        self.alice = PongUser(username="alice")
+        self.bob = PongUser(username="bob")
+        self.tournament = mock.Mock(id=1, status=Tournament.Status.FULL)
+        self.tournament.players.all.return_value = [self.alice, self.bob]
+        self.match_model = mock.Mock()
+        patchers = (
+            mock.patch("mtcmkg_api.notify.redis.Redis.from_url", lambda url: fakeredis.FakeRedis(server=server)),
+            mock.patch("mtcmkg_api.views.rendezvous",
+                       Rendezvous(self.redis, ResultListener("redis://fake", READY_CHANNEL), ttl=60)),
+            mock.patch("mtcmkg_api.views.current_slot", lambda tournament, user: 0 if user is self.alice else 1),
+            mock.patch("mtcmkg_api.views.get_player_position_in_match",
+                       lambda tournament, m_num, user: 1 if user is self.alice else 2),
+            mock.patch("mtcmkg_api.views.get_opponent_for_player", return_value=self.bob),
+            mock.patch("mtcmkg_api.views.PongUser.objects.get", lambda username: self.bob if username == "bob" else self.alice),
+            mock.patch("mtcmkg_api.views.Match", self.match_model),
+            mock.patch("mtcmkg_api.views.cache_match"),
+            mock.patch.object(TournamentView, "get_object", return_value=self.tournament),
+            mock.patch.object(TournamentView, "MAX_WAIT", 0.05),
+        )
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, user, **data):
+        request = APIRequestFactory().post("/match/tournament/1/", data, format="json")
+        force_authenticate(request, user=user)
+        return TournamentView.as_view()(request, pk=1)
+
+    def test_first_player_polls_until_the_opponent_arrives(self):
+        first = self.post(self.alice)
+        self.assertEqual(first.status_code, 202)
+        game_id = first.data["game_id"]
+        again = self.post(self.alice, game_id=game_id)
+        self.assertEqual((again.status_code, again.data["game_id"]), (202, game_id))
+
+        joined = self.post(self.bob)
+        self.assertEqual((joined.status_code, joined.data["game_id"]), (200, game_id))
+        self.assertEqual(self.match_model.objects.create.call_args.kwargs["player_1"], self.alice)
+
+        done = self.post(self.alice, game_id=game_id)
+        self.assertEqual((done.status_code, done.data["game_id"]), (200, game_id))
+
+    def test_walkover_after_the_total_wait(self):
+        game_id = self.post(self.alice).data["game_id"]
+        self.redis.hset(SLOT_KEY.format("tournament_1_0"), "since", time.time() - TournamentView.WALKOVER_AFTER - 1)
+
+        response = self.post(self.alice, game_id=game_id)
+
+        self.assertEqual(response.data, {"detail": "win by walk_over"})
+        self.assertEqual(self.match_model.objects.create.call_args.kwargs["status"], "finished_walkover")
+        self.assertFalse(self.redis.exists(SLOT_KEY.format("tournament_1_0")))
@@ -1,7 +1,6 @@
 import uuid
 import json
 import redis
-from threading import Condition
 from django.core.cache import cache
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -11,141 +10,149 @@ from rest_framework import status
 from .serializers import MatchCreateSerializer, TournamentCreateSerializer, TournamentListSerializer, TournamentDetailSerializer
 from .models import Match, PongUser, Tournament
 from django.db import transaction
+from .match_cache import cache_match
+from .ranked_pool import PENDING, WAITING, add_player, remove_player, search_status, start_search
+from .notify import ranked_result_listener, rendezvous_listener
+from .rendezvous import Rendezvous
 from .bracket import current_slot, get_opponent_for_player, get_player_position_in_match
 from django.conf import settings
 from datetime import datetime
 from django.utils.timezone import now
 
 
-conditions = {}
 redis_url = settings.CACHES["default"]["LOCATION"]
 redis_conn = redis.Redis.from_url(redis_url)
+rendezvous = Rendezvous(redis_conn, rendezvous_listener, ttl=100)
 
 class PongRankedMatchView(APIView):
     permission_classes = [IsAuthenticated]
+    MAX_WAIT = 25  # secondi massimi di attesa di una GET in long-poll
 
     def post(self, request):
         user = request.user
         username = user.username
         trophies = user.trophies
 
-        #controllo se l'utente è già in ranked
-        if cache.get(f"ranked_wait_{username}"):
+        # 1. Imposta l'attesa (prima della pool: il matcher accoppia solo chi ha l'attesa),
+        #    controllando nello stesso SET NX se l'utente è già in ranked
+        if not start_search(redis_conn, username):
             return Response(
                 {"detail": "You are already in matchmaking queue"}, 
                 status=status.HTTP_409_CONFLICT
             )
 
+        # 2. Inserisce il player nella pool Redis (ordinata per trofei, con istante di ingresso)
+        add_player(redis_conn, username, trophies)
 
-        # Timestamp e payload per il matchmaking
-        timestamp = now().isoformat()
-        player_data = {
-            "username": username,
-            "trophies": trophies,
-            "timestamp": timestamp
-        }
-
-        # 1. Inserisce il player in coda Redis
-        redis_conn.rpush("ranked_pool", json.dumps(player_data))
-
-        # 2. Imposta un'attesa in cache
-        cache.set(f"ranked_wait_{username}", {"status": "waiting"}, timeout=60)
-
-        # 3. Il client farà polling con un GET /match/ranked/status/
+        # 3. Il client attende l'esito con GET /match/ranked/?wait=<secondi> (long-poll)
         return Response({"detail": "Searching for match"}, status=202)
     
     def get(self, request):
+        """
+        Stato della ricerca. Con `?wait=<secondi>` la risposta arriva appena il worker trova
+        l'avversario (o la ricerca viene annullata), al più dopo MAX_WAIT secondi.
+        """
         username = request.user.username
-        key = f"ranked_wait_{username}"
-        cached = cache.get(key)
+        try:
+            wait = float(request.query_params.get("wait", 0))
+        except ValueError:
+            wait = 0
+        wait = min(wait, self.MAX_WAIT) if wait > 0 else 0
+
+        if wait:
+            result = ranked_result_listener.wait(
+                username, wait, lambda: search_status(redis_conn, username),
+                done=lambda result: result not in (WAITING, PENDING),
+            )
+        else:
+            result = search_status(redis_conn, username)
 
-        if not cached:
+        if not result:
             return Response({"detail": "Matchmaking expired or cancelled"}, status=404)
 
-        if cached.get("status") == "waiting":
+        if result in (WAITING, PENDING):
             return Response({"detail": "Still searching..."}, status=202)
 
-        if "game_id" in cached:
-            return Response({"game_id": cached["game_id"]}, status=200)
-
-        return Response({"detail": "Unknown matchmaking state"}, status=500)
+        return Response({"game_id": result}, status=200)
 
     def delete(self, request):
         username = request.user.username
-        trophies = request.user.trophies
 
-        # Elimina dalla cache
-        cache.delete(f"ranked_wait_{username}")
-
-        # Rimuovi dalla coda Redis (scorre la lista e rimuove il match)
-        redis_key = "ranked_pool"
-        player_data = {
-            "username": username,
-            "trophies": trophies,
-        }
-        # Rimuove tutte le occorrenze (può succedere che ci siano duplicati per errore)
-        redis_conn.lrem(redis_key, 0, json.dumps(player_data))
+        # Rimuove pool e attesa nella stessa transazione Redis
+        remove_player(redis_conn, username)
 
         return Response({"detail": "Matchmaking cancelled"}, status=200)
 
-def get_condition(password):
-    if password not in conditions:
-        conditions[password] = Condition()
-    return conditions[password]
-
 class PongPrivatePasswordMatchView(APIView):
     permission_classes = [IsAuthenticated]
+    MAX_WAIT = 5  # secondi massimi di attesa di una richiesta: il thread del worker non resta occupato
+    # Lo slot di chi attende scade poco dopo la fine di una richiesta se il client non la ripete:
+    # chi abbandona la pagina senza DELETE occupa la password al più per questo tempo
+    SLOT_TTL = MAX_WAIT + 5
 
     def post(self, request):
+        """
+        Il primo giocatore con una password attende l'avversario in long-poll: se entro MAX_WAIT
+        secondi non arriva nessuno riceve 202 con il proprio game_id e ripete la richiesta
+        passando `game_id` (ogni richiesta rinnova lo slot). Il secondo giocatore crea il match
+        e riceve subito il game_id. Con DELETE il primo giocatore rinuncia all'attesa.
+        """
         password = request.data.get("password")
         username = request.user.username
         if not password:
             return Response({"detail": "Password is required"}, status=400)
 
-        game_id_key = f"game_id_{password}"
+        name = f"private_{password}"
+        game_id = request.data.get("game_id")
 
-        if cache.get(game_id_key) and username == cache.get(game_id_key).get("username"):
-            condition = get_condition(password)
-            with condition:
-                condition.notify()
-                condition.wait(timeout=1)
+        if not game_id:
+            outcome, game_id, player_1_username = rendezvous.claim(name, username, ttl=self.SLOT_TTL)
+            if outcome == "joined":  # Giocatore 2 trova il game_id
+                return self.create_match(game_id, player_1_username, request.user)
+        else:
+            rendezvous.refresh(name, game_id, ttl=self.SLOT_TTL)
 
-        if cache.get(game_id_key):  # Giocatore 2 trova il game_id
-            game_id = cache.get(game_id_key)["game_id"]
-            player_1_username = cache.get(game_id_key).get("username")
-            try:
-                player_1 = PongUser.objects.get(username=player_1_username)
-                player_2 = request.user
-                match_data = {
-                    "player_1": player_1.id,
-                    "player_2": player_2.id,
-                    "status": "created"
-                }
-                serializer = MatchCreateSerializer(data=match_data)
-                serializer.is_valid(raise_exception=True)
-                match = serializer.save()
-                
-                cache.set(f"match_id_for_game_{game_id}", match.id, timeout=3600)
-                cache.delete(game_id_key)
-
-                with get_condition(password):
-                    get_condition(password).notify()
-                return Response({"game_id": game_id}, status=200)
-            except PongUser.DoesNotExist:
-                return Response({"detail": "Player 1 not found"}, status=404)
-
-        # Giocatore 1 crea una condizione e aspetta
-        condition = get_condition(password)
-        with condition:
-            game_id = str(uuid.uuid4())
-            cache.set(game_id_key, {"game_id": game_id, "username": username})
-            condition.wait(timeout=60)
-        if not cache.get(game_id_key):
+        # Giocatore 1 aspetta l'avversario
+        result = rendezvous.wait(name, game_id, self.MAX_WAIT)
+        if result == "ready":
             return Response({"game_id": game_id}, status=200)
-        
-        cache.delete(game_id_key)
+        if result in ("waiting", "pending"):
+            return Response({"detail": "Waiting for opponent", "game_id": game_id}, status=202)
         return Response({"detail": "Game not found"}, status=404)
 
+    def delete(self, request):
+        password = request.data.get("password") or request.query_params.get("password")
+        game_id = request.data.get("game_id") or request.query_params.get("game_id")
+        if not password or not game_id:
+            return Response({"detail": "Password and game_id are required"}, status=400)
+
+        if not rendezvous.abandon(f"private_{password}", game_id):
+            # L'avversario ha già preso lo slot (o è scaduto): niente da annullare
+            return Response({"detail": "Private match no longer waiting"}, status=409)
+        return Response({"detail": "Private match cancelled"}, status=200)
+
+    def create_match(self, game_id, player_1_username, player_2):
+        try:
+            player_1 = PongUser.objects.get(username=player_1_username)
+            match_data = {
+                "player_1": player_1.id,
+                "player_2": player_2.id,
+                "status": "created"
+            }
+            serializer = MatchCreateSerializer(data=match_data)
+            serializer.is_valid(raise_exception=True)
+            match = serializer.save()
+        except PongUser.DoesNotExist:
+            rendezvous.complete(game_id, ok=False)
+            return Response({"detail": "Player 1 not found"}, status=404)
+        except Exception:
+            rendezvous.complete(game_id, ok=False)
+            raise
+
+        cache_match(game_id, match)
+        rendezvous.complete(game_id)
+        return Response({"game_id": game_id}, status=200)
+
 class TournamentListCreateView(ListCreateAPIView):
     """
     POST /match/tournament/
@@ -202,6 +209,10 @@ class TournamentView(GenericAPIView):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = TournamentDetailSerializer
+    MAX_WAIT = 5  # secondi massimi di attesa di una richiesta: il thread del worker non resta occupato
+    WALKOVER_AFTER = 60  # secondi di attesa dell'avversario prima della vittoria a tavolino
+    # Lo slot scade se chi attende smette di ripetere la richiesta
+    SLOT_TTL = MAX_WAIT + 10
 
     def put(self, request, pk, *args, **kwargs):
         """
@@ -305,7 +316,10 @@ class TournamentView(GenericAPIView):
     
     def post(self, request, pk, *args, **kwargs):
         """
-        Creazione di un nuovo match nel torneo e response di game_id
+        Creazione di un nuovo match nel torneo e response di game_id.
+        Il primo giocatore del match riceve 202 con il proprio game_id finché l'avversario
+        non arriva e ripete la richiesta passando `game_id`; dopo WALKOVER_AFTER secondi
+        di attesa vince a tavolino.
         """
         user = request.user
         tournament = self.get_object()
@@ -319,55 +333,69 @@ class TournamentView(GenericAPIView):
             return Response({"detail": "You have lost in this tournament"}, status=status.HTTP_403_FORBIDDEN)
         m_num = slot // 2
         print(f"Creating match for user {user.username} in slot {slot} (match number {m_num})")
-        wait_key = f"wait_{tournament.id}_{m_num}"
-        cond = get_condition(wait_key)
+        wait_key = f"tournament_{tournament.id}_{m_num}"
 
         # Determina la posizione di questo giocatore nel match
         user_position = get_player_position_in_match(tournament, m_num, user)
         if user_position is None:
             return Response({"detail": "You don't belong to this match"}, status=status.HTTP_400_BAD_REQUEST)
 
-        cached = cache.get(wait_key)
+        # Chi attende ripete la richiesta con il proprio game_id: se lo slot è ancora suo
+        # (o l'avversario è già arrivato) si continua su quello invece di occuparne un altro
+        game_id = request.data.get("game_id")
+        if game_id and rendezvous.status(wait_key, game_id) is not None:
+            outcome = "waiting"
+            rendezvous.refresh(wait_key, game_id, ttl=self.SLOT_TTL)
+        else:
+            outcome, game_id, opponent_username = rendezvous.claim(wait_key, user.username, ttl=self.SLOT_TTL)
 
         # Giocatore 2 trova il match
-        if cached:
-            if cached["username"] == user.username:
-                return Response(
-                    {"detail": "still waiting for opponent"},
-                    status=status.HTTP_202_ACCEPTED
+        if outcome == "joined":
+            try:
+                opponent = PongUser.objects.get(username=opponent_username)
+
+                # Determina chi è player_1 e chi è player_2
+                if user_position == 1:
+                    player_1, player_2 = user, opponent
+                else:  # user_position == 2
+                    player_1, player_2 = opponent, user
+
+                match = Match.objects.create(
+                    player_1=player_1,
+                    player_2=player_2,
+                    status="created",
+                    match_number=m_num,
+                    tournament=tournament
                 )
-            
-            game_id = cached["game_id"]
-            opponent_username = cached["username"]
-            opponent = PongUser.objects.get(username=opponent_username)
-        
-            # Determina chi è player_1 e chi è player_2
-            if user_position == 1:
-                player_1, player_2 = user, opponent
-            else:  # user_position == 2
-                player_1, player_2 = opponent, user
-        
-            match = Match.objects.create(
-                player_1=player_1,
-                player_2=player_2,
-                status="created",
-                match_number=m_num,
-                tournament=tournament
-            )
-            cache.set(f"match_id_for_game_{game_id}", match.id, timeout=3600)
-            cache.delete(wait_key)
-            with cond:
-                cond.notify()
+            except Exception:
+                rendezvous.complete(game_id, ok=False)
+                raise
+            cache_match(game_id, match)
+            rendezvous.complete(game_id)
             return Response({"game_id": game_id}, status=status.HTTP_200_OK)
         
-        # Giocatore 1 crea una condizione e aspetta
-        game_id = str(uuid.uuid4())
-        cache.set(wait_key, {"game_id": game_id, "username": user.username}, timeout=100)
-        with cond:
-            cond.wait(timeout=60)
-        if not cache.get(wait_key):
+        # Giocatore 1 aspetta l'avversario (anche se arriva su un'altra replica) per al più
+        # MAX_WAIT secondi per richiesta; il walkover scatta dopo WALKOVER_AFTER secondi in totale
+        result = rendezvous.wait(wait_key, game_id, self.MAX_WAIT)
+        if result == "waiting":
+            waited = rendezvous.waited(wait_key, game_id)
+            if waited is not None and waited < self.WALKOVER_AFTER:
+                return Response(
+                    {"detail": "still waiting for opponent", "game_id": game_id},
+                    status=status.HTTP_202_ACCEPTED
+                )
+            if not rendezvous.abandon(wait_key, game_id):
+                result = "pending"  # l'avversario è arrivato proprio allo scadere dell'attesa
+        if result in ("ready", "pending"):
+            # Il match è creato (o in creazione) dall'avversario con questo game_id
             return Response({"game_id": game_id}, status=status.HTTP_200_OK)
-        cache.delete(wait_key)
+        if result == "failed":
+            # L'avversario è arrivato ma non è riuscito a creare il match: niente walkover,
+            # lo slot è già libero e la prossima richiesta lo riapre
+            return Response(
+                {"detail": "Match creation failed, please retry"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         # Giocatore vince il match a tavolino - trova l'avversario
         opponent = get_opponent_for_player(tournament, user)
         match = Match.objects.create(
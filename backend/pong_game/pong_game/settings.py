@@ -181,9 +181,11 @@ SIMPLE_JWT = {
 
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        # Redis + consegna in memoria ai membri dei gruppi che vivono in questo processo
+        "BACKEND": "pong_game_ws.channel_layer.HybridChannelLayer",
         "CONFIG": {
             "hosts": [os.getenv('REDIS_URL')],
+            "membership_ttl": 1.0,
         },
     },
 }
@@ -194,3 +196,31 @@ CACHES = {
         "LOCATION": env('REDIS_URL'),
     }
 }
+
+# Game loop: frequenza di simulazione e budget di recupero del TickScheduler
+PONG_TICK_RATE = env.int('PONG_TICK_RATE', default=60)
+PONG_MAX_CATCHUP_TICKS = env.int('PONG_MAX_CATCHUP_TICKS', default=5)
+PONG_MAX_TICK_LAG = env.float('PONG_MAX_TICK_LAG', default=0.25)
+# Tick falliti consecutivi dopo cui una partita viene fermata
+PONG_MAX_TICK_FAILURES = env.int('PONG_MAX_TICK_FAILURES', default=3)
+
+# Frequenza di invio dei frame ai client, adattata tra min e max (pong_game_ws.send_rate)
+PONG_SEND_RATE_MIN = env.int('PONG_SEND_RATE_MIN', default=20)
+PONG_SEND_RATE_MAX = env.int('PONG_SEND_RATE_MAX', default=60)
+PONG_PING_INTERVAL = env.float('PONG_PING_INTERVAL', default=2.0)
+
+# Spettatori: frequenza dei frame e numero massimo di spettatori per processo (pong_game_ws.spectators)
+PONG_SPECTATOR_SEND_RATE = env.int('PONG_SPECTATOR_SEND_RATE', default=20)
+PONG_MAX_SPECTATORS_PER_WORKER = env.int('PONG_MAX_SPECTATORS_PER_WORKER', default=500)
+
+# Scrittura differita dei risultati dei match (pong_game_ws.results)
+PONG_RESULT_FLUSH_INTERVAL = env.float('PONG_RESULT_FLUSH_INTERVAL', default=0.2)
+PONG_RESULT_BATCH_SIZE = env.int('PONG_RESULT_BATCH_SIZE', default=100)
+
+# Cache locale dei JWT già validati dai WebSocket (pong_game_ws.auth_cache)
+PONG_JWT_CACHE_SIZE = env.int('PONG_JWT_CACHE_SIZE', default=1024)
+PONG_JWT_CACHE_TTL = env.int('PONG_JWT_CACHE_TTL', default=300)
+
+# Registrazione di seed e input delle partite per il replay (pong_game_ws.replay)
+PONG_REPLAY_ENABLED = env.bool('PONG_REPLAY_ENABLED', default=True)
+PONG_REPLAY_TTL = env.int('PONG_REPLAY_TTL', default=7 * 24 * 3600)
@@ -0,0 +1,86 @@
+import collections
+import hashlib
+import time
+
+import jwt
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import PongUser
+
+
+class TokenCache:
+    """
+    Cache LRU in memoria dei token JWT già validati, indicizzata per `jti`.
+
+    Ogni voce contiene i claim del token e una copia minima dell'utente; scade alla
+    `exp` del token o dopo `ttl` secondi (i trofei mostrati non restano vecchi a lungo).
+    Il token ricevuto deve coincidere byte per byte con quello validato: un token con
+    lo stesso `jti` ma firma diversa non trova nulla e passa dalla validazione completa.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()  # jti -> (scadenza, digest, claims, user)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    @staticmethod
+    def token_id(token):
+        """
+        Legge il `jti` senza verificare la firma: serve solo come chiave di ricerca.
+        """
+        try:
+            claims = jwt.decode(token, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            return None
+        return claims.get(api_settings.JTI_CLAIM)
+
+    def get(self, token):
+        """
+        Restituisce (claims, user) se il token è in cache e ancora valido, altrimenti None.
+        """
+        jti = self.token_id(token)
+        entry = self.entries.get(jti) if jti else None
+        if entry is None or entry[1] != self.digest(token):
+            self.stats["misses"] += 1
+            return None
+        if entry[0] <= time.time():
+            del self.entries[jti]
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(jti)
+        self.stats["hits"] += 1
+        return entry[2], entry[3]
+
+    def put(self, token, claims, user):
+        jti = claims.get(api_settings.JTI_CLAIM)
+        if not jti:
+            return
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, claims["exp"])
+        snapshot = PongUser(
+            id=user.id,
+            username=user.username,
+            trophies=user.trophies,
+            profile_image=user.profile_image,
+        )
+        self.entries[jti] = (expires_at, self.digest(token), dict(claims), snapshot)
+        self.entries.move_to_end(jti)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def snapshot(self):
+        return {"size": len(self.entries), **self.stats}
+
+
+token_cache = TokenCache(
+    max_size=settings.PONG_JWT_CACHE_SIZE,
+    ttl=settings.PONG_JWT_CACHE_TTL,
+)
@@ -0,0 +1,316 @@
+import math
+import random
+
+import numpy as np
+
+from .pong import PongGame
+
+
+class BatchPongEngine:
+    """
+    Motore fisico alternativo a PongGame che simula tutte le partite attive con un'unica
+    chiamata vettorizzata.
+
+    Lo stato è memorizzato come struct-of-arrays: un array NumPy per ogni campo
+    (posizione e velocità della palla, y dei paddle, punteggi) e uno slot per partita.
+    `step()` riproduce esattamente la fisica di PongGame.update_game_state
+    (collisioni continue con muri e paddle, limite di velocità, punteggio).
+    """
+    GAME_WIDTH = PongGame.GAME_WIDTH
+    GAME_HEIGHT = PongGame.GAME_HEIGHT
+    PADDLE_HEIGHT = PongGame.PADDLE_HEIGHT
+    PADDLE_WIDTH = PongGame.PADDLE_WIDTH
+    BALL_RADIUS = PongGame.BALL_RADIUS
+    WINNING_SCORE = PongGame.WINNING_SCORE
+    MAX_SPEED = PongGame.MAX_SPEED
+    SPEED_INCREASE_FACTOR = PongGame.SPEED_INCREASE_FACTOR
+    INITIAL_SPEED = PongGame.INITIAL_SPEED
+    PADDLE_SPEED = PongGame.PADDLE_SPEED
+    MAX_COLLISIONS_PER_TICK = PongGame.MAX_COLLISIONS_PER_TICK
+    HOLD_TICKS = PongGame.HOLD_TICKS
+
+    def __init__(self, capacity=64):
+        self.slots = {}  # game_id -> indice negli array
+        self.free_slots = []
+        self.game_ids = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """
+        Alloca (o ingrandisce) gli array mantenendo i dati delle partite esistenti.
+        """
+        old_capacity = len(self.game_ids)
+        fields = {
+            "x": np.float64, "y": np.float64, "dx": np.float64, "dy": np.float64,
+            "left_y": np.float64, "right_y": np.float64,
+            "left_score": np.int32, "right_score": np.int32,
+            "left_input": np.int8, "right_input": np.int8,  # -1 su, +1 giù, 2 stop, 0 nessun input
+            "left_held": np.int8, "right_held": np.int8,  # direzione tenuta: -1 su, +1 giù, 0 ferma
+            "left_hold": np.int16, "right_hold": np.int16,  # tick di validità residui della direzione tenuta
+            "active": np.bool_, "game_over": np.bool_,
+        }
+        for name, dtype in fields.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if old_capacity:
+                array[:old_capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self.game_ids.extend([None] * (capacity - old_capacity))
+        self.free_slots.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, game_id):
+        return game_id in self.slots
+
+    def add(self, game_id, state=None):
+        """
+        Aggiunge una partita all'engine. `state` ha la stessa forma di PongGame.snapshot();
+        se assente la palla parte dal centro in una direzione casuale.
+        """
+        if game_id in self.slots:
+            raise ValueError(f"Game {game_id} already in engine")
+        if not self.free_slots:
+            self._allocate(len(self.game_ids) * 2)
+
+        slot = self.free_slots.pop()
+        self.slots[game_id] = slot
+        self.game_ids[slot] = game_id
+
+        if state is None:
+            paddle_y = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
+            state = {
+                "ball": {
+                    "x": self.GAME_WIDTH // 2,
+                    "y": self.GAME_HEIGHT // 2,
+                    "dx": self.INITIAL_SPEED * random.choice([-1, 1]),
+                    "dy": 0,
+                },
+                "left_paddle": {"y": paddle_y},
+                "right_paddle": {"y": paddle_y},
+                "left_score": 0,
+                "right_score": 0,
+            }
+        self.x[slot] = state["ball"]["x"]
+        self.y[slot] = state["ball"]["y"]
+        self.dx[slot] = state["ball"]["dx"]
+        self.dy[slot] = state["ball"]["dy"]
+        self.left_y[slot] = state["left_paddle"]["y"]
+        self.right_y[slot] = state["right_paddle"]["y"]
+        self.left_score[slot] = state["left_score"]
+        self.right_score[slot] = state["right_score"]
+        self.game_over[slot] = (state["left_score"] >= self.WINNING_SCORE
+                                or state["right_score"] >= self.WINNING_SCORE)
+        self.active[slot] = True
+        return slot
+
+    def remove(self, game_id):
+        slot = self.slots.pop(game_id)
+        self.active[slot] = False
+        self.game_over[slot] = False
+        self.left_input[slot] = self.right_input[slot] = 0
+        self.left_held[slot] = self.right_held[slot] = 0
+        self.left_hold[slot] = self.right_hold[slot] = 0
+        self.game_ids[slot] = None
+        self.free_slots.append(slot)
+
+    def state(self, game_id):
+        """
+        Restituisce lo stato della partita nella stessa forma di PongGame.snapshot().
+        """
+        slot = self.slots[game_id]
+        return {
+            "ball": {
+                "x": float(self.x[slot]),
+                "y": float(self.y[slot]),
+                "dx": float(self.dx[slot]),
+                "dy": float(self.dy[slot]),
+            },
+            "left_paddle": {"y": float(self.left_y[slot])},
+            "right_paddle": {"y": float(self.right_y[slot])},
+            "left_score": int(self.left_score[slot]),
+            "right_score": int(self.right_score[slot]),
+        }
+
+    def is_game_over(self, game_id):
+        return bool(self.game_over[self.slots[game_id]])
+
+    def apply_input(self, game_id, side, direction):
+        """
+        Registra un input come PongGame.process_input: viene applicato al prossimo step,
+        vince la direzione più recente ("stop" rilascia la direzione tenuta).
+        """
+        slot = self.slots[game_id]
+        inputs = self.left_input if side == "left" else self.right_input
+        if direction == "up":
+            inputs[slot] = -1
+        elif direction == "down":
+            inputs[slot] = 1
+        elif direction == "stop":
+            inputs[slot] = 2
+
+    def _apply_inputs(self, live):
+        """
+        Versione vettorizzata di PongGame.apply_inputs: l'ultimo input diventa la direzione
+        tenuta, che muove il paddle ad ogni tick per al più HOLD_TICKS tick.
+        """
+        bottom = self.GAME_HEIGHT - self.PADDLE_HEIGHT
+        sides = (
+            (self.left_y, self.left_input, self.left_held, self.left_hold),
+            (self.right_y, self.right_input, self.right_held, self.right_hold),
+        )
+        for paddles, inputs, held, hold in sides:
+            stop = live & (inputs == 2)
+            move = live & (inputs != 0) & ~stop
+            held[move] = inputs[move]
+            hold[move] = self.HOLD_TICKS
+            held[stop] = 0
+            hold[stop] = 0
+
+            holding = live & (hold > 0)
+            up = holding & (held < 0) & (paddles > 0)
+            down = holding & (held > 0) & (paddles < bottom)
+            paddles[up] = np.maximum(0, paddles[up] - self.PADDLE_SPEED)
+            paddles[down] = np.minimum(bottom, paddles[down] + self.PADDLE_SPEED)
+            hold[holding] -= 1
+            held[holding & (hold == 0)] = 0
+            inputs[:] = 0
+
+    def step(self):
+        """
+        Avanza di un tick tutte le partite attive e non finite.
+        Restituisce la lista dei game_id che sono terminati in questo tick.
+        """
+        live = self.active & ~self.game_over
+        if not live.any():
+            return []
+
+        self._apply_inputs(live)
+        self._move_ball(live)
+        self._handle_scoring(live)
+
+        finished = live & ((self.left_score >= self.WINNING_SCORE) | (self.right_score >= self.WINNING_SCORE))
+        self.game_over |= finished
+        return [self.game_ids[slot] for slot in np.flatnonzero(finished)]
+
+    def _move_ball(self, live):
+        """
+        Versione vettorizzata di PongGame.move_ball: ad ogni iterazione ogni partita avanza
+        fino al proprio primo urto (muro o paddle) o alla fine del frame; le partite
+        che hanno finito il frame vengono mascherate.
+        """
+        R = self.BALL_RADIUS
+        x, y, dx, dy = self.x, self.y, self.dx, self.dy
+        left_face = self.PADDLE_WIDTH + R
+        right_face = self.GAME_WIDTH - self.PADDLE_WIDTH - R
+        remaining = np.where(live, 1.0, 0.0)
+        pending = live.copy()
+
+        for _ in range(self.MAX_COLLISIONS_PER_TICK):
+            if not pending.any():
+                break
+            t = remaining.copy()
+            event = np.zeros(len(x), dtype=np.int8)  # 0 nessuno, 1 alto, 2 basso, 3 paddle sx, 4 paddle dx
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t_top = np.where(dy < 0, np.maximum(0.0, (R - y) / dy), np.inf)
+                top = pending & (t_top < t)
+                t[top], event[top] = t_top[top], 1
+
+                t_bottom = np.where(dy > 0, np.maximum(0.0, (self.GAME_HEIGHT - R - y) / dy), np.inf)
+                bottom = pending & (t_bottom < t)
+                t[bottom], event[bottom] = t_bottom[bottom], 2
+
+                t_left = np.where((dx < 0) & (x >= left_face), (left_face - x) / dx, np.inf)
+                y_left = y + dy * t_left
+                left = (pending & (t_left <= t)
+                        & (y_left + R >= self.left_y) & (y_left - R <= self.left_y + self.PADDLE_HEIGHT))
+                t[left], event[left] = t_left[left], 3
+
+                t_right = np.where((dx > 0) & (x <= right_face), (right_face - x) / dx, np.inf)
+                y_right = y + dy * t_right
+                right = (pending & (t_right <= t)
+                         & (y_right + R >= self.right_y) & (y_right - R <= self.right_y + self.PADDLE_HEIGHT))
+                t[right], event[right] = t_right[right], 4
+
+            np.add(x, dx * t, out=x, where=pending)
+            np.add(y, dy * t, out=y, where=pending)
+            np.subtract(remaining, t, out=remaining, where=pending)
+
+            top = pending & (event == 1)
+            y[top] = R
+            dy[top] = np.abs(dy[top])
+            bottom = pending & (event == 2)
+            y[bottom] = self.GAME_HEIGHT - R
+            dy[bottom] = -np.abs(dy[bottom])
+
+            left_hit = pending & (event == 3)
+            right_hit = pending & (event == 4)
+            x[left_hit] = left_face
+            x[right_hit] = right_face
+            self._paddle_bounce(left_hit, right_hit)
+            self._limit_ball_speed(left_hit | right_hit)
+
+            pending &= event != 0
+
+        # Limite di urti raggiunto (come PongGame.move_ball): il resto del frame senza urti,
+        # dentro le pareti e, se la palla era in campo, davanti ai paddle
+        if pending.any():
+            in_field = pending & (x >= left_face) & (x <= right_face)
+            x[pending] += dx[pending] * remaining[pending]
+            y[pending] = np.minimum(np.maximum(y[pending] + dy[pending] * remaining[pending], R),
+                                    self.GAME_HEIGHT - R)
+            x[in_field] = np.minimum(np.maximum(x[in_field], left_face), right_face)
+
+    def _paddle_bounce(self, left_hit, right_hit):
+        """
+        Stesso calcolo dell'angolo di PongGame.handle_sophisticated_paddle_bounce.
+        """
+        hit = left_hit | right_hit
+        if not hit.any():
+            return
+        y, dx, dy = self.y, self.dx, self.dy
+
+        paddle_y = np.where(left_hit, self.left_y, self.right_y)[hit]
+        half_paddle = self.PADDLE_HEIGHT / 2
+        relative_intersect = y[hit] - (paddle_y + half_paddle)
+        normalized_intersect = np.maximum(np.minimum(relative_intersect / half_paddle, 0.7), -0.7)
+        bounce_angle = normalized_intersect * (math.pi / 6)
+
+        speed = np.sqrt(dx[hit]**2 + dy[hit]**2) * self.SPEED_INCREASE_FACTOR
+        new_dx = speed * np.cos(bounce_angle)
+        new_dy = speed * np.sin(bounce_angle)
+        new_dx = np.where(left_hit[hit], new_dx, -new_dx)
+        new_dy = np.where(np.abs(new_dy) < 1.0, np.where(new_dy >= 0, 1.0, -1.0), new_dy)
+
+        dx[hit] = new_dx
+        dy[hit] = new_dy
+
+    def _limit_ball_speed(self, moving):
+        dx, dy = self.dx, self.dy
+        speed = np.sqrt(dx**2 + dy**2)
+        too_fast = moving & (speed > self.MAX_SPEED)
+        if too_fast.any():
+            factor = self.MAX_SPEED / speed[too_fast]
+            dx[too_fast] *= factor
+            dy[too_fast] *= factor
+
+    def _handle_scoring(self, live):
+        R = self.BALL_RADIUS
+        left_miss = live & (self.x < -R)
+        right_miss = live & ~left_miss & (self.x > self.GAME_WIDTH + R)
+        scored = left_miss | right_miss
+        if not scored.any():
+            return
+
+        self.right_score[left_miss] += 1
+        self.left_score[right_miss] += 1
+
+        # Come PongGame.reset_ball + reset_paddles: la palla va verso chi ha perso il punto
+        self.x[scored] = self.GAME_WIDTH // 2
+        self.y[scored] = self.GAME_HEIGHT // 2
+        self.dx[left_miss] = -self.INITIAL_SPEED
+        self.dx[right_miss] = self.INITIAL_SPEED
+        self.dy[scored] = 0
+        self.left_y[scored] = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
+        self.right_y[scored] = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+
+from .pong import PongGame
+
+BENCHMARK_VERSION = 2
+
+
+class BotPaddle:
+    """
+    Giocatore scriptato: ad ogni scambio mira a un punto della palla spostato di un errore
+    casuale, così una parte dei tiri viene mancata e le partite arrivano a fine.
+    """
+
+    def __init__(self, side, rng, deadzone=8, max_error=60):
+        self.side = side
+        self.rng = rng
+        self.deadzone = deadzone
+        self.max_error = max_error
+        self.aim = 0
+        self.tracking = False
+        self.moving = False
+
+    def direction(self, state):
+        ball = state.ball
+        approaching = (ball.dx < 0) == (self.side == "left")
+        if approaching and not self.tracking:
+            self.aim = self.rng.uniform(-self.max_error, self.max_error)
+        self.tracking = approaching
+
+        paddle = state.left_paddle if self.side == "left" else state.right_paddle
+        offset = ball.y + self.aim - (paddle.y + PongGame.PADDLE_HEIGHT / 2)
+        if abs(offset) <= self.deadzone:
+            # Come il client al rilascio del tasto: un solo "stop", poi nessun messaggio
+            if not self.moving:
+                return None
+            self.moving = False
+            return "stop"
+        self.moving = True
+        return "down" if offset > 0 else "up"
+
+
+class SimulatedMatch:
+    def __init__(self, index, rng):
+        self.index = index
+        self.rng = rng
+        self.games_played = 0
+        self.new_game()
+
+    def new_game(self):
+        self.game = PongGame(f"bench-{self.index}-{self.games_played}", seed=self.rng.getrandbits(32))
+        self.game.game_loop_running = True
+        self.bots = [BotPaddle(side, self.rng) for side in ("left", "right")]
+        self.games_played += 1
+
+    async def tick(self):
+        game = self.game
+        for bot in self.bots:
+            direction = bot.direction(game.game_state)
+            if direction:
+                await game.process_input(bot.side, {"action": "move", "direction": direction})
+        await game.update_game_state()
+        if game.game_over:
+            self.new_game()
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def measure_latency(matches, ticks):
+    """
+    Durata di ogni singolo tick di partita (input dei bot + update_game_state), in nanosecondi.
+    """
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(ticks):
+        for match in matches:
+            start = clock()
+            await match.tick()
+            samples.append(clock() - start)
+    return samples
+
+
+def calibration_loop(iterations=2000):
+    """
+    Carico fisso in Python puro (una palla che rimbalza in un rettangolo), simile per tipo
+    di lavoro a un tick di partita: serve da unità di misura della macchina.
+    """
+    x, y, dx, dy = 0.0, 0.0, 1.5, 0.7
+    for _ in range(iterations):
+        x += dx
+        y += dy
+        if y < 0 or y > 400:
+            dy = -dy
+        if x < 0 or x > 800:
+            dx = -dx
+    return x + y
+
+
+def measure_calibration(repeats=50):
+    """
+    Durata del calibration_loop in nanosecondi (minimo su `repeats` esecuzioni, la stima
+    più stabile per un carico fisso).
+    """
+    clock = time.perf_counter_ns
+    best = None
+    for _ in range(repeats):
+        start = clock()
+        calibration_loop()
+        elapsed = clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def measure_allocations(matches, ticks):
+    """
+    Byte allocati (picco tracemalloc) per tick di partita. Eseguito a parte perché
+    tracemalloc rallenta molto la simulazione.
+    """
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(ticks):
+            for match in matches:
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                await match.tick()
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        return peaks
+    finally:
+        tracemalloc.stop()
+
+
+def measure_match_memory(count):
+    """
+    Memoria occupata da un'istanza di PongGame appena creata, in byte.
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        games = [PongGame(f"mem-{i}", seed=i) for i in range(count)]
+        after, _ = tracemalloc.get_traced_memory()
+        del games
+        return (after - before) / count
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(matches=100, ticks=3600, alloc_ticks=60, seed=0):
+    """
+    Esegue `matches` partite simulate per `ticks` tick con bot scriptati e restituisce le metriche.
+    Con lo stesso seed la sequenza di stati e input è identica tra un'esecuzione e l'altra.
+    """
+    rng = random.Random(seed)
+    pool = [SimulatedMatch(i, random.Random(rng.getrandbits(32))) for i in range(matches)]
+
+    async def run():
+        latency = await measure_latency(pool, ticks)
+        allocations = await measure_allocations(pool, alloc_ticks)
+        return latency, allocations
+
+    # Calibrazione prima e dopo la misura, nello stesso processo: i tempi relativi non
+    # dipendono dalla macchina (né da quanto è carica) su cui gira il benchmark
+    calibration = measure_calibration()
+    latency, allocations = asyncio.run(run())
+    calibration = min(calibration, measure_calibration())
+    latency.sort()
+    total_seconds = sum(latency) / 1e9
+    p50, p99 = percentile(latency, 0.50), percentile(latency, 0.99)
+    return {
+        "version": BENCHMARK_VERSION,
+        "config": {"matches": matches, "ticks": ticks, "alloc_ticks": alloc_ticks, "seed": seed},
+        "python": platform.python_version(),
+        "ticks_per_second": len(latency) / total_seconds,
+        "tick_p50_us": p50 / 1000,
+        "tick_p99_us": p99 / 1000,
+        "calibration_us": calibration / 1000,
+        "tick_mean_rel": sum(latency) / len(latency) / calibration,
+        "tick_p50_rel": p50 / calibration,
+        "tick_p99_rel": p99 / calibration,
+        "alloc_bytes_per_tick": statistics.fmean(allocations),
+        "memory_per_match_bytes": measure_match_memory(matches),
+        "games_finished": sum(match.games_played - 1 for match in pool),
+    }
+
+
+# Metriche confrontate con la baseline: (nome, True se più alto è meglio). I tempi sono
+# confrontati solo come rapporto con la calibrazione (*_rel), quelli assoluti variano con la macchina
+COMPARED_METRICS = (
+    ("tick_mean_rel", False),
+    ("tick_p50_rel", False),
+    ("tick_p99_rel", False),
+    ("alloc_bytes_per_tick", False),
+    ("memory_per_match_bytes", False),
+)
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """
+    Restituisce le metriche peggiorate oltre `tolerance` (frazione) rispetto alla baseline.
+    """
+    regressions = []
+    for name, higher_is_better in COMPARED_METRICS:
+        old, new = baseline.get(name), result[name]
+        if not old:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Campi salvati nella baseline: niente tempi assoluti, che non sono confrontabili tra macchine
+BASELINE_FIELDS = ("version", "config", "games_finished") + tuple(name for name, _ in COMPARED_METRICS)
+
+
+def save_baseline(path, result):
+    with open(path, "w") as f:
+        json.dump({name: result[name] for name in BASELINE_FIELDS}, f, indent=2, sort_keys=True)
+        f.write("\n")
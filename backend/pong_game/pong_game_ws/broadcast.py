@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+
+from channels_redis.core import RedisChannelLayer
+
+from .protocol import encode_binary, flatten_state, keyframe_message
+
+# Formati di serializzazione dei frame di stato
+WIRE_JSON = "json"      # protocollo v1: stato completo ad ogni frame
+WIRE_DELTA = "delta"    # protocollo v2: keyframe + delta
+WIRE_BINARY = "binary"  # frame binario a layout fisso
+WIRE_KEYFRAME = "keyframe"  # protocollo v2: stato completo, per i client delta che hanno perso frame
+
+# Contatori globali del processo (esposti da GameStatsView)
+broadcast_stats = {
+    "frames": 0,
+    "encodings": 0,
+    "local_deliveries": 0,
+    "remote_deliveries": 0,
+}
+
+
+class EncodedFrame:
+    """
+    Frame di stato di un tick. Ogni formato viene serializzato al più una volta,
+    solo se almeno un client lo richiede. Tra processi viaggia il solo stato
+    (`wire_message`): chi lo riceve serializza solo i formati dei propri client.
+    """
+
+    def __init__(self, state, frame):
+        self.state = state
+        self.frame = frame
+        self.encoded = {}
+
+    def encode(self, wire_format):
+        if wire_format not in self.encoded:
+            broadcast_stats["encodings"] += 1
+            frame = self.frame
+            if wire_format == WIRE_BINARY:
+                self.encoded[wire_format] = encode_binary(
+                    self.state, frame["seq"], frame.get("t", 0), frame.get("ack", (0, 0)))
+            elif wire_format == WIRE_DELTA:
+                self.encoded[wire_format] = json.dumps(frame)
+            elif wire_format == WIRE_KEYFRAME:
+                meta = {key: frame[key] for key in ("t", "ack") if key in frame}
+                self.encoded[wire_format] = json.dumps(
+                    keyframe_message(frame["seq"], flatten_state(self.state), meta))
+            else:
+                message = {"type": "game_state", "state": self.state}
+                if "t" in frame:
+                    message["tick"] = frame["t"]
+                    message["ack"] = frame["ack"]
+                self.encoded[wire_format] = json.dumps(message)
+        return self.encoded[wire_format]
+
+    def wire_message(self):
+        return {"state": self.state, "frame": self.frame}
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message["state"], message["frame"])
+
+
+async def group_members(channel_layer, group):
+    """
+    Restituisce i channel name iscritti al gruppo, oppure None se il layer
+    non permette di leggerli (es. InMemoryChannelLayer, dove sono tutti locali).
+    """
+    if not isinstance(channel_layer, RedisChannelLayer):
+        return None
+    key = channel_layer._group_key(group)
+    connection = channel_layer.connection(channel_layer.consistent_hash(group))
+    return [member.decode("utf8") for member in await connection.zrange(key, 0, -1)]
+
+
+class FrameBroadcaster:
+    """
+    Trasmette i frame di una partita: codifica una sola volta per tick, consegna
+    diretta ai consumer dello stesso processo e channel layer solo per i consumer remoti.
+    """
+    MEMBERSHIP_REFRESH = 1.0  # secondi tra due letture dei membri del gruppo
+
+    def __init__(self, channel_layer, group):
+        self.channel_layer = channel_layer
+        self.group = group
+        self.remote_channels = []
+        self.refreshed_at = 0
+
+    async def refresh_membership(self, clients):
+        now = time.monotonic()
+        if now - self.refreshed_at < self.MEMBERSHIP_REFRESH:
+            return
+        self.refreshed_at = now
+        try:
+            if hasattr(self.channel_layer, "remote_group_channels"):
+                # HybridChannelLayer distingue già i membri locali da quelli remoti
+                members = await self.channel_layer.remote_group_channels(self.group)
+            else:
+                members = await group_members(self.channel_layer, self.group)
+        except Exception as e:
+            print(f"[ERROR] Cannot read members of {self.group}: {e}")
+            return
+        if members is None:
+            self.remote_channels = []
+            return
+        # I client della partita (anche quelli inoltrati da altri worker) ricevono già il frame direttamente
+        client_channels = {client.channel_name for client in clients}
+        self.remote_channels = [channel for channel in members if channel not in client_channels]
+
+    async def broadcast(self, clients, state, frame):
+        encoded = EncodedFrame(state, frame)
+        broadcast_stats["frames"] += 1
+
+        await self.refresh_membership(clients)
+        await asyncio.gather(*(client.send_frame(encoded) for client in clients))
+        broadcast_stats["local_deliveries"] += len(clients)
+
+        if self.remote_channels:
+            # I consumer remoti ricevono lo stato e lo serializzano nel proprio formato
+            message = {"type": "game_frame", **encoded.wire_message()}
+            results = await asyncio.gather(
+                *(self.channel_layer.send(channel, message) for channel in self.remote_channels),
+                return_exceptions=True,
+            )
+            for channel, result in zip(self.remote_channels, results):
+                if isinstance(result, Exception):
+                    print(f"[ERROR] Frame delivery to {channel} failed: {result}")
+            broadcast_stats["remote_deliveries"] += len(self.remote_channels)
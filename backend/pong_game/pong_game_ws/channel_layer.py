@@ -0,0 +1,145 @@
+import asyncio
+import collections
+import functools
+import time
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import BoundedQueue, RedisChannelLayer
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    """
+    Channel layer Redis con fast path in memoria per i membri locali dei gruppi.
+
+    I messaggi di gruppo destinati a consumer dello stesso processo vengono messi
+    in una coda in memoria per channel (`local_buffer`), senza passare da Redis; solo
+    i membri remoti (altri processi daphne) ricevono il messaggio tramite Redis.
+
+    `receive` attende insieme la coda locale e la ricezione Redis del channel. Non si
+    può usare il receive buffer di RedisChannelLayer: il consumer che detiene il receive
+    lock è fermo nel BZPOPMIN e non lo rilegge finché non arriva un messaggio da Redis.
+    La ricezione Redis resta in corso tra una chiamata e l'altra (non viene mai annullata
+    quando vince la coda locale), così nessun messaggio già estratto da Redis va perso.
+    L'appartenenza ai gruppi dei membri remoti viene letta da Redis al più una volta
+    ogni `membership_ttl` secondi (e riletta subito dopo un group_add/group_discard di un
+    channel remoto fatto da questo processo), quella locale è sempre esatta.
+    """
+
+    def __init__(self, *args, membership_ttl=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.membership_ttl = membership_ttl
+        self.local_groups = collections.defaultdict(set)  # gruppo -> channel locali
+        # channel locale -> messaggi consegnati in memoria (come receive_buffer, scarta i più vecchi se pieno)
+        self.local_buffer = collections.defaultdict(functools.partial(BoundedQueue, self.capacity))
+        self.remote_receives = {}  # channel locale -> task di RedisChannelLayer.receive in corso
+        self.membership_cache = {}  # gruppo -> (scadenza, channel remoti)
+        self.stats = {
+            "group_sends": 0,
+            "local_deliveries": 0,
+            "remote_deliveries": 0,
+            "remote_failures": 0,
+            "membership_refreshes": 0,
+        }
+
+    def is_local_channel(self, channel):
+        return "!" in channel and self.non_local_name(channel).endswith(self.client_prefix + "!")
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self.is_local_channel(channel):
+            self.local_groups[group].add(channel)
+        else:
+            # Un channel remoto aggiunto da qui (es. il relay di un altro processo) deve
+            # ricevere già il prossimo group_send, senza aspettare la scadenza della cache
+            self.membership_cache.pop(group, None)
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        if not self.is_local_channel(channel):
+            self.membership_cache.pop(group, None)
+        local = self.local_groups.get(group)
+        if local is not None:
+            local.discard(channel)
+            if not local:
+                del self.local_groups[group]
+
+    async def receive(self, channel):
+        if "!" not in channel:
+            return await super().receive(channel)
+
+        local = self.local_buffer[channel]
+        remote = self.remote_receives.get(channel)
+        if remote is None:
+            remote = self.remote_receives[channel] = asyncio.ensure_future(super().receive(channel))
+        if local.empty() and not remote.done():
+            getter = asyncio.ensure_future(local.get())
+            try:
+                await asyncio.wait((remote, getter), return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                # Il consumer si sta chiudendo: come RedisChannelLayer.receive, abbandona il channel
+                getter.cancel()
+                remote.cancel()
+                self.remote_receives.pop(channel, None)
+                self.local_buffer.pop(channel, None)
+                raise
+            if getter.done():
+                return getter.result()  # la ricezione Redis resta attiva per la prossima chiamata
+            getter.cancel()
+        if not local.empty():
+            return local.get_nowait()
+        del self.remote_receives[channel]
+        self.local_buffer.pop(channel, None)
+        return remote.result()
+
+    async def remote_group_channels(self, group):
+        """
+        Channel del gruppo che appartengono ad altri processi (con cache di `membership_ttl`).
+        """
+        now = time.monotonic()
+        cached = self.membership_cache.get(group)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        await connection.zremrangebyscore(key, min=0, max=int(time.time()) - self.group_expiry)
+        members = [member.decode("utf8") for member in await connection.zrange(key, 0, -1)]
+        remote = [channel for channel in members if not self.is_local_channel(channel)]
+
+        self.membership_cache[group] = (now + self.membership_ttl, remote)
+        self.stats["membership_refreshes"] += 1
+        return remote
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        self.stats["group_sends"] += 1
+
+        # Consegna in memoria ai consumer di questo processo
+        for channel in list(self.local_groups.get(group, ())):
+            self.local_buffer[channel].put_nowait(dict(message))
+            self.stats["local_deliveries"] += 1
+
+        # Redis solo per i membri che vivono in altri processi
+        remote = await self.remote_group_channels(group)
+        if not remote:
+            return
+        results = await asyncio.gather(
+            *(self.send(channel, message) for channel in remote),
+            return_exceptions=True,
+        )
+        for channel, result in zip(remote, results):
+            if isinstance(result, Exception):
+                # Come RedisChannelLayer.group_send: i channel pieni perdono il messaggio
+                self.stats["remote_failures"] += 1
+                if not isinstance(result, ChannelFull):
+                    print(f"[ERROR] Group message to {channel} failed: {result}")
+            else:
+                self.stats["remote_deliveries"] += 1
+
+    def snapshot(self):
+        delivered = self.stats["local_deliveries"] + self.stats["remote_deliveries"]
+        return {
+            **self.stats,
+            "local_ratio": self.stats["local_deliveries"] / delivered if delivered else None,
+            "local_groups": len(self.local_groups),
+        }
@@ -3,42 +3,131 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 import asyncio
 import json
+import time
+from urllib.parse import parse_qs
 from .pong import PongGame  # Assumendo che la classe PongGame sia in un file separato
+from .protocol import BINARY_ENCODING, PROTOCOL_VERSION
+from .broadcast import EncodedFrame, FrameBroadcaster, WIRE_BINARY, WIRE_DELTA, WIRE_JSON
+from .scheduler import tick_scheduler
+from .sharding import shard_router
+from .results import match_result_writer
+from .match_cache import get_match_descriptor, set_match_status
+from .auth_cache import token_cache
+from .replay import ReplayRecorder, replay_store
+from .send_rate import SendRateController
+from .mailbox import SendMailbox
+from .spectators import SpectatorBroadcaster, spectator_hub
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.core.cache import cache
-from .models import Match
+from django.conf import settings
 
 class GameConsumer(AsyncWebsocketConsumer):
     games = {}  # Dizionario condiviso per memorizzare le istanze del gioco per ogni `game_id`
+    MAX_MESSAGE_SIZE = 256  # byte, per i messaggi successivi all'autenticazione
 
-    async def connect(self):
+    def setup_connection(self):
+        """
+        Inizializza gli attributi della connessione a partire dallo scope.
+        """
         self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
         self.room_group_name = f"game_{self.game_id}"
         self.player_side = None  # Sarà assegnato come "left" o "right" dopo l'autenticazione
         self.user = None  # Utente autenticato
         self.game = None  # Istanza del gioco
+        self.relay_to = None  # Worker proprietario della partita, se non è questo processo
+        self.relay_heartbeat = None  # Task che segnala al proprietario che il socket inoltrato è vivo
+        # RTT misurato con ping/pong, in secondi (usato dal SendRateController)
+        self.rtt = None
+        self.ping_id = 0
+        self.ping_sent_at = None
+
+        # Versione del protocollo richiesta dal client (?proto=2), altrimenti stato completo ad ogni frame
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        # Connessione in sola lettura (?role=spectator): riceve i frame della partita, non invia input
+        self.spectator = query.get("role") == ["spectator"]
+        self.protocol = PROTOCOL_VERSION if query.get("proto") == [str(PROTOCOL_VERSION)] else 1
+        # Frame di stato binari (?encoding=binary); i messaggi di controllo restano JSON
+        self.binary = query.get("encoding") == [BINARY_ENCODING]
+        if self.binary:
+            self.wire_format = WIRE_BINARY
+        elif self.protocol == PROTOCOL_VERSION:
+            self.wire_format = WIRE_DELTA
+        else:
+            self.wire_format = WIRE_JSON
+        # Coda di invio: frame latest-wins, messaggi di controllo sempre consegnati e in ordine
+        self.mailbox = SendMailbox(self.send, self.wire_format)
+
+    @property
+    def send_time(self):
+        """
+        Tempo medio di invio di un frame su questa connessione, in secondi.
+        """
+        return self.mailbox.send_time
 
-        # Verifica se il match esiste e non è già finito
-        self.match_id = await self.get_match_id()
-        if self.match_id is None:
+    async def connect(self):
+        self.setup_connection()
+
+        # Verifica se il match esiste e non è già finito (una lettura dalla cache)
+        self.match = await self.get_match_descriptor()
+        if self.match is None:
             # Match non trovato nella cache
             await self.close(code=4004)  # Game not found
             return
+        self.match_id = self.match["match_id"]
 
         # Verifica lo stato del match
-        match_status = await self.get_match_status()
-        if match_status in ['finished', 'finished_walkover', 'aborted']:
+        if self.match["status"] in ['finished', 'finished_walkover', 'aborted']:
             # Match già finito
             await self.close(code=4005)  # Game already finished
             return
 
+        # Trova il worker che possiede la partita: se è un altro processo questo consumer fa solo da relay
+        try:
+            await shard_router.start(self.channel_layer, type(self))
+            # Gli spettatori ricevono i frame sul proprio worker, senza relay verso il proprietario
+            if not self.spectator:
+                owner = await shard_router.owner_of(self.game_id)
+                if not shard_router.is_local(owner):
+                    self.relay_to = owner
+        except Exception as e:
+            print(f"[ERROR] Shard lookup failed for game {self.game_id}, hosting locally: {e}")
+
         # Accetta la connessione WebSocket per ricevere il token
         await self.accept()
 
+        if self.relay_to:
+            await self.channel_layer.send(self.relay_to, {
+                "type": "relay.open",
+                "channel": self.channel_name,
+                "game_id": self.game_id,
+                "match": self.match,
+                "query_string": self.scope.get("query_string", b""),
+            })
+            self.relay_heartbeat = asyncio.create_task(self.send_relay_heartbeats())
+
+    async def send_relay_heartbeats(self):
+        """
+        Heartbeat verso il worker proprietario: senza, la sessione di relay scade (vedi RelaySession).
+        """
+        while True:
+            await asyncio.sleep(shard_router.RELAY_HEARTBEAT_INTERVAL)
+            try:
+                await self.channel_layer.send(self.relay_to, {"type": "relay.ping", "channel": self.channel_name})
+            except Exception as e:
+                print(f"[ERROR] Relay heartbeat to {self.relay_to} failed: {e}")
+
     async def receive(self, text_data):
         """
         Gestisce i messaggi ricevuti dal WebSocket.
         """
+        if self.relay_to:
+            # La partita vive su un altro worker: inoltra il messaggio così com'è
+            await self.channel_layer.send(self.relay_to, {
+                "type": "relay.receive",
+                "channel": self.channel_name,
+                "text": text_data,
+            })
+            return
+
         # Se l'utente non è autenticato, prova a autenticare con il primo messaggio
         if not self.user:
             token = text_data.strip()
@@ -49,54 +138,90 @@ class GameConsumer(AsyncWebsocketConsumer):
                 return
 
             # Aggiungi l'utente autenticato alla stanza
-            await self.join_game()
+            if self.spectator:
+                await self.join_as_spectator()
+            else:
+                await self.join_game()
+            return
+
+        # Elabora i dati inviati dal client (i messaggi di gioco sono piccoli: il resto viene scartato)
+        if len(text_data) > self.MAX_MESSAGE_SIZE:
             return
-        
-        # Elabora i dati inviati dal client
         try:
             input_data = json.loads(text_data)
         except json.JSONDecodeError:
             return
 
+        if self.spectator:
+            # Connessione in sola lettura: l'unica richiesta accettata è il resync.
+            # L'encoder degli spettatori vive sul worker proprietario: il prossimo frame parte come keyframe
+            if input_data.get("action") == "resync" and self.wire_format == WIRE_DELTA:
+                self.mailbox.keyframe_next = True
+            return
+
+        if input_data.get("action") == "pong":
+            self.handle_pong(input_data.get("id"))
+            return
+
+        if input_data.get("action") == "resync":
+            # Il client ha perso dei frame delta: rimanda lo stato completo
+            keyframe = self.game.encoder.keyframe() if self.protocol == PROTOCOL_VERSION else None
+            if keyframe:
+                await self.send_json(keyframe)
+            return
+
         await self.game.process_input(self.player_side, input_data)
 
     async def disconnect(self, close_code):
         """
         Gestisce la disconnessione del client.
         """
+        if getattr(self, "relay_to", None):
+            if self.relay_heartbeat:
+                self.relay_heartbeat.cancel()
+            await self.channel_layer.send(self.relay_to, {
+                "type": "relay.close",
+                "channel": self.channel_name,
+                "code": close_code,
+            })
+            return
+
+        if getattr(self, "spectator", False):
+            await spectator_hub.remove(self)
+            return
+
         # Rimuovi l'utente dalla stanza
         await self.leave_game()
 
     async def authenticate_user(self, token):
         """
         Autentica l'utente utilizzando il token JWT fornito.
+        I token già visti da questo processo non vengono rivalidati (vedi TokenCache).
         """
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached[1]
+
         jwt_auth = JWTAuthentication()
         try:
             validated_token = jwt_auth.get_validated_token(token)
             user = await database_sync_to_async(jwt_auth.get_user)(validated_token)
-            return user
         except AuthenticationFailed:
             return None
+        token_cache.put(token, validated_token.payload, user)
+        return user
 
     async def join_game(self):
         """
         Aggiunge l'utente autenticato alla stanza e assegna un lato del campo.
         """
-        # Verifica che l'utente possa giocare questa partita
-        can_play = await self.can_user_play_match()
-        if not can_play:
+        # Verifica che l'utente sia uno dei due giocatori del match
+        match_data = self.match
+        if self.user.id not in (match_data['player_1_id'], match_data['player_2_id']):
             await self.send_json({"error": "You are not authorized to play this match."})
             await self.close(code=4003)  # Unauthorized
             return
 
-        # Ottieni i dati del match per assegnare correttamente i lati
-        match_data = await self.get_match_data()
-        if not match_data:
-            await self.send_json({"error": "Match data not found."})
-            await self.close(code=4004)  # Match not found
-            return
-
         # Aggiungi l'utente al gruppo del canale
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -105,10 +230,22 @@ class GameConsumer(AsyncWebsocketConsumer):
 
         # Crea una nuova istanza del gioco se non esiste
         if self.game_id not in GameConsumer.games:
-            GameConsumer.games[self.game_id] = PongGame(self.game_id)
+            game = PongGame(self.game_id)
+            game.broadcaster = FrameBroadcaster(self.channel_layer, self.room_group_name)
+            game.send_rate = SendRateController(
+                settings.PONG_TICK_RATE,
+                settings.PONG_SEND_RATE_MIN,
+                settings.PONG_SEND_RATE_MAX,
+                ping_interval=settings.PONG_PING_INTERVAL,
+            )
+            game.spectators = SpectatorBroadcaster(
+                self.channel_layer, self.game_id, settings.PONG_TICK_RATE, settings.PONG_SPECTATOR_SEND_RATE)
+            if settings.PONG_REPLAY_ENABLED:
+                game.recorder = ReplayRecorder(replay_store, game, self.match_id)
+            GameConsumer.games[self.game_id] = game
         self.game = GameConsumer.games[self.game_id]
 
-        # Assegna i lati basandosi sui dati del match dal database
+        # Assegna i lati basandosi sul descrittore del match
         # player_1 -> left_player, player_2 -> right_player
         if self.user.id == match_data['player_1_id']:
             self.player_side = "left"
@@ -153,6 +290,29 @@ class GameConsumer(AsyncWebsocketConsumer):
             self.game.waiting_for_ready = True
             asyncio.create_task(self.wait_for_ready())
 
+    async def join_as_spectator(self):
+        """
+        Registra la connessione come spettatore della partita (entro il limite per processo).
+        """
+        if shard_router.worker_channel is None:
+            # Senza worker channel i frame degli spettatori non possono arrivare a questo processo
+            await self.send_json({"error": "Spectating is not available on this server."})
+            await self.close(code=4007)  # Spectating unavailable
+            return
+        if not await spectator_hub.add(self):
+            await self.send_json({"error": "Too many spectators on this server."})
+            await self.close(code=4006)  # Spectator limit reached
+            return
+        # Il primo frame ricevuto da un client delta deve essere completo
+        self.mailbox.keyframe_next = self.wire_format == WIRE_DELTA
+        match_data = self.match
+        await self.send_json({
+            "message": "Authentication successful. Spectating the game.",
+            "player_side": None,
+            "left_player": match_data["player_1_username"],
+            "right_player": match_data["player_2_username"],
+        })
+
     async def leave_game(self):
         """
         Rimuove l'utente dalla stanza e aggiorna lo stato del gioco.
@@ -171,6 +331,8 @@ class GameConsumer(AsyncWebsocketConsumer):
             if not game.clients:  # Se non ci sono più client, elimina l'istanza del gioco
                 await asyncio.sleep(5)  # Attendere 5 secondi prima di eliminare il gioco
                 del GameConsumer.games[self.game_id]
+                if game.recorder:
+                    game.recorder.finish(game)
 
     async def wait_for_ready(self):
         print(f"Waiting for players to be ready in game {self.game_id}")
@@ -183,111 +345,164 @@ class GameConsumer(AsyncWebsocketConsumer):
             }
         )
 
-        # loop per attendere readiness
+        # Attende i cambi di readiness senza polling, con un'unica scadenza per la partita
+        game = self.game
+        game.loop = asyncio.get_running_loop()
         timeout = 60
         already_sent_left = False
         already_sent_right = False
-        for _ in range(timeout * 10):  # ogni 100ms per 60s
-            # Controlla se entrambi i giocatori sono pronti e invia un messaggio al gruppo
-            if (self.game.ready["left"] and not already_sent_left) or (self.game.ready["right"] and not already_sent_right):
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "players_ready",
-                        "left_ready": self.game.ready["left"],
-                        "right_ready": self.game.ready["right"],
-                    }
-                )
-                already_sent_left = self.game.ready["left"]
-                already_sent_right = self.game.ready["right"]
-            if self.game.ready["left"] and self.game.ready["right"]:
-                outcome = "start"
-                break
-            await asyncio.sleep(0.1)
-            if not self.game.ready["left"] and not self.game.ready["right"]:
-                outcome = "aborted"
-            if self.game.ready["left"] or self.game.ready["right"]:
-                outcome = "finished_walkover"
-                self.game.winner = self.game.left_player if self.game.ready["left"] else self.game.right_player
-                self.game.loser = self.game.right_player if self.game.ready["left"] else self.game.left_player
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    # Invia lo stato di readiness al gruppo appena un giocatore diventa pronto
+                    if (game.ready["left"] and not already_sent_left) or (game.ready["right"] and not already_sent_right):
+                        await self.channel_layer.group_send(
+                            self.room_group_name,
+                            {
+                                "type": "players_ready",
+                                "left_ready": game.ready["left"],
+                                "right_ready": game.ready["right"],
+                            }
+                        )
+                        already_sent_left = game.ready["left"]
+                        already_sent_right = game.ready["right"]
+                    if game.ready["left"] and game.ready["right"]:
+                        break
+                    await game.ready_changed.wait()
+                    game.ready_changed.clear()
+        except TimeoutError:
+            pass
+
+        if game.ready["left"] and game.ready["right"]:
+            outcome = "start"
+        elif game.ready["left"] or game.ready["right"]:
+            outcome = "finished_walkover"
+            game.winner = game.left_player if game.ready["left"] else game.right_player
+            game.loser = game.right_player if game.ready["left"] else game.left_player
+        else:
+            outcome = "aborted"
 
         # Rimuovi il flag di attesa
         if hasattr(self.game, 'waiting_for_ready'):
             delattr(self.game, 'waiting_for_ready')
 
         if outcome != "start":
-            await self.update_match_status(outcome, self.game.winner, self.game.loser)
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "game_over",
-                    "by": outcome,
-                    "winner": self.game.winner.username if self.game.winner else None,
-                }
-            )
+            self.update_match_status(outcome, self.game.winner, self.game.loser)
+            await self.set_cached_match_status(outcome)
+            await self.notify_game_over(outcome, self.game.winner.username if self.game.winner else None)
         else:
             # DOPPIO CONTROLLO per evitare múltipli game loop
             if not self.game.game_loop_running:
                 self.game.game_loop_running = True
-                await self.update_match_status('in_game')
-                asyncio.create_task(self.game_loop())
+                self.update_match_status('in_game')
+                await self.set_cached_match_status('in_game')
+                print(f"Starting game loop for game {self.game_id}")
+                tick_scheduler.register(self.game_id, self.game_tick, on_failure=self.abort_broken_game)
             else:
                 print(f"[WARNING] Game loop already running for game {self.game_id}, skipping")
 
 
-    async def game_loop(self):
+    async def game_tick(self, steps):
         """
-        Aggiorna periodicamente lo stato del gioco e lo trasmette ai client.
+        Avanza la partita di `steps` passi di simulazione e trasmette lo stato ai client.
+        Chiamato dal TickScheduler a frequenza fissa al posto di un loop per partita.
         """
         game = self.game
-        if not game:
+        if not game.clients:
+            # Una volta che non ci sono più giocatori connessi, ferma il loop
+            tick_scheduler.unregister(self.game_id)
+            game.game_loop_running = False
             return
 
-        print(f"Starting game loop for game {self.game_id}")
-        while game.clients:  # Esegui il ciclo finché ci sono client connessi
+        # Aggiorna lo stato del gioco (recuperando eventuali tick persi) e invia i dati ai client
+        for _ in range(steps):
+            await game.update_game_state()
             if game.game_over:
-                winner = self.game.winner
-                loser = self.game.loser
-
-                # Salva i punteggi nel database con la mappatura corretta:
-                # left_score (left_player) -> points_player_1 (player_1 nel DB)
-                # right_score (right_player) -> points_player_2 (player_2 nel DB)
-                await self.update_match_finished(
-                    points_player_1=self.game.state["left_score"],   # left_player = player_1
-                    points_player_2=self.game.state["right_score"]   # right_player = player_2
-                )
-
-                # Invia un messaggio di fine gioco ai client
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "game_over",
-                        "by": "points",
-                        "winner": winner.username,
-                    }
-                )
                 break
+        # Lo stato parte solo ai tick di invio, oppure subito dopo un urto, un punto o la fine della partita
+        send_rate = game.send_rate
+        event = game.events_pending or game.game_over
+        if send_rate.should_send(steps, force=event):
+            game.events_pending = False
+            # Frame codificato una sola volta e consegnato direttamente ai consumer locali
+            state = game.snapshot()  # proiezione a dizionari calcolata una volta per invio
+            await game.broadcaster.broadcast(game.clients, state, game.encoder.encode(state, game.frame_meta()))
+        send_rate.adjust(game.clients)
+        if send_rate.ping_due():
+            # Accodati senza attendere il socket: un client lento non ferma il tick delle partite
+            for client in game.clients:
+                client.send_ping()
+        await game.spectators.tick(game, steps, force=event)
+
+        if game.game_over:
+            # Il salvataggio su DB non deve bloccare il tick delle altre partite
+            tick_scheduler.unregister(self.game_id)
+            asyncio.create_task(self.finish_game())
+
+    async def abort_broken_game(self, error):
+        """
+        Chiamata dal TickScheduler quando il tick della partita continua a fallire:
+        la partita viene annullata e i giocatori avvisati invece di riprovare ad ogni tick.
+        """
+        game = self.game
+        game.game_over = True
+        game.game_loop_running = False
+        self.update_match_status('aborted')
+        await self.set_cached_match_status('aborted')
+        if game.recorder:
+            game.recorder.finish(game)
+        await self.notify_game_over("error", None)
 
-            # Aggiorna lo stato del gioco e invia i dati ai client
-            await game.update_game_state()
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "game_state",  # chiama .game_state(event) nel consumer
-                    "state": self.game.state
-                }
-            )
-            await asyncio.sleep(1 / 60)  # Ciclo a 60 FPS
+    async def finish_game(self):
+        """
+        Salva il risultato della partita e notifica la fine del gioco ai client.
+        """
+        game = self.game
+        winner = game.winner
+
+        # Salva i punteggi nel database con la mappatura corretta:
+        # left_score (left_player) -> points_player_1 (player_1 nel DB)
+        # right_score (right_player) -> points_player_2 (player_2 nel DB)
+        # La scrittura è differita: il tick non attende il database né le signal post_save
+        self.update_match_finished(
+            points_player_1=game.game_state.left_score,   # left_player = player_1
+            points_player_2=game.game_state.right_score   # right_player = player_2
+        )
+        await self.set_cached_match_status('finished')
+        if game.recorder:
+            game.recorder.finish(game)
 
-        # Una volta che non ci sono più giocatori connessi, ferma il loop
+        # Invia un messaggio di fine gioco ai client
+        await self.notify_game_over("points", winner.username)
         game.game_loop_running = False
 
+    async def notify_game_over(self, by, winner):
+        """
+        Notifica la fine della partita ai giocatori e agli spettatori.
+        """
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "game_over",
+                "by": by,
+                "winner": winner,
+            }
+        )
+        await self.game.spectators.send_event({"type": "game_over", "by": by, "winner": winner})
+
 
     async def send_json(self, content):
         """
-        Funzione helper per inviare messaggi JSON al WebSocket.
+        Funzione helper per inviare messaggi JSON al WebSocket (passando dalla coda di invio,
+        dopo gli eventuali frame già accodati).
         """
-        await self.send(text_data=json.dumps(content))
+        await self.mailbox.send_control(json.dumps(content))
+
+    async def relay_message(self, event):
+        """
+        Messaggio WebSocket prodotto dal worker proprietario della partita.
+        """
+        await self.base_send(event["message"])
 
     async def wait_ready(self, event):
         await self.send_json({
@@ -302,11 +517,35 @@ class GameConsumer(AsyncWebsocketConsumer):
             "right_ready": event["right_ready"],
         })
 
-    async def game_state(self, event):
-        await self.send_json({
-            "type": "game_state",
-            "state": event["state"]
-        })
+    async def send_frame(self, frame):
+        """
+        Accoda un EncodedFrame: viene serializzato nel formato negoziato dal client al momento dell'invio.
+        """
+        self.mailbox.put_frame(frame)
+
+    def send_ping(self):
+        """
+        Accoda un ping al client senza attenderne l'invio: la risposta
+        {"action": "pong", "id": ...} aggiorna il RTT.
+        """
+        self.ping_id += 1
+        self.ping_sent_at = time.monotonic()
+        self.mailbox.put_control(json.dumps({"type": "ping", "id": self.ping_id}))
+
+    def handle_pong(self, ping_id):
+        # Solo la risposta all'ultimo ping è valida; i client che non rispondono mantengono rtt None
+        if ping_id != self.ping_id or self.ping_sent_at is None:
+            return
+        sample = time.monotonic() - self.ping_sent_at
+        self.ping_sent_at = None
+        self.rtt = sample if self.rtt is None else self.rtt + (sample - self.rtt) * 0.25
+
+    async def game_frame(self, event):
+        """
+        Frame inviato da un altro processo tramite il channel layer: arriva lo stato,
+        serializzato qui nel solo formato di questo client.
+        """
+        self.mailbox.put_frame(EncodedFrame.from_message(event))
 
     async def game_over(self, event):
         """
@@ -334,111 +573,41 @@ class GameConsumer(AsyncWebsocketConsumer):
 
 
     @database_sync_to_async
-    def get_match_id(self):
-        return cache.get(f"match_id_for_game_{self.game_id}")
-    
-    @database_sync_to_async
-    def get_match_data(self):
-        """Ottiene i dati del match dal database"""
-        try:
-            if not self.match_id:
-                return None
-                
-            match = Match.objects.get(id=self.match_id)
-            return {
-                'player_1_id': match.player_1.id if match.player_1 else None,
-                'player_2_id': match.player_2.id if match.player_2 else None,
-                'player_1_username': match.player_1.username if match.player_1 else None,
-                'player_2_username': match.player_2.username if match.player_2 else None,
-                'status': match.status
-            }
-        except Match.DoesNotExist:
-            return None
-        except Exception as e:
-            print(f"[ERROR] Error getting match data: {e}")
-            return None
-    
-    @database_sync_to_async
-    def get_match_status(self):
-        """Ottiene lo status del match dal database"""
-        try:
-            if self.match_id:
-                match = Match.objects.get(id=self.match_id)
-                return match.status
-            return None
-        except Match.DoesNotExist:
-            return None
-        except Exception as e:
-            print(f"[ERROR] Error getting match status: {e}")
-            return None
-    
-    @database_sync_to_async
-    def can_user_play_match(self):
-        """Verifica se l'utente può giocare questa partita"""
-        try:
-            if not self.match_id:
-                return False
-            
-            match = Match.objects.get(id=self.match_id)
-            
-            # Verifica che l'utente sia uno dei due giocatori del match
-            return (match.player_1 == self.user or match.player_2 == self.user)
-            
-        except Match.DoesNotExist:
-            return False
-        except Exception as e:
-            print(f"[ERROR] Error checking user permissions: {e}")
-            return False
-    
+    def get_match_descriptor(self):
+        return get_match_descriptor(self.game_id)
+
     @database_sync_to_async
+    def set_cached_match_status(self, status):
+        set_match_status(self.game_id, status)
+
     def update_match_status(self, status, winner=None, loser=None):
-        try:
-            if not self.match_id:
-                print(f"[ERROR] Cannot update match status: match_id is None")
-                return False
-                
-            match = Match.objects.get(id=self.match_id)
-            match.status = status
-            if winner:
-                match.winner = winner
-            if loser:
-                match.loser = loser
-            match.save()
-            return True
-        except Exception as e:
-            print(f"[ERROR] Match update failed: {e}")
+        """
+        Accoda l'aggiornamento dello stato del match: lo scrive match_result_writer in background.
+        """
+        if not self.match_id:
+            print(f"[ERROR] Cannot update match status: match_id is None")
             return False
+        match_result_writer.enqueue(
+            self.match_id,
+            status=status,
+            winner_id=winner.id if winner else None,
+            loser_id=loser.id if loser else None,
+        )
+        return True
 
-    @database_sync_to_async
     def update_match_finished(self, points_player_1, points_player_2):
         """
-        Aggiorna il match con i punteggi finali.
+        Accoda il salvataggio dei punteggi finali del match.
         points_player_1: punteggio del left_player (che corrisponde a player_1 nel DB)
         points_player_2: punteggio del right_player (che corrisponde a player_2 nel DB)
         """
-        try:
-            if not self.match_id:
-                print(f"[ERROR] Cannot finish match: match_id is None")
-                return False
-                
-            match = Match.objects.get(id=self.match_id)
-            
-            # Verifica che il match non sia già finito
-            if match.status in ['finished', 'finished_walkover', 'aborted']:
-                print(f"[WARNING] Attempted to finish already completed match {self.match_id}")
-                return False
-            
-            # Salva i punteggi: left_score -> player_1, right_score -> player_2
-            match.points_player_1 = points_player_1
-            match.points_player_2 = points_player_2
-            match.status = 'finished'
-            
-            # Il metodo save() del modello Match si occuperà automaticamente 
-            # di impostare winner e loser basandosi sui punteggi
-            match.save()
-            
-            print(f"[INFO] Match {self.match_id} finished: player_1({match.player_1.username})={points_player_1}, player_2({match.player_2.username})={points_player_2}")
-            return True
-        except Exception as e:
-            print(f"[ERROR] Final match update failed: {e}")
+        if not self.match_id:
+            print(f"[ERROR] Cannot finish match: match_id is None")
             return False
+        match_result_writer.enqueue(
+            self.match_id,
+            finished=True,
+            points_player_1=points_player_1,
+            points_player_2=points_player_2,
+        )
+        return True
@@ -0,0 +1,112 @@
+import asyncio
+import collections
+import time
+
+from .broadcast import WIRE_BINARY, WIRE_DELTA, WIRE_KEYFRAME
+
+FRAME = "frame"
+CONTROL = "control"
+
+# Contatori globali del processo (esposti da GameStatsView)
+mailbox_stats = {
+    "frames_queued": 0,
+    "frames_sent": 0,
+    "frames_dropped": 0,
+    "keyframes_sent": 0,
+    "control_sent": 0,
+    "send_errors": 0,
+}
+
+
+class SendMailbox:
+    """
+    Coda di invio di una connessione WebSocket.
+
+    I frame di stato sono "latest-wins": se un frame è ancora in coda quando ne arriva
+    uno nuovo viene sostituito, così un client lento riceve sempre lo stato più recente
+    e chi trasmette (tick della partita, handler del channel layer) non attende mai il socket.
+    I messaggi di controllo (game_over, players_update, errori...) non vengono mai scartati
+    e restano in ordine rispetto ai frame; `send_control` ritorna quando sono stati inviati,
+    `put_control` li accoda senza attendere l'invio (per chi non deve aspettare il socket).
+
+    Un client delta che ha perso dei frame riceve come frame successivo un keyframe.
+    """
+
+    def __init__(self, send, wire_format):
+        self.send = send  # AsyncWebsocketConsumer.send
+        self.wire_format = wire_format
+        self.items = collections.deque()  # (FRAME, frame) oppure (CONTROL, (text, future))
+        self.task = None
+        self.keyframe_next = False
+        self.send_time = 0.0  # media mobile del tempo di invio di un frame, in secondi
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def put_frame(self, frame):
+        """
+        Accoda un EncodedFrame: viene serializzato nel formato del client solo al momento dell'invio.
+        """
+        mailbox_stats["frames_queued"] += 1
+        if self.items and self.items[-1][0] == FRAME:
+            # Il frame precedente non è ancora partito: superato dal nuovo
+            self.items[-1] = (FRAME, frame)
+            mailbox_stats["frames_dropped"] += 1
+            if self.wire_format == WIRE_DELTA:
+                self.keyframe_next = True
+        else:
+            self.items.append((FRAME, frame))
+        self.start()
+
+    def put_control(self, text):
+        """
+        Accoda un messaggio di controllo senza attenderne l'invio; gli errori vengono solo registrati.
+        """
+        self.items.append((CONTROL, (text, None)))
+        self.start()
+
+    async def send_control(self, text):
+        future = asyncio.get_running_loop().create_future()
+        self.items.append((CONTROL, (text, future)))
+        self.start()
+        await future
+
+    async def run(self):
+        while self.items:
+            kind, payload = self.items.popleft()
+            if kind == CONTROL:
+                text, future = payload
+                try:
+                    await self.send(text_data=text)
+                    mailbox_stats["control_sent"] += 1
+                    if future is not None:
+                        future.set_result(None)
+                except Exception as e:
+                    if future is not None:
+                        future.set_exception(e)
+                    else:
+                        mailbox_stats["send_errors"] += 1
+                        print(f"[ERROR] Control message send failed: {e}")
+                continue
+
+            wire_format = self.wire_format
+            if self.keyframe_next:
+                wire_format = WIRE_KEYFRAME
+                self.keyframe_next = False
+                mailbox_stats["keyframes_sent"] += 1
+            data = payload.encode(wire_format)
+            start = time.monotonic()
+            try:
+                if self.wire_format == WIRE_BINARY:
+                    await self.send(bytes_data=data)
+                else:
+                    await self.send(text_data=data)
+                mailbox_stats["frames_sent"] += 1
+            except Exception as e:
+                mailbox_stats["send_errors"] += 1
+                print(f"[ERROR] Frame send failed: {e}")
+            self.send_time += (time.monotonic() - start - self.send_time) * 0.2
+
+    def pending(self):
+        return len(self.items)
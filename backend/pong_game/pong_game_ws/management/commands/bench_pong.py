@@ -0,0 +1,66 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pong_game_ws.benchmark import compare_with_baseline, load_baseline, run_benchmark, save_baseline
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "baseline.json")
+
+
+class Command(BaseCommand):
+    help = "Benchmark headless di PongGame con partite simulate da bot scriptati"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matches", type=int, default=100)
+        parser.add_argument("--ticks", type=int, default=3600)
+        parser.add_argument("--alloc-ticks", type=int, default=60)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", default=os.path.normpath(DEFAULT_BASELINE))
+        parser.add_argument("--save-baseline", action="store_true", help="Sovrascrive la baseline con questo risultato")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Peggioramento massimo ammesso (frazione)")
+        parser.add_argument("--json", action="store_true", help="Stampa il risultato in JSON")
+
+    def handle(self, *args, **options):
+        result = run_benchmark(
+            matches=options["matches"],
+            ticks=options["ticks"],
+            alloc_ticks=options["alloc_ticks"],
+            seed=options["seed"],
+        )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2, sort_keys=True))
+        else:
+            self.stdout.write(
+                f"{result['config']['matches']} matches x {result['config']['ticks']} ticks: "
+                f"{result['ticks_per_second']:.0f} ticks/s, "
+                f"p50 {result['tick_p50_us']:.1f} us, p99 {result['tick_p99_us']:.1f} us "
+                f"(x{result['tick_p50_rel']:.3f} / x{result['tick_p99_rel']:.3f} calibration "
+                f"of {result['calibration_us']:.1f} us), "
+                f"{result['alloc_bytes_per_tick']:.0f} B allocated/tick, "
+                f"{result['memory_per_match_bytes']:.0f} B/match"
+            )
+
+        path = options["baseline"]
+        if options["save_baseline"]:
+            save_baseline(path, result)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {path}"))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(f"No baseline at {path}, run with --save-baseline"))
+            return
+        baseline = load_baseline(path)
+        if baseline.get("version") != result["version"]:
+            self.stdout.write(self.style.WARNING("Baseline was recorded by another benchmark version, run with --save-baseline"))
+            return
+        if baseline.get("config") != result["config"]:
+            self.stdout.write(self.style.WARNING("Baseline was recorded with a different configuration, skipping comparison"))
+            return
+        regressions = compare_with_baseline(result, baseline, options["tolerance"])
+        for name, old, new, change in regressions:
+            self.stdout.write(self.style.ERROR(f"{name}: {old:.3f} -> {new:.3f} ({change:+.0%})"))
+        if regressions:
+            raise CommandError("Benchmark regressed against the baseline")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,34 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pong_game_ws.replay import replay, replay_store
+
+
+class Command(BaseCommand):
+    help = "Riesegue senza client una partita registrata e confronta il risultato con quello originale"
+
+    def add_arguments(self, parser):
+        parser.add_argument("game_id")
+
+    def handle(self, *args, game_id, **options):
+        entries = replay_store.load(game_id)
+        if not entries:
+            raise CommandError(f"No replay recorded for game {game_id}")
+
+        try:
+            game, end, ticks_per_second = asyncio.run(replay(entries, game_id))
+        except ValueError as e:
+            raise CommandError(f"Cannot replay game {game_id}: {e}")
+        if ticks_per_second is None:
+            # Nessun tick rieseguito: registrazione senza input né "end" (partita appena iniziata?)
+            raise CommandError(f"Replay of game {game_id} ran no ticks: the recording has nothing to compare")
+        result = f"{game.game_state.left_score}-{game.game_state.right_score}"
+        self.stdout.write(f"Game {game_id}: {game.tick} ticks, score {result} ({ticks_per_second:.0f} ticks/s)")
+
+        if end is None:
+            self.stdout.write(self.style.WARNING("Recording has no end entry (match still running?)"))
+        elif (end["left_score"], end["right_score"]) != (game.game_state.left_score, game.game_state.right_score):
+            raise CommandError(f"Replay diverged: recorded {end['left_score']}-{end['right_score']}, replayed {result}")
+        else:
+            self.stdout.write(self.style.SUCCESS("Replay matches the recorded result"))
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+
+from .models import Match
+
+# Chiavi condivise con il servizio matchmaking (stessa istanza Redis)
+MATCH_ID_KEY = "match_id_for_game_{}"
+MATCH_DESCRIPTOR_KEY = "match_descriptor_{}"
+MATCH_STATUS_KEY = "match_status_{}"
+MATCH_CACHE_TIMEOUT = 3600
+
+
+def describe_match(match):
+    """
+    Dati del match che servono per accettare un WebSocket. Lo stato in cache
+    (MATCH_STATUS_KEY, scritto anche dal matchmaking) ha la precedenza su quello letto qui.
+    """
+    return {
+        "match_id": match.id,
+        "status": match.status,
+        "player_1_id": match.player_1_id,
+        "player_2_id": match.player_2_id,
+        "player_1_username": match.player_1.username if match.player_1 else None,
+        "player_2_username": match.player_2.username if match.player_2 else None,
+        "tournament_id": match.tournament_id,
+    }
+
+
+def get_match_descriptor(game_id):
+    """
+    Restituisce il descrittore del match associato al game_id, o None se la partita non esiste.
+
+    Normalmente è una sola lettura dalla cache (descrittore e stato insieme); alla prima
+    connessione di una partita il descrittore viene costruito con una query e messo in cache.
+    Lo stato resta in una chiave a parte, aggiornata dal matchmaking ad ogni salvataggio
+    del match e da set_match_status, così non serve mai riscrivere il descrittore.
+    """
+    descriptor_key = MATCH_DESCRIPTOR_KEY.format(game_id)
+    status_key = MATCH_STATUS_KEY.format(game_id)
+    cached = cache.get_many([descriptor_key, status_key])
+    descriptor = cached.get(descriptor_key)
+
+    if descriptor is None:
+        match_id = cache.get(MATCH_ID_KEY.format(game_id))
+        if match_id is None:
+            return None
+        match = Match.objects.select_related('player_1', 'player_2').filter(id=match_id).first()
+        if match is None:
+            return None
+        descriptor = describe_match(match)
+        cache.set(descriptor_key, descriptor, timeout=MATCH_CACHE_TIMEOUT)
+
+    if status_key in cached:
+        descriptor["status"] = cached[status_key]
+    return descriptor
+
+
+def set_match_status(game_id, status):
+    """
+    Aggiorna lo stato in cache, così i reconnect vedono subito una partita finita
+    anche prima che il risultato sia scritto nel database. È una sola scrittura
+    della chiave di stato: nessuna lettura-modifica-scrittura del descrittore.
+    """
+    cache.set(MATCH_STATUS_KEY.format(game_id), status, timeout=MATCH_CACHE_TIMEOUT)
@@ -1,8 +1,13 @@
 import asyncio
+import collections
 import json
+import random
 
 import math
 
+from .protocol import DeltaEncoder
+from .state import Ball, GameState, Paddle
+
 class PongGame:
     GAME_WIDTH = 800
     GAME_HEIGHT = 600
@@ -12,16 +17,23 @@ class PongGame:
     WINNING_SCORE = 5
     MAX_SPEED = 40
     SPEED_INCREASE_FACTOR = 1.10
+    PADDLE_SPEED = 12
+    INITIAL_SPEED = 6  # velocità della palla all'inizio e dopo ogni punto
+    MAX_INPUTS_PER_TICK = 4  # messaggi di movimento accettati per giocatore tra due tick
+    HOLD_TICKS = 6  # tick in cui una direzione resta attiva senza nuovi messaggi (né "stop")
+    MAX_COLLISIONS_PER_TICK = 8  # limite di sicurezza agli urti risolti in un frame
 
-    def __init__(self, game_id):
+    def __init__(self, game_id, seed=None):
         self.game_id = game_id
-        self.state = {
-            "ball": {"x": self.GAME_WIDTH // 2, "y": self.GAME_HEIGHT // 2, "dx": 6, "dy": 0},
-            "left_paddle": {"y": self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2},
-            "right_paddle": {"y": self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2},
-            "left_score": 0,
-            "right_score": 0,
-        }
+        # Seed della partita: con lo stesso seed e gli stessi input la simulazione è riproducibile
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
+        self.tick = 0  # passi di simulazione eseguiti
+        self.game_state = GameState(
+            ball=Ball(self.GAME_WIDTH // 2, self.GAME_HEIGHT // 2, self.INITIAL_SPEED, 0),
+            left_paddle=Paddle(self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2),
+            right_paddle=Paddle(self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2),
+        )
         self.clients = []
         self.game_loop_running = False
         self.left_player = None
@@ -34,124 +46,240 @@ class PongGame:
             "left": False,
             "right": False
         }
+        # Segnalato ad ogni cambio di self.ready: il consumer lo attende invece di fare polling
+        self.ready_changed = asyncio.Event()
+        # Event loop del consumer che attende il ready (per segnalazioni da altri thread)
+        self.loop = None
+
+        # Input di movimento in attesa del prossimo tick, per giocatore
+        self.inputs = {"left": collections.deque(), "right": collections.deque()}
+        self.input_stats = {"received": 0, "applied": 0, "coalesced": 0, "rate_limited": 0}
+        # Direzione tenuta da ciascun giocatore e tick per cui resta attiva senza nuovi messaggi
+        self.held = {"left": None, "right": None}
+        self.hold_ticks = {"left": 0, "right": 0}
+        # Ultimo numero di sequenza ricevuto e ultimo elaborato da un tick, per giocatore
+        self.received_seq = {"left": 0, "right": 0}
+        self.input_acks = {"left": 0, "right": 0}
+
+        # ReplayRecorder della partita (opzionale), riceve gli input applicati ad ogni tick
+        self.recorder = None
+
+        # Encoder dei frame per i client che usano il protocollo v2 (keyframe + delta)
+        self.encoder = DeltaEncoder()
+        # FrameBroadcaster e SendRateController della partita, assegnati dal consumer che crea l'istanza
+        self.broadcaster = None
+        self.send_rate = None
+        # SpectatorBroadcaster della partita (frame a frequenza ridotta per gli spettatori)
+        self.spectators = None
+        # Urto sul paddle o punto dall'ultimo frame inviato: il prossimo tick trasmette subito
+        self.events_pending = False
         
         # Initialize ball with randomized direction
         self.reset_ball()
 
 
+    def snapshot(self):
+        """
+        Copia dello stato della partita nella forma a dizionari: usata per broadcast e GameStateView.
+        Lo stato si modifica solo tramite self.game_state (oggetti con __slots__).
+        """
+        return self.game_state.to_wire()
+
+    def frame_meta(self):
+        """
+        Dati di sincronizzazione allegati ad ogni frame: tick autoritativo e ultimo input
+        elaborato di ciascun giocatore (per predizione e riconciliazione lato client).
+        """
+        return {"t": self.tick, "ack": [self.input_acks["left"], self.input_acks["right"]]}
+
+    def mark_ready(self, side):
+        """
+        Segna un giocatore come pronto e sveglia chi attende il ready della partita.
+        """
+        if self.ready[side]:
+            return
+        self.ready[side] = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self.loop is None or running is self.loop:
+            self.ready_changed.set()
+        else:
+            # Chiamato da un altro thread/loop (es. GameStateView.post)
+            self.loop.call_soon_threadsafe(self.ready_changed.set)
+
     async def process_input(self, client, input_data):
         """
-        Process input from a player with enhanced paddle movement.
+        Process input from a player: before the start a move marks the player as ready,
+        during the game it is queued and applied by the next tick (see apply_inputs).
         """
         if not self.game_loop_running:
             print(f"Processing input from {client}: {input_data}")
-            if input_data.get("action") == "move":
-                if client == "left":
-                    self.ready["left"] = True
-                elif client == "right":
-                    self.ready["right"] = True
+            if input_data.get("action") == "move" and client in self.ready:
+                self.mark_ready(client)
             return
 
-        # Enhanced paddle speed for more responsive gameplay
-        paddle_speed = 12
-        if input_data.get("action") == "move":
-            direction = input_data.get("direction")
-            
-            # Left paddle movement with boundary checking
-            if client == "left":
-                if direction == "up" and self.state["left_paddle"]["y"] > 0:
-                    self.state["left_paddle"]["y"] = max(0, self.state["left_paddle"]["y"] - paddle_speed)
-                elif direction == "down" and self.state["left_paddle"]["y"] < self.GAME_HEIGHT - self.PADDLE_HEIGHT:
-                    self.state["left_paddle"]["y"] = min(self.GAME_HEIGHT - self.PADDLE_HEIGHT, 
-                                                        self.state["left_paddle"]["y"] + paddle_speed)
-            
-            # Right paddle movement with boundary checking
-            elif client == "right":
-                if direction == "up" and self.state["right_paddle"]["y"] > 0:
-                    self.state["right_paddle"]["y"] = max(0, self.state["right_paddle"]["y"] - paddle_speed)
-                elif direction == "down" and self.state["right_paddle"]["y"] < self.GAME_HEIGHT - self.PADDLE_HEIGHT:
-                    self.state["right_paddle"]["y"] = min(self.GAME_HEIGHT - self.PADDLE_HEIGHT, 
-                                                        self.state["right_paddle"]["y"] + paddle_speed)
+        if input_data.get("action") != "move" or client not in self.inputs:
+            return
+        direction = input_data.get("direction")
+        if direction not in ("up", "down", "stop"):
+            return
+
+        # Numero di sequenza dell'input assegnato dal client (opzionale), confermato nei frame
+        seq = input_data.get("seq")
+        if type(seq) is int and seq > self.received_seq[client]:
+            self.received_seq[client] = seq
+
+        # Gli input vengono accodati e applicati dal tick: al massimo MAX_INPUTS_PER_TICK per giocatore
+        self.input_stats["received"] += 1
+        queue = self.inputs[client]
+        if len(queue) >= self.MAX_INPUTS_PER_TICK:
+            self.input_stats["rate_limited"] += 1
+            return
+        queue.append(direction)
+
+    def apply_inputs(self):
+        """
+        Consuma gli input accodati dall'ultimo tick: il messaggio più recente diventa la
+        direzione tenuta dal giocatore ("stop" la rilascia). Il paddle si muove di
+        PADDLE_SPEED ad ogni tick finché la direzione è tenuta, per al più HOLD_TICKS tick
+        senza nuovi messaggi: la velocità non dipende da quanti messaggi arrivano in un tick.
+        """
+        # Tutti gli input ricevuti finora sono elaborati da questo tick (applicati, fusi o scartati)
+        self.input_acks["left"] = self.received_seq["left"]
+        self.input_acks["right"] = self.received_seq["right"]
+
+        applied = {}
+        for side, queue in self.inputs.items():
+            if queue:
+                direction = queue[-1]
+                self.input_stats["coalesced"] += len(queue) - 1
+                self.input_stats["applied"] += 1
+                queue.clear()
+                applied[side] = direction
+                if direction == "stop":
+                    self.held[side], self.hold_ticks[side] = None, 0
+                else:
+                    self.held[side], self.hold_ticks[side] = direction, self.HOLD_TICKS
+            if self.hold_ticks[side]:
+                self.move_paddle(side, self.held[side])
+                self.hold_ticks[side] -= 1
+                if not self.hold_ticks[side]:
+                    self.held[side] = None
+        if applied and self.recorder:
+            self.recorder.record(self.tick, applied.get("left"), applied.get("right"))
+
+    def move_paddle(self, side, direction):
+        paddle = self.game_state.left_paddle if side == "left" else self.game_state.right_paddle
+        if direction == "up" and paddle.y > 0:
+            paddle.y = max(0, paddle.y - self.PADDLE_SPEED)
+        elif direction == "down" and paddle.y < self.GAME_HEIGHT - self.PADDLE_HEIGHT:
+            paddle.y = min(self.GAME_HEIGHT - self.PADDLE_HEIGHT, paddle.y + self.PADDLE_SPEED)
 
     async def update_game_state(self):
         """
-        Update game logic with advanced ball physics: interpolated movement, collisions, scores.
+        Update game logic with advanced ball physics: swept movement, collisions, scores.
         """
         if self.game_over:
             return
+        self.tick += 1
 
-        ball = self.state["ball"]
+        # Input dei giocatori arrivati dall'ultimo tick
+        self.apply_inputs()
+
+        state = self.game_state
+        ball = state.ball
         
-        # Use interpolated movement for smooth collision detection
-        self.update_ball_with_interpolation()
+        # Swept collision detection against walls and paddles
+        self.move_ball()
         
         # Handle scoring after ball update
-        if ball["x"] < -self.BALL_RADIUS:
-            self.state["right_score"] += 1
+        if ball.x < -self.BALL_RADIUS:
+            state.right_score += 1
+            self.events_pending = True
             self.reset_ball("left")  # Ball goes to left player (who lost the point)
             self.reset_paddles()
-        elif ball["x"] > self.GAME_WIDTH + self.BALL_RADIUS:
-            self.state["left_score"] += 1
+        elif ball.x > self.GAME_WIDTH + self.BALL_RADIUS:
+            state.left_score += 1
+            self.events_pending = True
             self.reset_ball("right")  # Ball goes to right player (who lost the point)
             self.reset_paddles()
 
         # Check for game over
-        if self.state["left_score"] >= self.WINNING_SCORE or self.state["right_score"] >= self.WINNING_SCORE:
+        if state.left_score >= self.WINNING_SCORE or state.right_score >= self.WINNING_SCORE:
             self.game_over = True
-            self.winner = self.left_player if self.state["left_score"] >= self.WINNING_SCORE else self.right_player
-            self.loser = self.right_player if self.state["left_score"] >= self.WINNING_SCORE else self.left_player
+            self.winner = self.left_player if state.left_score >= self.WINNING_SCORE else self.right_player
+            self.loser = self.right_player if state.left_score >= self.WINNING_SCORE else self.left_player
 
-    def update_ball_with_interpolation(self):
-        """
-        Update ball position with interpolation for smooth collision detection.
+    def move_ball(self):
         """
-        ball = self.state["ball"]
-        
-        # Calculate steps for interpolation based on ball speed
-        steps = max(1, int(max(abs(ball["dx"]), abs(ball["dy"])) / self.BALL_RADIUS))
-        dx_step = ball["dx"] / steps
-        dy_step = ball["dy"] / steps
-        
-        for i in range(steps):
-            prev_x = ball["x"]
-            prev_y = ball["y"]
-            
-            # Update position incrementally
-            ball["x"] += dx_step
-            ball["y"] += dy_step
-            
-            # Check for paddle collisions with interpolation
-            self.handle_interpolated_paddle_collision(prev_x, ball["x"], ball["y"])
-            
-            # Handle wall collisions
-            self.handle_wall_collisions()
+        Advance the ball by one frame with continuous collision detection.
 
-    def handle_interpolated_paddle_collision(self, prev_x, curr_x, ball_y):
+        Instead of splitting the frame into sub-steps, the exact time of impact of the
+        swept ball against the walls and the paddle faces is computed analytically; the
+        ball is moved to the earliest impact, bounced, and the rest of the frame continues
+        with the new velocity. The cost does not depend on the ball speed and a fast ball
+        cannot tunnel through a paddle. After MAX_COLLISIONS_PER_TICK impacts the rest of
+        the frame is travelled without collision response, clamped inside the field.
         """
-        Handle paddle collisions with interpolated positions for accuracy.
-        """
-        ball = self.state["ball"]
-        
-        # Left paddle collision
-        if (prev_x - self.BALL_RADIUS > self.PADDLE_WIDTH and 
-            curr_x - self.BALL_RADIUS <= self.PADDLE_WIDTH and
-            self.is_y_overlapping_with_paddle(ball_y, self.state["left_paddle"]["y"])):
-            
-            # Position ball at paddle edge
-            ball["x"] = self.PADDLE_WIDTH + self.BALL_RADIUS
-            self.handle_sophisticated_paddle_bounce(ball_y, self.state["left_paddle"]["y"], "left")
-        
-        # Right paddle collision  
-        elif (prev_x + self.BALL_RADIUS < self.GAME_WIDTH - self.PADDLE_WIDTH and
-              curr_x + self.BALL_RADIUS >= self.GAME_WIDTH - self.PADDLE_WIDTH and
-              self.is_y_overlapping_with_paddle(ball_y, self.state["right_paddle"]["y"])):
-            
-            # Position ball at paddle edge
-            ball["x"] = self.GAME_WIDTH - self.PADDLE_WIDTH - self.BALL_RADIUS
-            self.handle_sophisticated_paddle_bounce(ball_y, self.state["right_paddle"]["y"], "right")
-        
-        # Apply speed limiting after collision
-        self.limit_ball_speed()
+        state = self.game_state
+        ball = state.ball
+        radius = self.BALL_RADIUS
+        left_face = self.PADDLE_WIDTH + radius
+        right_face = self.GAME_WIDTH - self.PADDLE_WIDTH - radius
+        remaining = 1.0  # frazione del frame ancora da simulare
+
+        for _ in range(self.MAX_COLLISIONS_PER_TICK):
+            t, event = remaining, None
+
+            # Top and bottom walls
+            if ball.dy < 0:
+                t_wall = max(0.0, (radius - ball.y) / ball.dy)
+                if t_wall < t:
+                    t, event = t_wall, "top"
+            elif ball.dy > 0:
+                t_wall = max(0.0, (self.GAME_HEIGHT - radius - ball.y) / ball.dy)
+                if t_wall < t:
+                    t, event = t_wall, "bottom"
+
+            # Paddle faces: the ball must reach the face while overlapping the paddle
+            if ball.dx < 0 and ball.x >= left_face:
+                t_paddle = (left_face - ball.x) / ball.dx
+                if t_paddle <= t and self.is_y_overlapping_with_paddle(ball.y + ball.dy * t_paddle, state.left_paddle.y):
+                    t, event = t_paddle, "left"
+            elif ball.dx > 0 and ball.x <= right_face:
+                t_paddle = (right_face - ball.x) / ball.dx
+                if t_paddle <= t and self.is_y_overlapping_with_paddle(ball.y + ball.dy * t_paddle, state.right_paddle.y):
+                    t, event = t_paddle, "right"
+
+            ball.x += ball.dx * t
+            ball.y += ball.dy * t
+            remaining -= t
+            if event is None:
+                break
+
+            if event == "top":
+                ball.y = radius
+                ball.dy = abs(ball.dy)  # Ensure downward movement
+            elif event == "bottom":
+                ball.y = self.GAME_HEIGHT - radius
+                ball.dy = -abs(ball.dy)  # Ensure upward movement
+            else:
+                # Position ball at paddle edge and bounce
+                paddle = state.left_paddle if event == "left" else state.right_paddle
+                ball.x = left_face if event == "left" else right_face
+                self.handle_sophisticated_paddle_bounce(ball.y, paddle.y, event)
+                self.limit_ball_speed()
+                self.events_pending = True
+        else:
+            # Limite di urti raggiunto: il resto del frame avanza senza risposta agli urti
+            # (la palla non rallenta), tenuta dentro le pareti e, se era in campo, davanti ai paddle
+            in_field = left_face <= ball.x <= right_face
+            ball.x += ball.dx * remaining
+            ball.y = min(max(ball.y + ball.dy * remaining, radius), self.GAME_HEIGHT - radius)
+            if in_field:
+                ball.x = min(max(ball.x, left_face), right_face)
 
     def is_y_overlapping_with_paddle(self, ball_y, paddle_y):
         """
@@ -164,7 +292,7 @@ class PongGame:
         """
         Handle paddle bounce with sophisticated angle calculation.
         """
-        ball = self.state["ball"]
+        ball = self.game_state.ball
         
         # Calculate relative intersection point
         paddle_center = paddle_y + self.PADDLE_HEIGHT / 2
@@ -178,84 +306,64 @@ class PongGame:
         bounce_angle = normalized_intersect * max_bounce_angle
         
         # Calculate current speed and increase it slightly
-        current_speed = math.sqrt(ball["dx"]**2 + ball["dy"]**2) * self.SPEED_INCREASE_FACTOR
+        current_speed = math.sqrt(ball.dx**2 + ball.dy**2) * self.SPEED_INCREASE_FACTOR
         
         # Set new velocity based on side and angle
         if side == "left":
-            ball["dx"] = current_speed * math.cos(bounce_angle)
+            ball.dx = current_speed * math.cos(bounce_angle)
         else:  # right paddle
-            ball["dx"] = -current_speed * math.cos(bounce_angle)
+            ball.dx = -current_speed * math.cos(bounce_angle)
             
-        ball["dy"] = current_speed * math.sin(bounce_angle)
+        ball.dy = current_speed * math.sin(bounce_angle)
         
         # Ensure minimum vertical velocity to avoid purely horizontal movement
         min_dy = 1.0
-        if abs(ball["dy"]) < min_dy:
-            ball["dy"] = min_dy if ball["dy"] >= 0 else -min_dy
-
-    def handle_wall_collisions(self):
-        """
-        Handle collisions with top and bottom walls.
-        """
-        ball = self.state["ball"]
-        
-        # Top wall collision
-        if ball["y"] - self.BALL_RADIUS < 0:
-            ball["y"] = self.BALL_RADIUS
-            ball["dy"] = abs(ball["dy"])  # Ensure downward movement
-            
-        # Bottom wall collision
-        if ball["y"] + self.BALL_RADIUS > self.GAME_HEIGHT:
-            ball["y"] = self.GAME_HEIGHT - self.BALL_RADIUS
-            ball["dy"] = -abs(ball["dy"])  # Ensure upward movement
+        if abs(ball.dy) < min_dy:
+            ball.dy = min_dy if ball.dy >= 0 else -min_dy
 
     def limit_ball_speed(self):
         """
         Limit ball speed to prevent it from becoming too fast.
         """
-        ball = self.state["ball"]
-        current_speed = math.sqrt(ball["dx"]**2 + ball["dy"]**2)
+        ball = self.game_state.ball
+        current_speed = math.sqrt(ball.dx**2 + ball.dy**2)
         
         if current_speed > self.MAX_SPEED:
             factor = self.MAX_SPEED / current_speed
-            ball["dx"] *= factor
-            ball["dy"] *= factor
+            ball.dx *= factor
+            ball.dy *= factor
 
     def get_ball_speed(self):
         """
         Get current ball speed for visual effects.
         """
-        ball = self.state["ball"]
-        return math.sqrt(ball["dx"]**2 + ball["dy"]**2)
+        ball = self.game_state.ball
+        return math.sqrt(ball.dx**2 + ball.dy**2)
 
     def reset_ball(self, towards_player=None):
         """
         Reset the ball's position to the center, directed towards the specified player.
         If no player specified, use random direction.
         """
-        import random
-        initial_speed = 6
-        
-        
         # Determine direction based on who should receive the ball
         if towards_player == "left":
             dx_direction = -1  # Ball goes towards left player
         elif towards_player == "right":
             dx_direction = 1   # Ball goes towards right player
         else:
-            dx_direction = random.choice([-1, 1])  # Random direction for game start
+            dx_direction = self.rng.choice([-1, 1])  # Random direction for game start
         
-        self.state["ball"] = {
-            "x": self.GAME_WIDTH // 2, 
-            "y": self.GAME_HEIGHT // 2, 
-            "dx": initial_speed * dx_direction,
-            "dy": 0
-        }
+        # Riusa l'oggetto esistente invece di allocarne uno nuovo ad ogni punto
+        ball = self.game_state.ball
+        ball.x = self.GAME_WIDTH // 2
+        ball.y = self.GAME_HEIGHT // 2
+        ball.dx = self.INITIAL_SPEED * dx_direction
+        ball.dy = 0
 
     def reset_paddles(self):
         """
         Reset paddles to the center of the game area.
         """
-        self.state["left_paddle"]["y"] = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
-        self.state["right_paddle"]["y"] = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
+        self.game_state.left_paddle.y = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
+        self.game_state.right_paddle.y = self.GAME_HEIGHT // 2 - self.PADDLE_HEIGHT // 2
 
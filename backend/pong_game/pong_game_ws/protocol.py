@@ -0,0 +1,140 @@
+import struct
+
+PROTOCOL_VERSION = 2
+KEYFRAME_INTERVAL = 60  # un keyframe completo al secondo a 60 Hz
+
+# Frame binario (?encoding=binary), little endian, 44 byte:
+#   u8  tipo messaggio (BINARY_GAME_STATE)
+#   u8  versione del layout
+#   u32 numero del frame
+#   f32 ball x, ball y, ball dx, ball dy
+#   f32 left paddle y, right paddle y
+#   u8  left score, right score
+#   u32 tick della simulazione
+#   u32 ultimo input elaborato del giocatore sinistro, del giocatore destro
+BINARY_ENCODING = "binary"
+BINARY_VERSION = 2
+BINARY_GAME_STATE = 1
+BINARY_FRAME = struct.Struct("<BBIffffffBBIII")
+
+# Nomi compatti dei campi trasmessi -> percorso in PongGame.snapshot()
+STATE_FIELDS = {
+    "bx": ("ball", "x"),
+    "by": ("ball", "y"),
+    "bdx": ("ball", "dx"),
+    "bdy": ("ball", "dy"),
+    "lp": ("left_paddle", "y"),
+    "rp": ("right_paddle", "y"),
+    "ls": ("left_score",),
+    "rs": ("right_score",),
+}
+
+
+def flatten_state(state):
+    """
+    Converte PongGame.snapshot() in un dizionario piatto con chiavi compatte.
+    Le coordinate sono arrotondate al centesimo: basta per il rendering e riduce il payload.
+    """
+    snapshot = {}
+    for key, path in STATE_FIELDS.items():
+        value = state
+        for part in path:
+            value = value[part]
+        snapshot[key] = round(value, 2) if isinstance(value, float) else value
+    return snapshot
+
+
+def encode_binary(state, seq, tick=0, ack=(0, 0)):
+    """
+    Impacchetta PongGame.snapshot() nel frame binario a layout fisso.
+    """
+    ball = state["ball"]
+    return BINARY_FRAME.pack(
+        BINARY_GAME_STATE,
+        BINARY_VERSION,
+        seq & 0xFFFFFFFF,
+        ball["x"], ball["y"], ball["dx"], ball["dy"],
+        state["left_paddle"]["y"],
+        state["right_paddle"]["y"],
+        state["left_score"],
+        state["right_score"],
+        tick & 0xFFFFFFFF,
+        ack[0] & 0xFFFFFFFF,
+        ack[1] & 0xFFFFFFFF,
+    )
+
+
+def decode_binary(data):
+    """
+    Operazione inversa di encode_binary (usata da test e strumenti di debug).
+    Restituisce (seq, state, tick, ack).
+    """
+    (_, _, seq, x, y, dx, dy, left_y, right_y,
+     left_score, right_score, tick, left_ack, right_ack) = BINARY_FRAME.unpack(data)
+    return seq, {
+        "ball": {"x": x, "y": y, "dx": dx, "dy": dy},
+        "left_paddle": {"y": left_y},
+        "right_paddle": {"y": right_y},
+        "left_score": left_score,
+        "right_score": right_score,
+    }, tick, [left_ack, right_ack]
+
+
+class DeltaEncoder:
+    """
+    Encoder del protocollo v2 per una partita.
+
+    Ogni frame ha un numero di sequenza crescente. Ogni `keyframe_interval` frame viene
+    inviato lo stato completo (`game_state` con `key: true`), negli altri solo i campi
+    cambiati rispetto al frame precedente (`game_delta`). Un client che rileva un buco
+    nella sequenza chiede un resync e riceve `keyframe()`.
+
+    `meta` (vedi PongGame.frame_meta: tick `t` e input confermati `ack`) viene allegato
+    a tutti i frame, keyframe e delta.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last = None
+        self.meta = {}
+
+    def encode(self, state, meta=None):
+        self.seq += 1
+        self.meta = meta or {}
+        snapshot = flatten_state(state)
+        if self.last is None or self.seq % self.keyframe_interval == 0:
+            self.last = snapshot
+            return self.keyframe()
+
+        changes = {key: value for key, value in snapshot.items() if self.last[key] != value}
+        self.last = snapshot
+        return {
+            "type": "game_delta",
+            "v": PROTOCOL_VERSION,
+            "seq": self.seq,
+            **self.meta,
+            "d": changes,
+        }
+
+    def keyframe(self):
+        """
+        Stato completo dell'ultimo frame codificato (None se non è ancora partito nulla).
+        """
+        if self.last is None:
+            return None
+        return keyframe_message(self.seq, self.last, self.meta)
+
+
+def keyframe_message(seq, snapshot, meta):
+    """
+    Keyframe del protocollo v2: stato completo (già appiattito da flatten_state) con sequenza e meta.
+    """
+    return {
+        "type": "game_state",
+        "v": PROTOCOL_VERSION,
+        "seq": seq,
+        **meta,
+        "key": True,
+        "state": snapshot,
+    }
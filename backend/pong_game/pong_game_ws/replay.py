@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from .pong import PongGame
+
+REPLAY_VERSION = 2
+REPLAY_KEY = "pong:replay:{}"
+
+# Codifica compatta delle direzioni nel log degli input
+DIRECTION_CODES = {"up": "u", "down": "d", "stop": "s", None: ""}
+DIRECTIONS = {code: direction for direction, code in DIRECTION_CODES.items()}
+
+
+class ReplayStore:
+    """
+    Salva le registrazioni delle partite in uno stream Redis per partita.
+
+    Le scritture sono accodate e inviate in ordine da un task in background,
+    quindi il game loop non attende mai Redis. Una voce con `reset` svuota prima
+    lo stream: una partita ricreata con lo stesso game_id non si mescola alla precedente.
+    """
+
+    def __init__(self, redis_url, ttl):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.redis = None
+        self.queue = None
+        self.task = None
+        self.stats = {"entries": 0, "failed": 0}
+
+    def append(self, game_id, entry, reset=False):
+        if self.task is None or self.task.done():
+            self.redis = self.redis or aioredis.Redis.from_url(self.redis_url)
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        self.queue.put_nowait((game_id, entry, reset))
+
+    async def run(self):
+        while True:
+            game_id, entry, reset = await self.queue.get()
+            key = REPLAY_KEY.format(game_id)
+            try:
+                async with self.redis.pipeline(transaction=reset) as pipe:
+                    if reset:
+                        pipe.delete(key)
+                    pipe.xadd(key, {"entry": json.dumps(entry)})
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
+                self.stats["entries"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[ERROR] Replay write for game {game_id} failed: {e}")
+
+    def load(self, game_id):
+        """
+        Legge (in modo sincrono) la registrazione di una partita; lista vuota se non esiste.
+        """
+        conn = redis.Redis.from_url(self.redis_url)
+        return [json.loads(fields[b"entry"]) for _, fields in conn.xrange(REPLAY_KEY.format(game_id))]
+
+    def snapshot(self):
+        return {"pending": self.queue.qsize() if self.queue else 0, **self.stats}
+
+
+class ReplayRecorder:
+    """
+    Registra seed e input applicati da una partita. Gli input vengono raggruppati
+    in blocchi di `chunk_size` tick prima di essere scritti nello store.
+    """
+
+    def __init__(self, store, game, match_id=None, chunk_size=120):
+        self.store = store
+        self.game_id = game.game_id
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.finished = False
+        store.append(self.game_id, {
+            "type": "start",
+            "v": REPLAY_VERSION,
+            "seed": game.seed,
+            "match_id": match_id,
+        }, reset=True)
+
+    def record(self, tick, left, right):
+        self.buffer.append([tick, DIRECTION_CODES[left], DIRECTION_CODES[right]])
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.store.append(self.game_id, {"type": "inputs", "inputs": self.buffer})
+            self.buffer = []
+
+    def finish(self, game):
+        """
+        Chiude la registrazione con il risultato finale (una sola volta).
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.flush()
+        self.store.append(self.game_id, {
+            "type": "end",
+            "ticks": game.tick,
+            "game_over": game.game_over,
+            "left_score": game.game_state.left_score,
+            "right_score": game.game_state.right_score,
+        })
+
+
+async def replay(entries, game_id="replay"):
+    """
+    Riesegue una partita registrata senza client né scheduler.
+    Restituisce (PongGame al termine, record "end" o None, tick al secondo o None se
+    non è stato rieseguito alcun tick).
+    Se `entries` contiene più partite viene rieseguita solo l'ultima (dall'ultimo "start").
+    """
+    starts = [i for i, entry in enumerate(entries) if entry["type"] == "start"]
+    if not starts:
+        raise ValueError("Replay has no start entry")
+    entries = entries[starts[-1]:]
+    start = entries[0]
+    if start["v"] != REPLAY_VERSION:
+        raise ValueError(f"Unsupported replay version {start['v']}")
+    end = next((entry for entry in entries if entry["type"] == "end"), None)
+
+    inputs = {}
+    for entry in entries:
+        if entry["type"] == "inputs":
+            for tick, left, right in entry["inputs"]:
+                inputs[tick] = (DIRECTIONS[left], DIRECTIONS[right])
+    last_tick = end["ticks"] if end else max(inputs, default=0)
+
+    game = PongGame(game_id, seed=start["seed"])
+    game.game_loop_running = True
+    began = time.perf_counter()
+    while game.tick < last_tick and not game.game_over:
+        for side, direction in zip(("left", "right"), inputs.get(game.tick + 1, (None, None))):
+            if direction:
+                game.inputs[side].append(direction)
+        await game.update_game_state()
+    elapsed = time.perf_counter() - began
+    return game, end, game.tick / elapsed if game.tick and elapsed else None
+
+
+replay_store = ReplayStore(settings.CACHES["default"]["LOCATION"], ttl=settings.PONG_REPLAY_TTL)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import Match
+
+FINAL_STATUSES = ('finished', 'finished_walkover', 'aborted')
+
+
+def locked_matches():
+    """
+    Match con i giocatori e il torneo, bloccati in scrittura. Il lock è solo sulla tabella
+    dei match: i FK sono nullable, quindi in LEFT OUTER JOIN, e PostgreSQL rifiuta
+    FOR UPDATE sul lato nullable di un outer join.
+    """
+    return (
+        Match.objects.select_for_update(of=("self",))
+        .select_related('player_1', 'player_2', 'tournament')
+    )
+
+
+class MatchResultWriter:
+    """
+    Coda write-behind per gli aggiornamenti dei match prodotti dal game loop.
+
+    Il game loop accoda senza attendere il database; un task in background
+    svuota la coda ogni `flush_interval` secondi (o appena ci sono `batch_size`
+    elementi) e scrive il batch nel thread pool di database_sync_to_async, una
+    transazione breve per match. Le signal post_save (trofei, tornei) girano quindi
+    fuori dal tick delle partite, senza tenere bloccati gli altri match del batch.
+    """
+
+    def __init__(self, flush_interval=0.2, batch_size=100):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = []
+        self.wakeup = None
+        self.task = None
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_batch_duration": 0.0,
+        }
+
+    def enqueue(self, match_id, **update):
+        """
+        Accoda un aggiornamento: `status`, `winner_id`, `loser_id`,
+        oppure `finished=True` con `points_player_1`/`points_player_2`.
+        """
+        self.pending.append((match_id, update))
+        self.stats["enqueued"] += 1
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self.pending:
+                await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        start = time.monotonic()
+        try:
+            written, failed = await database_sync_to_async(self.write_batch)(batch)
+        except Exception as e:
+            print(f"[ERROR] Match result batch of {len(batch)} failed: {e}")
+            written, failed = 0, len(batch)
+        self.stats["written"] += written
+        self.stats["failed"] += failed
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["last_batch_duration"] = time.monotonic() - start
+
+    def write_batch(self, batch):
+        """
+        Applica il batch raggruppando gli aggiornamenti per match. Ogni match ha la propria
+        transazione, che blocca solo la sua riga: un errore su un match non annulla gli altri
+        e le signal post_save di un match non tengono il lock sugli altri.
+        """
+        written = failed = 0
+        updates = {}
+        for match_id, update in batch:
+            updates.setdefault(match_id, []).append(update)
+
+        for match_id, match_updates in updates.items():
+            try:
+                with transaction.atomic():
+                    match = locked_matches().filter(pk=match_id).first()
+                    if match is None:
+                        print(f"[ERROR] Match {match_id} not found, dropping {len(match_updates)} updates")
+                        failed += len(match_updates)
+                        continue
+                    if self.apply(match, match_updates):
+                        match.save()
+                written += len(match_updates)
+            except Exception as e:
+                print(f"[ERROR] Match {match_id} update failed: {e}")
+                failed += len(match_updates)
+        return written, failed
+
+    def apply(self, match, match_updates):
+        """
+        Applica in ordine gli aggiornamenti accodati per un match; restituisce True se va salvato.
+        """
+        changed = False
+        for update in match_updates:
+            if update.get("finished"):
+                # Verifica che il match non sia già finito
+                if match.status in FINAL_STATUSES:
+                    print(f"[WARNING] Attempted to finish already completed match {match.id}")
+                    continue
+                # Il metodo save() del modello Match imposta winner e loser dai punteggi
+                match.points_player_1 = update["points_player_1"]
+                match.points_player_2 = update["points_player_2"]
+                match.status = 'finished'
+                print(f"[INFO] Match {match.id} finished: player_1({match.player_1.username})={match.points_player_1}, player_2({match.player_2.username})={match.points_player_2}")
+            else:
+                match.status = update["status"]
+                if update.get("winner_id"):
+                    match.winner_id = update["winner_id"]
+                if update.get("loser_id"):
+                    match.loser_id = update["loser_id"]
+            changed = True
+        return changed
+
+    def snapshot(self):
+        return {
+            "pending": len(self.pending),
+            "running": self.task is not None and not self.task.done(),
+            **self.stats,
+        }
+
+
+match_result_writer = MatchResultWriter(
+    flush_interval=settings.PONG_RESULT_FLUSH_INTERVAL,
+    batch_size=settings.PONG_RESULT_BATCH_SIZE,
+)
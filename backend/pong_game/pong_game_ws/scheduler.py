@@ -0,0 +1,162 @@
+import asyncio
+
+from django.conf import settings
+
+
+class TickScheduler:
+    """
+    Scheduler unico per processo che fa avanzare tutte le partite attive
+    a passo fisso (fixed timestep).
+
+    Le scadenze dei tick sono calcolate in modo assoluto (next_tick += intervallo),
+    quindi il tempo speso a simulare e trasmettere non accumula deriva.
+    Se il loop resta indietro, i tick mancanti vengono recuperati (fino a
+    `max_catchup_ticks` per giro); oltre `max_lag` secondi di ritardo il backlog
+    viene scartato per non entrare in una spirale di recupero.
+    Una partita il cui tick fallisce `max_failures` volte di fila viene rimossa e
+    segnalata al suo `on_failure`, invece di essere richiamata (e fallire) ad ogni tick.
+    """
+
+    def __init__(self, tick_rate=60, max_catchup_ticks=5, max_lag=0.25, max_failures=3):
+        self.tick_rate = tick_rate
+        self.tick_interval = 1 / tick_rate
+        self.max_catchup_ticks = max(1, max_catchup_ticks)
+        self.max_lag = max_lag
+        self.max_failures = max(1, max_failures)
+        self.handlers = {}  # game_id -> coroutine function(steps)
+        self.failure_handlers = {}  # game_id -> coroutine function(error), chiamata se la partita viene fermata
+        self.failures = {}  # game_id -> tick falliti consecutivi
+        self.task = None
+        self.tick = 0
+        self.stats = {
+            "ticks": 0,
+            "overruns": 0,
+            "catchup_ticks": 0,
+            "dropped_ticks": 0,
+            "failed_ticks": 0,
+            "failed_games": 0,
+            "last_tick_duration": 0.0,
+            "max_tick_duration": 0.0,
+            "max_lag": 0.0,
+        }
+
+    def register(self, game_id, handler, on_failure=None):
+        """
+        Registra una partita: `handler(steps)` verrà chiamato ad ogni giro dello scheduler
+        con il numero di passi di simulazione da eseguire. `on_failure(error)` viene
+        chiamata (in un task a parte) se la partita viene fermata per tick falliti.
+        """
+        self.handlers[game_id] = handler
+        self.failures.pop(game_id, None)
+        if on_failure is not None:
+            self.failure_handlers[game_id] = on_failure
+        else:
+            self.failure_handlers.pop(game_id, None)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def unregister(self, game_id):
+        self.handlers.pop(game_id, None)
+        self.failure_handlers.pop(game_id, None)
+        self.failures.pop(game_id, None)
+
+    def is_registered(self, game_id):
+        return game_id in self.handlers
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        interval = self.tick_interval
+        next_tick = loop.time()
+        print(f"Tick scheduler started at {self.tick_rate} Hz")
+
+        while self.handlers:
+            lag = loop.time() - next_tick
+            if lag < 0:
+                # Risveglio anticipato rispetto alla scadenza
+                await asyncio.sleep(-lag)
+                continue
+
+            if lag > self.max_lag:
+                # Troppo indietro: scarta il backlog invece di recuperarlo
+                dropped = int(lag / interval)
+                self.stats["dropped_ticks"] += dropped
+                print(f"[WARNING] Tick scheduler is {lag * 1000:.1f} ms behind, dropping {dropped} ticks")
+                next_tick += dropped * interval
+                lag -= dropped * interval
+            self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+
+            # Passi dovuti: quello corrente più quelli da recuperare
+            steps = min(self.max_catchup_ticks, int(lag / interval) + 1)
+            self.stats["catchup_ticks"] += steps - 1
+
+            start = loop.time()
+            handlers = list(self.handlers.items())
+            results = await asyncio.gather(
+                *(handler(steps) for _, handler in handlers),
+                return_exceptions=True,
+            )
+            for (game_id, handler), result in zip(handlers, results):
+                if isinstance(result, Exception):
+                    self.tick_failed(game_id, handler, result)
+                elif game_id in self.failures:
+                    del self.failures[game_id]
+            duration = loop.time() - start
+
+            self.tick += steps
+            self.stats["ticks"] += steps
+            self.stats["last_tick_duration"] = duration
+            self.stats["max_tick_duration"] = max(self.stats["max_tick_duration"], duration)
+            if duration > interval:
+                self.stats["overruns"] += 1
+
+            next_tick += steps * interval
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Cede comunque il controllo agli altri task (receive, connect, ...)
+                await asyncio.sleep(0)
+
+        print("Tick scheduler stopped: no active games")
+
+    def tick_failed(self, game_id, handler, error):
+        print(f"[ERROR] Tick failed for game {game_id}: {error}")
+        self.stats["failed_ticks"] += 1
+        if self.handlers.get(game_id) is not handler:
+            return  # partita già rimossa (o registrata di nuovo) durante il tick
+        failures = self.failures[game_id] = self.failures.get(game_id, 0) + 1
+        if failures < self.max_failures:
+            return
+
+        print(f"[ERROR] Game {game_id} failed {failures} ticks in a row, stopping it")
+        self.stats["failed_games"] += 1
+        on_failure = self.failure_handlers.get(game_id)
+        self.unregister(game_id)
+        if on_failure is not None:
+            asyncio.create_task(self.run_failure_handler(game_id, on_failure, error))
+
+    async def run_failure_handler(self, game_id, on_failure, error):
+        try:
+            await on_failure(error)
+        except Exception as e:
+            print(f"[ERROR] Cleanup of failed game {game_id} failed: {e}")
+
+    def snapshot(self):
+        """
+        Restituisce le metriche correnti dello scheduler.
+        """
+        return {
+            "tick_rate": self.tick_rate,
+            "tick": self.tick,
+            "active_games": len(self.handlers),
+            "running": self.task is not None and not self.task.done(),
+            **self.stats,
+        }
+
+
+tick_scheduler = TickScheduler(
+    tick_rate=settings.PONG_TICK_RATE,
+    max_catchup_ticks=settings.PONG_MAX_CATCHUP_TICKS,
+    max_lag=settings.PONG_MAX_TICK_LAG,
+    max_failures=settings.PONG_MAX_TICK_FAILURES,
+)
@@ -0,0 +1,91 @@
+import time
+
+# Contatori globali del processo (esposti da GameStatsView)
+send_rate_stats = {
+    "sent": 0,
+    "skipped": 0,
+    "event_sends": 0,
+    "decreases": 0,
+    "increases": 0,
+}
+
+
+class SendRateController:
+    """
+    Decide a quali tick di simulazione una partita trasmette lo stato.
+
+    La simulazione gira a `tick_rate`; i frame partono a `rate` Hz, compreso tra
+    `min_rate` e `max_rate`. Ogni `adjust_interval` secondi la frequenza viene
+    adattata sul client più lento della partita: se il suo RTT o il tempo speso
+    a consegnargli un frame superano le soglie la frequenza scende (x `decrease`),
+    altrimenti risale di `increase` Hz. Gli eventi (urti sul paddle, punti)
+    forzano l'invio al tick stesso. Il RTT viene misurato con un ping ogni `ping_interval` secondi.
+    """
+
+    def __init__(self, tick_rate, min_rate, max_rate, ping_interval=2.0, rtt_threshold=0.15,
+                 send_time_threshold=0.005, adjust_interval=1.0, decrease=0.75, increase=5):
+        self.tick_rate = tick_rate
+        self.ping_interval = ping_interval
+        self.pinged_at = 0
+        self.max_rate = min(max_rate, tick_rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.rtt_threshold = rtt_threshold
+        self.send_time_threshold = send_time_threshold
+        self.adjust_interval = adjust_interval
+        self.decrease = decrease
+        self.increase = increase
+        self.rate = self.max_rate
+        self.interval = 1
+        self.ticks_since_send = 0
+        self.adjusted_at = time.monotonic()
+        self.update_interval()
+
+    def update_interval(self):
+        # Tick di simulazione tra due frame (l'ultimo tick di ogni intervallo viene inviato)
+        self.interval = max(1, round(self.tick_rate / self.rate))
+
+    def should_send(self, steps=1, force=False):
+        """
+        Registra `steps` tick simulati e restituisce True se questo è un tick di invio.
+        """
+        self.ticks_since_send += steps
+        if force or self.ticks_since_send >= self.interval:
+            self.ticks_since_send = 0
+            send_rate_stats["sent"] += 1
+            if force:
+                send_rate_stats["event_sends"] += 1
+            return True
+        send_rate_stats["skipped"] += 1
+        return False
+
+    def ping_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self.pinged_at < self.ping_interval:
+            return False
+        self.pinged_at = now
+        return True
+
+    def adjust(self, clients, now=None):
+        """
+        Adatta la frequenza di invio alle misure dei client (rtt e send_time, in secondi).
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.adjusted_at < self.adjust_interval or not clients:
+            return
+        self.adjusted_at = now
+
+        rtt = max((client.rtt or 0 for client in clients), default=0)
+        send_time = max((client.send_time for client in clients), default=0)
+        if rtt > self.rtt_threshold or send_time > self.send_time_threshold:
+            rate = max(self.min_rate, self.rate * self.decrease)
+            if rate < self.rate:
+                send_rate_stats["decreases"] += 1
+        else:
+            rate = min(self.max_rate, self.rate + self.increase)
+            if rate > self.rate:
+                send_rate_stats["increases"] += 1
+        self.rate = rate
+        self.update_interval()
+
+    def snapshot(self):
+        return {"rate": self.rate, "interval": self.interval}
@@ -0,0 +1,251 @@
+import asyncio
+import bisect
+import hashlib
+import time
+
+import redis.asyncio as redis
+from django.conf import settings
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ShardRouter:
+    """
+    Distribuisce le partite tra i processi pong_game.
+
+    Ogni processo si registra in Redis con il nome di un proprio channel process-local
+    e un heartbeat. Il proprietario di una partita è scelto con consistent hashing sul
+    game_id tra i worker vivi e poi fissato in Redis (SET NX), così i join successivi
+    trovano sempre lo stesso worker anche se nel frattempo ne sono arrivati altri.
+
+    Un socket che arriva su un worker diverso dal proprietario viene inoltrato:
+    il worker proprietario crea un GameConsumer "virtuale" che esegue tutta la logica
+    di gioco e rimanda i messaggi WebSocket al consumer di frontiera tramite il channel layer.
+    Il consumer di frontiera invia un heartbeat (relay.ping) ogni RELAY_HEARTBEAT_INTERVAL
+    secondi: una sessione senza messaggi per RELAY_TIMEOUT secondi (processo di frontiera
+    morto, socket chiuso senza relay.close) viene chiusa come una disconnessione.
+    """
+    WORKERS_KEY = "pong:workers"
+    OWNER_KEY = "pong:game_owner:{}"
+    OWNER_TTL = 3600
+    HEARTBEAT_INTERVAL = 5
+    WORKER_TTL = 15
+    RING_REFRESH = 5
+    VIRTUAL_NODES = 64
+    RELAY_HEARTBEAT_INTERVAL = 5
+    RELAY_TIMEOUT = 15
+
+    # Sostituisce il proprietario solo se è ancora quello (morto) letto in precedenza
+    REPLACE_OWNER_LUA = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        end
+        return redis.call('GET', KEYS[1])
+    """
+
+    def __init__(self, redis_url):
+        self.redis_url = redis_url
+        self.redis = None
+        self.channel_layer = None
+        self.consumer_class = None
+        self.worker_channel = None
+        self.start_lock = None
+        self.ring = []  # lista ordinata di (hash, worker)
+        self.live_workers = set()
+        self.ring_built_at = 0
+        self.relays = {}  # channel del consumer di frontiera -> RelaySession
+        self.handlers = {}  # altri tipi di messaggio ricevuti sul worker channel -> funzione
+        self.tasks = []
+        self.stats = {
+            "owned_lookups": 0,
+            "remote_lookups": 0,
+            "relays_opened": 0,
+            "relays_expired": 0,
+            "relayed_messages": 0,
+        }
+
+    async def start(self, channel_layer, consumer_class):
+        """
+        Registra questo processo come worker (una sola volta per processo).
+        """
+        if self.worker_channel:
+            return
+        if self.start_lock is None:
+            self.start_lock = asyncio.Lock()
+        async with self.start_lock:
+            if self.worker_channel:
+                return
+            self.redis = redis.Redis.from_url(self.redis_url)
+            self.channel_layer = channel_layer
+            self.consumer_class = consumer_class
+            # Stesso prefisso dei consumer: channels_redis riceve un'unica chiave per processo
+            worker_channel = await channel_layer.new_channel()
+            await self.redis.zadd(self.WORKERS_KEY, {worker_channel: time.time()})
+            self.worker_channel = worker_channel
+            self.tasks = [
+                asyncio.create_task(self.heartbeat_loop()),
+                asyncio.create_task(self.listen()),
+            ]
+            print(f"Pong worker registered as {worker_channel}")
+
+    def is_local(self, worker):
+        return worker == self.worker_channel
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            try:
+                now = time.time()
+                await self.redis.zadd(self.WORKERS_KEY, {self.worker_channel: now})
+                await self.redis.zremrangebyscore(self.WORKERS_KEY, 0, now - self.WORKER_TTL * 4)
+            except Exception as e:
+                print(f"[ERROR] Worker heartbeat failed: {e}")
+
+    async def refresh_ring(self):
+        now = time.time()
+        if self.ring and now - self.ring_built_at < self.RING_REFRESH:
+            return
+        members = await self.redis.zrangebyscore(self.WORKERS_KEY, now - self.WORKER_TTL, "+inf")
+        workers = {member.decode() for member in members} | {self.worker_channel}
+        self.live_workers = workers
+        self.ring = sorted(
+            (ring_hash(f"{worker}#{i}"), worker)
+            for worker in workers
+            for i in range(self.VIRTUAL_NODES)
+        )
+        self.ring_built_at = now
+
+    def preferred_owner(self, game_id):
+        index = bisect.bisect(self.ring, (ring_hash(game_id), ""))
+        return self.ring[index % len(self.ring)][1]
+
+    async def owner_of(self, game_id):
+        """
+        Restituisce il worker proprietario della partita, assegnandolo se necessario.
+        """
+        await self.refresh_ring()
+        key = self.OWNER_KEY.format(game_id)
+        owner = await self.redis.get(key)
+        owner = owner.decode() if owner else None
+
+        if owner is None or owner not in self.live_workers:
+            candidate = self.preferred_owner(game_id)
+            if owner is None:
+                await self.redis.set(key, candidate, nx=True, ex=self.OWNER_TTL)
+                owner = (await self.redis.get(key)).decode()
+            else:
+                # Il proprietario precedente non manda più heartbeat: la partita passa al nuovo
+                owner = (await self.redis.eval(
+                    self.REPLACE_OWNER_LUA, 1, key, owner, candidate, self.OWNER_TTL
+                )).decode()
+
+        self.stats["owned_lookups" if self.is_local(owner) else "remote_lookups"] += 1
+        return owner
+
+    async def listen(self):
+        """
+        Riceve i messaggi di relay destinati alle partite possedute da questo worker
+        e i messaggi per processo registrati in `handlers` (es. frame degli spettatori).
+        """
+        while True:
+            try:
+                message = await self.channel_layer.receive(self.worker_channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Worker channel receive failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            handler = self.handlers.get(message["type"])
+            if handler is not None:
+                try:
+                    handler(message)
+                except Exception as e:
+                    print(f"[ERROR] Worker message {message['type']} failed: {e}")
+                continue
+
+            channel = message.get("channel")
+            if message["type"] == "relay.open":
+                self.relays[channel] = RelaySession(self, channel, message)
+                self.stats["relays_opened"] += 1
+            session = self.relays.get(channel)
+            if session is None:
+                continue
+            session.queue.put_nowait(message)
+            self.stats["relayed_messages"] += 1
+
+    def snapshot(self):
+        return {
+            "worker": self.worker_channel,
+            "live_workers": len(self.live_workers),
+            "relays": len(self.relays),
+            **self.stats,
+        }
+
+
+class RelaySession:
+    """
+    GameConsumer virtuale ospitato dal worker proprietario per un socket connesso
+    a un altro worker. I messaggi vengono elaborati in ordine, come in un consumer normale.
+    """
+
+    def __init__(self, router, channel, open_message):
+        self.router = router
+        self.channel = channel
+        self.queue = asyncio.Queue()
+
+        consumer = router.consumer_class()
+        consumer.scope = {
+            "type": "websocket",
+            "url_route": {"kwargs": {"game_id": open_message["game_id"]}},
+            "query_string": open_message["query_string"],
+        }
+        consumer.channel_layer = router.channel_layer
+        consumer.channel_name = channel  # i messaggi di gruppo arrivano al consumer di frontiera
+        consumer.base_send = self.relay
+        self.consumer = consumer
+        self.task = asyncio.create_task(self.run())
+
+    async def relay(self, message):
+        """
+        Rimanda un messaggio ASGI (websocket.send / websocket.close) al consumer di frontiera.
+        """
+        await self.router.channel_layer.send(self.channel, {"type": "relay.message", "message": message})
+
+    async def run(self):
+        consumer = self.consumer
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(self.queue.get(), self.router.RELAY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # Né messaggi né heartbeat dal consumer di frontiera: il giocatore lascia la partita
+                    print(f"[WARNING] Relay for {self.channel} expired, disconnecting")
+                    self.router.stats["relays_expired"] += 1
+                    try:
+                        await consumer.disconnect(None)
+                    except Exception as e:
+                        print(f"[ERROR] Relay for {self.channel} failed: {e}")
+                    break
+                try:
+                    if message["type"] == "relay.ping":
+                        continue
+                    if message["type"] == "relay.open":
+                        consumer.setup_connection()
+                        consumer.match = message["match"]
+                        consumer.match_id = consumer.match["match_id"]
+                    elif message["type"] == "relay.receive":
+                        await consumer.receive(text_data=message["text"])
+                    elif message["type"] == "relay.close":
+                        await consumer.disconnect(message.get("code"))
+                        break
+                except Exception as e:
+                    print(f"[ERROR] Relay for {self.channel} failed: {e}")
+        finally:
+            self.router.relays.pop(self.channel, None)
+
+
+shard_router = ShardRouter(settings.CACHES["default"]["LOCATION"])
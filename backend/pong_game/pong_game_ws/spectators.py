@@ -0,0 +1,144 @@
+import asyncio
+import collections
+import time
+
+from django.conf import settings
+
+from .broadcast import EncodedFrame, group_members
+from .protocol import DeltaEncoder
+from .sharding import shard_router
+
+SPECTATOR_GROUP = "spectate_{}"
+
+
+class SpectatorHub:
+    """
+    Spettatori connessi a questo processo, per partita.
+
+    Il processo iscrive al gruppo `spectate_<game_id>` il proprio worker channel (uno per
+    processo, non uno per spettatore): il worker proprietario della partita invia quindi
+    un solo messaggio per processo e per frame, e qui viene distribuito alle code di invio
+    degli spettatori locali, che condividono un solo EncodedFrame (un formato viene
+    serializzato solo se qualche spettatore del processo lo usa).
+    """
+
+    def __init__(self, max_viewers=500):
+        self.max_viewers = max_viewers
+        self.viewers = collections.defaultdict(set)  # game_id -> consumer locali
+        self.total = 0
+        self.stats = {"joined": 0, "rejected": 0, "frames": 0, "deliveries": 0}
+        shard_router.handlers["spectator.frame"] = self.deliver_frame
+        shard_router.handlers["spectator.event"] = self.deliver_event
+
+    async def add(self, consumer):
+        """
+        Registra uno spettatore; False se il processo ha già raggiunto `max_viewers`
+        o se il worker channel non è attivo (shard_router non avviato).
+        """
+        if shard_router.worker_channel is None or self.total >= self.max_viewers:
+            self.stats["rejected"] += 1
+            return False
+        viewers = self.viewers[consumer.game_id]
+        viewers.add(consumer)
+        self.total += 1
+        self.stats["joined"] += 1
+        if len(viewers) == 1:
+            await consumer.channel_layer.group_add(SPECTATOR_GROUP.format(consumer.game_id), shard_router.worker_channel)
+        return True
+
+    async def remove(self, consumer):
+        viewers = self.viewers.get(consumer.game_id)
+        if not viewers or consumer not in viewers:
+            return
+        viewers.discard(consumer)
+        self.total -= 1
+        if not viewers:
+            del self.viewers[consumer.game_id]
+            if shard_router.worker_channel is None:
+                return
+            await consumer.channel_layer.group_discard(SPECTATOR_GROUP.format(consumer.game_id), shard_router.worker_channel)
+
+    def deliver_frame(self, message):
+        viewers = self.viewers.get(message["game_id"], ())
+        self.stats["frames"] += 1
+        if not viewers:
+            return
+        frame = EncodedFrame.from_message(message)
+        for consumer in viewers:
+            consumer.mailbox.put_frame(frame)
+        self.stats["deliveries"] += len(viewers)
+
+    def deliver_event(self, message):
+        # Messaggi di controllo (es. game_over): mai scartati, inviati dopo i frame già accodati
+        for consumer in self.viewers.get(message["game_id"], ()):
+            asyncio.create_task(consumer.send_json(message["event"]))
+
+    def snapshot(self):
+        return {
+            "viewers": self.total,
+            "max_viewers": self.max_viewers,
+            "games": len(self.viewers),
+            **self.stats,
+        }
+
+
+class SpectatorBroadcaster:
+    """
+    Frame degli spettatori di una partita, trasmessi dal worker proprietario.
+
+    Gli spettatori hanno un proprio DeltaEncoder e una frequenza fissa `rate` (di solito
+    più bassa di quella dei giocatori); urti, punti e fine partita vengono inviati subito.
+    Se nessun processo ha spettatori per la partita il frame non viene nemmeno codificato.
+    """
+    MEMBERSHIP_REFRESH = 1.0  # secondi tra due letture dei membri del gruppo
+
+    def __init__(self, channel_layer, game_id, tick_rate, rate):
+        self.channel_layer = channel_layer
+        self.game_id = game_id
+        self.group = SPECTATOR_GROUP.format(game_id)
+        self.encoder = DeltaEncoder()
+        self.interval = max(1, round(tick_rate / min(rate, tick_rate)))
+        self.ticks_since_send = 0
+        self.watched = False
+        self.refreshed_at = 0
+
+    async def refresh_membership(self):
+        now = time.monotonic()
+        if now - self.refreshed_at < self.MEMBERSHIP_REFRESH:
+            return
+        self.refreshed_at = now
+        try:
+            if hasattr(self.channel_layer, "remote_group_channels"):
+                remote = await self.channel_layer.remote_group_channels(self.group)
+                self.watched = bool(remote or self.channel_layer.local_groups.get(self.group))
+            else:
+                members = await group_members(self.channel_layer, self.group)
+                self.watched = members is None or bool(members)
+        except Exception as e:
+            print(f"[ERROR] Cannot read members of {self.group}: {e}")
+
+    async def tick(self, game, steps, force=False):
+        self.ticks_since_send += steps
+        if not force and self.ticks_since_send < self.interval:
+            return
+        self.ticks_since_send = 0
+        await self.refresh_membership()
+        if not self.watched:
+            return
+        state = game.snapshot()
+        frame = EncodedFrame(state, self.encoder.encode(state, game.frame_meta()))
+        await self.channel_layer.group_send(self.group, {
+            "type": "spectator.frame",
+            "game_id": self.game_id,
+            **frame.wire_message(),
+        })
+
+    async def send_event(self, event):
+        await self.channel_layer.group_send(self.group, {
+            "type": "spectator.event",
+            "game_id": self.game_id,
+            "event": event,
+        })
+
+
+spectator_hub = SpectatorHub(max_viewers=settings.PONG_MAX_SPECTATORS_PER_WORKER)
@@ -0,0 +1,54 @@
+class Ball:
+    __slots__ = ("x", "y", "dx", "dy")
+
+    def __init__(self, x, y, dx, dy):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+
+
+class Paddle:
+    __slots__ = ("y",)
+
+    def __init__(self, y):
+        self.y = y
+
+
+class GameState:
+    """
+    Stato interno di una partita: oggetti con __slots__ invece di dizionari annidati,
+    così il tick legge e scrive attributi senza lookup per chiave.
+
+    `to_wire()` produce la forma a dizionari usata da broadcast, protocolli e GameStateView;
+    `load()` fa l'operazione inversa.
+    """
+    __slots__ = ("ball", "left_paddle", "right_paddle", "left_score", "right_score")
+
+    def __init__(self, ball, left_paddle, right_paddle, left_score=0, right_score=0):
+        self.ball = ball
+        self.left_paddle = left_paddle
+        self.right_paddle = right_paddle
+        self.left_score = left_score
+        self.right_score = right_score
+
+    def to_wire(self):
+        ball = self.ball
+        return {
+            "ball": {"x": ball.x, "y": ball.y, "dx": ball.dx, "dy": ball.dy},
+            "left_paddle": {"y": self.left_paddle.y},
+            "right_paddle": {"y": self.right_paddle.y},
+            "left_score": self.left_score,
+            "right_score": self.right_score,
+        }
+
+    def load(self, state):
+        """
+        Copia uno stato nella forma di to_wire() (usato da test, replay e strumenti).
+        """
+        ball = state["ball"]
+        self.ball.x, self.ball.y, self.ball.dx, self.ball.dy = ball["x"], ball["y"], ball["dx"], ball["dy"]
+        self.left_paddle.y = state["left_paddle"]["y"]
+        self.right_paddle.y = state["right_paddle"]["y"]
+        self.left_score = state["left_score"]
+        self.right_score = state["right_score"]
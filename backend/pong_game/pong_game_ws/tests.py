@@ -1,3 +1,1363 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from channels.layers import InMemoryChannelLayer
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .auth_cache import TokenCache
+from .batch_engine import BatchPongEngine
+from .benchmark import compare_with_baseline, load_baseline, run_benchmark, save_baseline
+from .match_cache import MATCH_DESCRIPTOR_KEY, MATCH_STATUS_KEY, get_match_descriptor, set_match_status
+from .models import Match, PongUser, Tournament
+from .channel_layer import HybridChannelLayer
+from .consumers import GameConsumer
+from .broadcast import EncodedFrame, FrameBroadcaster, WIRE_BINARY, WIRE_DELTA, WIRE_JSON, broadcast_stats
+from .pong import PongGame
+from .protocol import BINARY_FRAME, DeltaEncoder, decode_binary, encode_binary
+from .replay import REPLAY_KEY, ReplayRecorder, ReplayStore, replay
+from .scheduler import TickScheduler
+from .mailbox import SendMailbox
+from .results import MatchResultWriter, locked_matches
+from .send_rate import SendRateController
+from .sharding import ShardRouter
+from .spectators import SPECTATOR_GROUP, SpectatorBroadcaster, SpectatorHub
+
+
+class FakeClock:
+    """
+    Orologio virtuale per il TickScheduler: sostituisce loop.time() e asyncio.sleep(),
+    che avanza il tempo della durata richiesta invece di aspettare davvero.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.real_sleep = asyncio.sleep
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += max(0.0, delay)
+        await self.real_sleep(0)
+
+
+class TickSchedulerTests(SimpleTestCase):
+    # A 64 Hz l'intervallo (1/64 s) e i suoi multipli sono esatti in virgola mobile
+    TICK_RATE = 64
+    INTERVAL = 1 / 64
+
+    def run_scheduler(self, calls, work=lambda call: 0.0, **kwargs):
+        """
+        Esegue lo scheduler con una sola partita per `calls` giri; `work(call)` è il tempo
+        simulato speso dal giro. Restituisce lo scheduler e la lista di (istante, passi).
+        """
+        scheduler = TickScheduler(tick_rate=self.TICK_RATE, **kwargs)
+        clock = FakeClock()
+        rounds = []
+
+        async def handler(steps):
+            rounds.append((clock.now, steps))
+            clock.now += work(len(rounds) - 1)
+            if len(rounds) == calls:
+                scheduler.unregister("game")
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, "time", clock.time), \
+                    mock.patch("pong_game_ws.scheduler.asyncio.sleep", clock.sleep):
+                scheduler.register("game", handler)
+                await scheduler.task
+
+        asyncio.run(scenario())
+        return scheduler, rounds
+
+    def test_work_time_does_not_accumulate_drift(self):
+        # Ogni giro consuma un quarto d'intervallo: le scadenze restano sulla griglia assoluta
+        scheduler, rounds = self.run_scheduler(100, work=lambda call: self.INTERVAL / 4)
+        self.assertEqual([at for at, _ in rounds], [i * self.INTERVAL for i in range(100)])
+        self.assertEqual({steps for _, steps in rounds}, {1})
+        self.assertEqual(scheduler.stats["overruns"], 0)
+        self.assertEqual(scheduler.tick, 100)
+
+    def test_late_round_is_caught_up_with_extra_steps(self):
+        # Il giro 10 dura 3.5 intervalli: il successivo recupera i 2 tick persi, poi si torna in griglia
+        def work(call):
+            return 3.5 * self.INTERVAL if call == 10 else 0.0
+        scheduler, rounds = self.run_scheduler(20, work=work)
+        steps = [steps for _, steps in rounds]
+        self.assertEqual(steps, [1] * 11 + [3] + [1] * 8)
+        self.assertEqual(rounds[12][0], 14 * self.INTERVAL)
+        self.assertEqual(scheduler.stats["catchup_ticks"], 2)
+        self.assertEqual(scheduler.stats["overruns"], 1)
+        self.assertEqual(scheduler.stats["dropped_ticks"], 0)
+        self.assertEqual(scheduler.tick, 22)
+
+    def test_catch_up_is_capped_per_round(self):
+        # 5.5 intervalli di ritardo con al più 3 passi per giro: il recupero si divide su due giri
+        def work(call):
+            return 6.5 * self.INTERVAL if call == 0 else 0.0
+        scheduler, rounds = self.run_scheduler(5, work=work, max_catchup_ticks=3)
+        self.assertEqual([steps for _, steps in rounds], [1, 3, 3, 1, 1])
+        self.assertEqual(scheduler.stats["catchup_ticks"], 4)
+        self.assertEqual(scheduler.stats["dropped_ticks"], 0)
+
+    def test_backlog_past_max_lag_is_dropped(self):
+        # 30 intervalli di stallo con max_lag di 8 intervalli: i tick persi vengono scartati
+        def work(call):
+            return 30 * self.INTERVAL if call == 0 else 0.0
+        scheduler, rounds = self.run_scheduler(4, work=work, max_lag=8 * self.INTERVAL)
+        self.assertEqual(scheduler.stats["dropped_ticks"], 29)
+        self.assertEqual(scheduler.stats["catchup_ticks"], 0)
+        self.assertEqual([steps for _, steps in rounds], [1, 1, 1, 1])
+        # Dopo lo scarto la griglia riparte dall'istante corrente, senza raffiche di recupero
+        self.assertEqual([at for at, _ in rounds[1:]], [30 * self.INTERVAL, 31 * self.INTERVAL, 32 * self.INTERVAL])
+        self.assertLessEqual(scheduler.stats["max_lag"], 8 * self.INTERVAL)
+
+    def run_failing(self, fail, calls, **kwargs):
+        """
+        Esegue lo scheduler con una partita il cui tick fallisce quando `fail(call)` è vero,
+        fermandolo dopo `calls` giri. Restituisce scheduler, giri eseguiti ed errori notificati.
+        """
+        scheduler = TickScheduler(tick_rate=self.TICK_RATE, **kwargs)
+        clock = FakeClock()
+        rounds = []
+        aborted = []
+
+        async def handler(steps):
+            rounds.append(clock.now)
+            if len(rounds) == calls:
+                scheduler.unregister("game")
+            if fail(len(rounds) - 1):
+                raise RuntimeError(f"tick {len(rounds) - 1}")
+
+        async def on_failure(error):
+            aborted.append(str(error))
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, "time", clock.time), \
+                    mock.patch("pong_game_ws.scheduler.asyncio.sleep", clock.sleep):
+                scheduler.register("game", handler, on_failure=on_failure)
+                await scheduler.task
+                await asyncio.sleep(0)  # lascia girare il task di on_failure
+
+        with mock.patch("builtins.print"):
+            asyncio.run(scenario())
+        return scheduler, rounds, aborted
+
+    def test_failing_game_is_stopped_after_consecutive_failures(self):
+        # Il tick fallisce sempre: dopo 3 fallimenti la partita viene rimossa e ripulita
+        scheduler, rounds, aborted = self.run_failing(lambda call: True, calls=100, max_failures=3)
+        self.assertEqual(len(rounds), 3)
+        self.assertEqual(aborted, ["tick 2"])
+        self.assertNotIn("game", scheduler.handlers)
+        self.assertEqual(scheduler.failures, {})
+        self.assertEqual(scheduler.stats["failed_ticks"], 3)
+        self.assertEqual(scheduler.stats["failed_games"], 1)
+        self.assertTrue(scheduler.task.done())
+
+    def test_occasional_failures_do_not_stop_the_game(self):
+        # Fallimenti isolati: il contatore si azzera ad ogni tick riuscito
+        scheduler, rounds, aborted = self.run_failing(lambda call: call % 3 != 0, calls=30, max_failures=3)
+        self.assertEqual(len(rounds), 30)
+        self.assertEqual(aborted, [])
+        self.assertEqual(scheduler.stats["failed_ticks"], 20)
+        self.assertEqual(scheduler.stats["failed_games"], 0)
+
+
+class BatchPongEngineParityTests(SimpleTestCase):
+    """
+    Verifica che BatchPongEngine produca le stesse traiettorie di PongGame
+    partendo dagli stessi stati e applicando gli stessi input.
+    """
+    # PongGame usa `x**2` (pow di libm) e NumPy una moltiplicazione: l'ultimo bit può differire
+    TOLERANCE = 1e-9
+
+    def make_games(self, rng, count):
+        games = []
+        for i in range(count):
+            game = PongGame(f"game-{i}")
+            game.game_loop_running = True
+            speed = rng.uniform(4, PongGame.MAX_SPEED)
+            ball = game.game_state.ball
+            ball.x = rng.uniform(100, PongGame.GAME_WIDTH - 100)
+            ball.y = rng.uniform(20, PongGame.GAME_HEIGHT - 20)
+            ball.dx = rng.choice([-1, 1]) * speed * rng.uniform(0.5, 1)
+            ball.dy = rng.uniform(-speed / 2, speed / 2)
+            games.append(game)
+        return games
+
+    def simulate(self, seed, count=32, ticks=2000, max_collisions=None):
+        rng = random.Random(seed)
+        games = self.make_games(rng, count)
+        engine = BatchPongEngine(capacity=4)  # forza anche la crescita degli array
+        if max_collisions is not None:
+            engine.MAX_COLLISIONS_PER_TICK = max_collisions
+        for game in games:
+            if max_collisions is not None:
+                game.MAX_COLLISIONS_PER_TICK = max_collisions
+            engine.add(game.game_id, game.snapshot())
+
+        async def run():
+            for tick in range(ticks):
+                for game in games:
+                    for side in ("left", "right"):
+                        direction = rng.choice(["up", "down", "stop", None, None, None])
+                        if direction:
+                            await game.process_input(side, {"action": "move", "direction": direction})
+                            engine.apply_input(game.game_id, side, direction)
+                    await game.update_game_state()
+                engine.step()
+                for game in games:
+                    self.assertStateEqual(game, engine, tick)
+
+        asyncio.run(run())
+        return games, engine
+
+    def assertStateEqual(self, game, engine, tick):
+        expected = game.snapshot()
+        actual = engine.state(game.game_id)
+        context = f"{game.game_id} tick {tick}"
+        self.assertEqual(expected["left_score"], actual["left_score"], context)
+        self.assertEqual(expected["right_score"], actual["right_score"], context)
+        self.assertEqual(game.game_over, engine.is_game_over(game.game_id), context)
+        for key in ("x", "y", "dx", "dy"):
+            self.assertAlmostEqual(expected["ball"][key], actual["ball"][key], delta=self.TOLERANCE, msg=context)
+        for paddle in ("left_paddle", "right_paddle"):
+            self.assertAlmostEqual(expected[paddle]["y"], actual[paddle]["y"], delta=self.TOLERANCE, msg=context)
+
+    def test_trajectories_match_pong_game(self):
+        for seed in (1, 2, 3):
+            with self.subTest(seed=seed):
+                self.simulate(seed)
+
+    def test_collision_cap_fallback_matches_pong_game(self):
+        # Con un solo urto per frame il limite scatta ad ogni rimbalzo: il resto del frame
+        # (senza urti, con la palla limitata al campo) deve coincidere nei due motori
+        games, _ = self.simulate(seed=5, count=16, ticks=3000, max_collisions=1)
+        self.assertTrue(any(game.game_state.left_score + game.game_state.right_score for game in games))
+
+    def test_scoring_and_game_over_match_pong_game(self):
+        games, engine = self.simulate(seed=42, count=16, ticks=6000)
+        self.assertTrue(any(game.game_over for game in games))
+        for game in games:
+            state = engine.state(game.game_id)
+            self.assertEqual((game.snapshot()["left_score"], game.snapshot()["right_score"]),
+                             (state["left_score"], state["right_score"]))
+
+    def test_step_returns_finished_games(self):
+        engine = BatchPongEngine()
+        state = PongGame("a").snapshot()
+        state["left_score"] = PongGame.WINNING_SCORE - 1
+        state["ball"].update({"x": PongGame.GAME_WIDTH + 5, "dx": 30, "dy": 0})
+        engine.add("a", state)
+        engine.add("b")
+
+        self.assertEqual(engine.step(), ["a"])
+        self.assertTrue(engine.is_game_over("a"))
+        self.assertFalse(engine.is_game_over("b"))
+
+    def test_removed_slot_is_reused(self):
+        engine = BatchPongEngine(capacity=2)
+        engine.add("a")
+        engine.add("b")
+        engine.remove("a")
+        engine.add("c")
+        self.assertEqual(len(engine), 2)
+        self.assertEqual(engine.slots["c"], 0)
+
+
+class ContinuousCollisionTests(SimpleTestCase):
+    def make_game(self, x, y, dx, dy, paddle_y=None):
+        game = PongGame("ccd")
+        game.game_loop_running = True
+        ball = game.game_state.ball
+        ball.x, ball.y, ball.dx, ball.dy = x, y, dx, dy
+        if paddle_y is not None:
+            game.game_state.left_paddle.y = game.game_state.right_paddle.y = paddle_y
+        return game
+
+    def run_ticks(self, game, ticks):
+        async def scenario():
+            for _ in range(ticks):
+                await game.update_game_state()
+        asyncio.run(scenario())
+
+    def test_fast_ball_never_tunnels_through_paddle(self):
+        # A MAX_SPEED la palla percorre 40px per frame, il doppio del paddle: a qualsiasi
+        # distanza di partenza e con qualsiasi punto d'impatto sul paddle deve rimbalzare
+        paddle_y = 250
+        for offset in range(0, 40):
+            for hit_y in range(paddle_y - PongGame.BALL_RADIUS, paddle_y + PongGame.PADDLE_HEIGHT + PongGame.BALL_RADIUS + 1, 7):
+                for side, direction in (("left", -1), ("right", 1)):
+                    with self.subTest(offset=offset, hit_y=hit_y, side=side):
+                        start_x = PongGame.GAME_WIDTH / 2 + direction * (300 + offset)
+                        game = self.make_game(start_x, hit_y, direction * PongGame.MAX_SPEED, 0, paddle_y)
+                        self.run_ticks(game, 10)
+                        self.assertEqual((game.snapshot()["left_score"], game.snapshot()["right_score"]), (0, 0))
+                        self.assertEqual(game.game_state.ball.dx * direction < 0, True)
+
+    def test_ball_missing_the_paddle_scores(self):
+        game = self.make_game(300, 100, -PongGame.MAX_SPEED, 0, paddle_y=400)
+        self.run_ticks(game, 8)  # al tick 8 la palla supera x = -BALL_RADIUS
+        self.assertEqual(game.snapshot()["right_score"], 1)
+        self.assertEqual(game.snapshot()["ball"]["x"], PongGame.GAME_WIDTH // 2)
+
+    def test_fast_diagonal_ball_crossing_the_paddle_bounces_within_the_frame(self):
+        # Nel frame la palla passerebbe oltre la faccia del paddle: rimbalza e usa il resto del frame
+        face = PongGame.PADDLE_WIDTH + PongGame.BALL_RADIUS
+        game = self.make_game(face + 5, 280, -PongGame.MAX_SPEED, 10, paddle_y=250)
+        self.run_ticks(game, 1)
+        ball = game.game_state.ball
+        self.assertGreater(ball.dx, 0)
+        self.assertGreater(ball.x, face)
+        self.assertTrue(game.events_pending)
+
+    def test_corner_hit_bounces_on_wall_and_paddle_in_one_frame(self):
+        # Verso l'angolo in alto a sinistra, con il paddle in cima: prima la parete, poi il paddle
+        face = PongGame.PADDLE_WIDTH + PongGame.BALL_RADIUS
+        game = self.make_game(face + 20, PongGame.BALL_RADIUS + 5, -30, -20, paddle_y=0)
+        self.run_ticks(game, 1)
+        ball = game.game_state.ball
+        self.assertGreater(ball.dx, 0)
+        self.assertTrue(game.events_pending)
+        self.assertGreaterEqual(ball.y, PongGame.BALL_RADIUS)
+        self.assertGreaterEqual(ball.x, face)
+        # Colpita sul bordo alto del paddle riparte verso la parete: rimbalza di nuovo senza uscire
+        self.run_ticks(game, 3)
+        self.assertGreaterEqual(ball.y, PongGame.BALL_RADIUS)
+        self.assertGreater(ball.x, face)
+        self.assertEqual((game.game_state.left_score, game.game_state.right_score), (0, 0))
+
+    def test_collision_cap_keeps_the_rest_of_the_frame(self):
+        game = self.make_game(400, PongGame.BALL_RADIUS + 5, 8, -10)
+        game.MAX_COLLISIONS_PER_TICK = 1  # la parete al tempo 0.5 esaurisce il limite
+        self.run_ticks(game, 1)
+        ball = game.game_state.ball
+        self.assertEqual(ball.x, 408)  # nessun rallentamento: tutto il dx del frame
+        self.assertEqual(ball.y, PongGame.BALL_RADIUS + 5)
+        self.assertGreater(ball.dy, 0)
+
+    def test_ball_stays_inside_walls(self):
+        game = self.make_game(400, 300, 3, 39, paddle_y=265)
+        for _ in range(200):
+            self.run_ticks(game, 1)
+            ball = game.game_state.ball
+            self.assertGreaterEqual(ball.y, PongGame.BALL_RADIUS)
+            self.assertLessEqual(ball.y, PongGame.GAME_HEIGHT - PongGame.BALL_RADIUS)
+
+
+class DeltaEncoderTests(SimpleTestCase):
+    def test_first_frame_is_keyframe_then_only_changes(self):
+        game = PongGame("a")
+        encoder = DeltaEncoder(keyframe_interval=3)
+
+        first = encoder.encode(game.snapshot())
+        self.assertEqual((first["type"], first["seq"], first["key"]), ("game_state", 1, True))
+
+        game.game_state.left_paddle.y += 12
+        delta = encoder.encode(game.snapshot())
+        self.assertEqual(delta["type"], "game_delta")
+        self.assertEqual(delta["seq"], 2)
+        self.assertEqual(delta["d"], {"lp": game.snapshot()["left_paddle"]["y"]})
+
+        self.assertEqual(encoder.encode(game.snapshot())["type"], "game_state")  # seq 3: keyframe periodico
+
+    def test_keyframe_reflects_last_encoded_frame(self):
+        game = PongGame("a")
+        encoder = DeltaEncoder()
+        self.assertIsNone(encoder.keyframe())
+
+        encoder.encode(game.snapshot())
+        game.game_state.right_score = 2
+        encoder.encode(game.snapshot())
+        keyframe = encoder.keyframe()
+        self.assertEqual(keyframe["seq"], 2)
+        self.assertEqual(keyframe["state"]["rs"], 2)
+
+
+class GameStateTests(SimpleTestCase):
+    def test_wire_projection_roundtrip(self):
+        game = PongGame("a")
+        state = game.snapshot()
+        state["ball"].update({"x": 10.5, "y": 20.25, "dx": -3.0, "dy": 1.0})
+        state["right_paddle"]["y"] = 100
+        state["right_score"] = 4
+        game.game_state.load(state)
+        self.assertEqual(game.snapshot(), state)
+        self.assertIsNot(game.snapshot(), game.snapshot())  # ogni chiamata restituisce una copia
+        with self.assertRaises(AttributeError):  # niente più scritture silenziose su una copia
+            game.state["left_score"] = 3
+
+    def test_reset_ball_reuses_the_slotted_ball(self):
+        game = PongGame("a")
+        ball = game.game_state.ball
+        ball.x = 5
+        game.reset_ball("left")
+        self.assertIs(game.game_state.ball, ball)
+        self.assertEqual((ball.x, ball.dx), (PongGame.GAME_WIDTH // 2, -6))
+        self.assertFalse(hasattr(ball, "__dict__"))
+
+
+class BinaryFrameTests(SimpleTestCase):
+    def test_roundtrip(self):
+        game = PongGame("a")
+        state = game.snapshot()
+        state["ball"].update({"x": 123.5, "y": 45.25, "dx": -7.5, "dy": 3.0})
+        state["left_score"] = 3
+        game.game_state.load(state)
+
+        data = encode_binary(game.snapshot(), 77, tick=1234, ack=(5, 9))
+        self.assertEqual(len(data), BINARY_FRAME.size)
+        seq, state, tick, ack = decode_binary(data)
+        self.assertEqual(seq, 77)
+        self.assertEqual(state, game.snapshot())
+        self.assertEqual((tick, ack), (1234, [5, 9]))
+
+
+class InputAckTests(SimpleTestCase):
+    def test_frames_carry_tick_and_last_processed_input(self):
+        game = PongGame("acks")
+        game.game_loop_running = True
+
+        async def scenario():
+            await game.process_input("left", {"action": "move", "direction": "up", "seq": 1})
+            await game.process_input("left", {"action": "move", "direction": "up", "seq": 2})
+            await game.process_input("right", {"action": "move", "direction": "down", "seq": 7})
+            # Ricevuto dopo il tick: confermato solo dal tick successivo
+            self.assertEqual(game.frame_meta()["ack"], [0, 0])
+            await game.update_game_state()
+            await game.process_input("left", {"action": "move", "direction": "up", "seq": 3})
+        asyncio.run(scenario())
+
+        meta = game.frame_meta()
+        self.assertEqual(meta, {"t": 1, "ack": [2, 7]})
+        keyframe = game.encoder.encode(game.snapshot(), meta)
+        self.assertEqual((keyframe["t"], keyframe["ack"]), (1, [2, 7]))
+
+    def test_invalid_or_stale_sequence_numbers_are_ignored(self):
+        game = PongGame("acks")
+        game.game_loop_running = True
+
+        async def scenario():
+            for seq in (5, "6", True, 3):
+                await game.process_input("left", {"action": "move", "direction": "up", "seq": seq})
+            await game.update_game_state()
+        asyncio.run(scenario())
+        self.assertEqual(game.input_acks["left"], 5)
+
+
+class FrameBroadcasterTests(SimpleTestCase):
+    class FakeClient:
+        def __init__(self, channel_name, wire_format):
+            self.channel_name = channel_name
+            self.wire_format = wire_format
+            self.sent = []
+
+        async def send_frame(self, frame):
+            self.sent.append(frame.encode(self.wire_format))
+
+    def test_frame_is_encoded_once_per_format(self):
+        game = PongGame("a")
+        clients = [
+            self.FakeClient("a", WIRE_JSON),
+            self.FakeClient("b", WIRE_JSON),
+            self.FakeClient("c", WIRE_DELTA),
+        ]
+        broadcaster = FrameBroadcaster(channel_layer=None, group="game_a")
+
+        asyncio.run(broadcaster.broadcast(clients, game.snapshot(), game.encoder.encode(game.snapshot())))
+
+        self.assertIs(clients[0].sent[0], clients[1].sent[0])
+        self.assertEqual(json.loads(clients[0].sent[0])["type"], "game_state")
+        self.assertEqual(json.loads(clients[2].sent[0])["seq"], 1)
+        self.assertEqual(broadcaster.remote_channels, [])
+
+    def test_remote_consumers_get_the_state_not_every_format(self):
+        game = PongGame("a")
+        layer = InMemoryChannelLayer()
+        broadcaster = FrameBroadcaster(channel_layer=layer, group="game_a")
+        clients = [self.FakeClient("a", WIRE_JSON)]
+        state = game.snapshot()
+        frame = game.encoder.encode(state, game.frame_meta())
+
+        async def scenario():
+            broadcaster.remote_channels = [await layer.new_channel()]
+            broadcaster.refreshed_at = time.monotonic()
+            encodings = broadcast_stats["encodings"]
+            await broadcaster.broadcast(clients, state, frame)
+            sent_encodings = broadcast_stats["encodings"] - encodings
+            return sent_encodings, await layer.receive(broadcaster.remote_channels[0])
+
+        encodings, message = asyncio.run(scenario())
+        # Serializzato solo il JSON del client locale; il consumer remoto riceve lo stato
+        self.assertEqual(encodings, 1)
+        self.assertEqual(message["type"], "game_frame")
+        remote = EncodedFrame.from_message(message)
+        self.assertEqual(remote.encode(WIRE_BINARY), EncodedFrame(state, frame).encode(WIRE_BINARY))
+        self.assertEqual(remote.encode(WIRE_JSON), clients[0].sent[0])
+
+
+class SendRateControllerTests(SimpleTestCase):
+    class FakeClient:
+        def __init__(self, rtt=None, send_time=0.0):
+            self.rtt = rtt
+            self.send_time = send_time
+
+    def test_sends_every_interval_and_immediately_on_events(self):
+        controller = SendRateController(tick_rate=120, min_rate=20, max_rate=30)
+        self.assertEqual(controller.interval, 4)
+        sent = [controller.should_send() for _ in range(8)]
+        self.assertEqual(sent, [False, False, False, True] * 2)
+        self.assertTrue(controller.should_send(force=True))
+        self.assertFalse(controller.should_send())
+
+    def test_rate_adapts_to_slowest_client(self):
+        controller = SendRateController(tick_rate=60, min_rate=20, max_rate=60)
+        slow = [self.FakeClient(rtt=0.02), self.FakeClient(rtt=0.3)]
+        for _ in range(9):
+            controller.adjust(slow, now=controller.adjusted_at + 1)
+        self.assertEqual(controller.rate, 20)
+        self.assertEqual(controller.interval, 3)
+
+        fast = [self.FakeClient(rtt=0.02), self.FakeClient()]
+        for _ in range(19):
+            controller.adjust(fast, now=controller.adjusted_at + 1)
+        self.assertEqual(controller.rate, 60)
+        self.assertEqual(controller.interval, 1)
+
+    def test_paddle_hit_and_score_flag_an_event(self):
+        game = PongGame("events")
+        game.game_loop_running = True
+        ball = game.game_state.ball
+        ball.x, ball.y, ball.dx, ball.dy = 35, 300, -10, 0
+        game.game_state.left_paddle.y = 265
+        asyncio.run(game.update_game_state())
+        self.assertTrue(game.events_pending)
+
+        game.events_pending = False
+        ball.x, ball.y, ball.dx, ball.dy = 400, 300, 5, 0
+        asyncio.run(game.update_game_state())
+        self.assertFalse(game.events_pending)
+
+        ball.x, ball.y, ball.dx, ball.dy = 5, 100, -20, 0
+        asyncio.run(game.update_game_state())
+        self.assertEqual(game.snapshot()["right_score"], 1)
+        self.assertTrue(game.events_pending)
+
+
+class SendMailboxTests(SimpleTestCase):
+    def run_mailbox(self, wire_format, scenario):
+        sent = []
+
+        async def slow_send(text_data=None, bytes_data=None):
+            await asyncio.sleep(0.01)
+            sent.append(json.loads(text_data))
+
+        async def main():
+            mailbox = SendMailbox(slow_send, wire_format)
+            await scenario(mailbox)
+            while mailbox.task and not mailbox.task.done():
+                await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        return sent
+
+    def frames(self, count):
+        game = PongGame("mailbox")
+        game.game_loop_running = True
+        frames = []
+        for _ in range(count):
+            asyncio.run(game.update_game_state())
+            state = game.snapshot()
+            frames.append(EncodedFrame(state, game.encoder.encode(state, game.frame_meta())))
+        return frames
+
+    def test_slow_client_gets_latest_frame_and_every_control_message(self):
+        frames = self.frames(5)
+
+        async def scenario(mailbox):
+            mailbox.put_frame(frames[0])
+            await asyncio.sleep(0)  # il primo frame è in invio
+            for frame in frames[1:4]:
+                mailbox.put_frame(frame)
+            control = asyncio.create_task(mailbox.send_control(json.dumps({"type": "game_over"})))
+            await asyncio.sleep(0)  # game_over accodato dopo il frame in attesa
+            mailbox.put_frame(frames[4])
+            await control
+
+        sent = self.run_mailbox(WIRE_JSON, scenario)
+        self.assertEqual([message["type"] for message in sent], ["game_state", "game_state", "game_over", "game_state"])
+        self.assertEqual([message.get("tick") for message in sent], [1, 4, None, 5])
+
+    def test_delta_client_gets_keyframe_after_dropped_frames(self):
+        frames = self.frames(4)
+
+        async def scenario(mailbox):
+            for frame in frames[:2]:
+                mailbox.put_frame(frame)
+                await asyncio.sleep(0.05)  # consegnati entrambi
+            mailbox.put_frame(frames[2])
+            await asyncio.sleep(0)
+            mailbox.put_frame(frames[3])
+            mailbox.put_frame(frames[3])
+
+        sent = self.run_mailbox(WIRE_DELTA, scenario)
+        self.assertEqual([message["seq"] for message in sent], [1, 2, 3, 4])
+        self.assertEqual([message["type"] for message in sent], ["game_state", "game_delta", "game_delta", "game_state"])
+        self.assertTrue(sent[3]["key"])
+        self.assertEqual(sent[3]["t"], 4)
+
+    def test_put_control_keeps_order_without_waiting(self):
+        frames = self.frames(2)
+
+        async def scenario(mailbox):
+            mailbox.put_frame(frames[0])
+            mailbox.put_control(json.dumps({"type": "ping", "id": 1}))
+            mailbox.put_frame(frames[1])
+            self.assertEqual(mailbox.pending(), 3)  # nulla è stato atteso
+
+        sent = self.run_mailbox(WIRE_JSON, scenario)
+        self.assertEqual([message["type"] for message in sent], ["game_state", "ping", "game_state"])
+
+    def test_ping_does_not_wait_for_a_stuck_socket(self):
+        consumer = GameConsumer()
+        consumer.scope = {"url_route": {"kwargs": {"game_id": "ping"}}, "query_string": b""}
+        consumer.setup_connection()
+
+        async def stuck_send(text_data=None, bytes_data=None):
+            await asyncio.Event().wait()
+
+        async def scenario():
+            consumer.mailbox.send = stuck_send
+            consumer.send_ping()
+            consumer.send_ping()
+            await asyncio.sleep(0.01)
+            queued = consumer.mailbox.pending()
+            consumer.mailbox.task.cancel()
+            return queued
+
+        self.assertEqual(asyncio.run(scenario()), 1)  # il primo ping è fermo nel socket, il secondo in coda
+        self.assertEqual(consumer.ping_id, 2)
+
+
+class SpectatorTests(SimpleTestCase):
+    class FakeLayer:
+        def __init__(self):
+            self.groups = set()
+
+        async def group_add(self, group, channel):
+            self.groups.add(group)
+
+        async def group_discard(self, group, channel):
+            self.groups.discard(group)
+
+    class FakeSpectator:
+        def __init__(self, game_id, channel_layer):
+            self.game_id = game_id
+            self.channel_layer = channel_layer
+            self.frames = []
+            self.mailbox = self
+
+        def put_frame(self, frame):
+            self.frames.append(frame)
+
+    @mock.patch("pong_game_ws.spectators.shard_router.worker_channel", "specific.worker!x")
+    def test_hub_caps_viewers_and_fans_out_once_per_frame(self):
+        layer = self.FakeLayer()
+        hub = SpectatorHub(max_viewers=2)
+        viewers = [self.FakeSpectator("final", layer) for _ in range(3)]
+
+        async def scenario():
+            return [await hub.add(viewer) for viewer in viewers]
+
+        self.assertEqual(asyncio.run(scenario()), [True, True, False])
+        self.assertEqual(layer.groups, {SPECTATOR_GROUP.format("final")})
+
+        game = PongGame("final")
+        hub.deliver_frame({
+            "type": "spectator.frame",
+            "game_id": "final",
+            **EncodedFrame(game.snapshot(), game.encoder.encode(game.snapshot())).wire_message(),
+        })
+        self.assertEqual([len(viewer.frames) for viewer in viewers], [1, 1, 0])
+        self.assertIs(viewers[0].frames[0], viewers[1].frames[0])
+        # Un solo EncodedFrame per processo: ogni formato serializzato al più una volta
+        self.assertIs(viewers[0].frames[0].encode(WIRE_JSON), viewers[1].frames[0].encode(WIRE_JSON))
+
+        for viewer in viewers[:2]:
+            asyncio.run(hub.remove(viewer))
+        self.assertEqual(hub.total, 0)
+        self.assertEqual(layer.groups, set())
+
+    @mock.patch("pong_game_ws.spectators.shard_router.worker_channel", None)
+    def test_hub_refuses_viewers_without_worker_channel(self):
+        layer = self.FakeLayer()
+        hub = SpectatorHub(max_viewers=2)
+        self.assertFalse(asyncio.run(hub.add(self.FakeSpectator("final", layer))))
+        self.assertEqual(hub.total, 0)
+        self.assertEqual(layer.groups, set())
+
+    def test_delta_spectator_resync_requests_a_keyframe(self):
+        consumer = GameConsumer()
+        consumer.scope = {
+            "url_route": {"kwargs": {"game_id": "final"}},
+            "query_string": b"role=spectator&proto=2",
+        }
+        consumer.setup_connection()
+        consumer.user = object()
+        asyncio.run(consumer.receive(json.dumps({"action": "move", "direction": "up"})))
+        self.assertFalse(consumer.mailbox.keyframe_next)
+        asyncio.run(consumer.receive(json.dumps({"action": "resync"})))
+        self.assertTrue(consumer.mailbox.keyframe_next)
+
+    def test_broadcaster_sends_at_spectator_rate_and_on_events(self):
+        layer = InMemoryChannelLayer()
+        game = PongGame("final")
+        game.game_loop_running = True
+        broadcaster = SpectatorBroadcaster(layer, "final", tick_rate=60, rate=20)
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.group_add(SPECTATOR_GROUP.format("final"), channel)
+            for _ in range(6):
+                await game.update_game_state()
+                await broadcaster.tick(game, 1)
+            await broadcaster.tick(game, 1, force=True)
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(layer.receive(channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+
+        messages = asyncio.run(scenario())
+        self.assertEqual(len(messages), 3)
+        frames = [EncodedFrame.from_message(message) for message in messages]
+        self.assertEqual(json.loads(frames[0].encode(WIRE_DELTA))["type"], "game_state")
+        self.assertEqual(json.loads(frames[1].encode(WIRE_DELTA))["type"], "game_delta")
+        self.assertEqual(json.loads(frames[1].encode(WIRE_JSON))["tick"], 6)
+
+
+def fake_redis_layer(server, **kwargs):
+    """
+    HybridChannelLayer che parla con un server fakeredis (un layer = un processo daphne).
+    """
+    layer = HybridChannelLayer(hosts=["redis://fake"], **kwargs)
+    connection = fakeredis.FakeAsyncRedis(server=server)
+    layer.connection = lambda index: connection
+    return layer
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class HybridChannelLayerTests(SimpleTestCase):
+    def run_layers(self, scenario, *layers):
+        async def main():
+            try:
+                return await scenario()
+            finally:
+                for layer in layers:
+                    for task in layer.remote_receives.values():
+                        task.cancel()
+                    await asyncio.gather(*layer.remote_receives.values(), return_exceptions=True)
+
+        return asyncio.run(main())
+
+    def test_every_local_member_receives_group_messages(self):
+        layer = fake_redis_layer(fakeredis.FakeServer())
+
+        async def scenario():
+            channels = [await layer.new_channel() for _ in range(2)]
+            for channel in channels:
+                await layer.group_add("game_a", channel)
+            # Entrambi i consumer sono già in receive: uno dei due detiene il receive lock nel BZPOPMIN
+            receives = [asyncio.ensure_future(layer.receive(channel)) for channel in channels]
+            await asyncio.sleep(0.05)
+            await layer.group_send("game_a", {"type": "players.update", "n": 1})
+            await layer.group_send("game_a", {"type": "players.update", "n": 2})
+            first = await asyncio.wait_for(asyncio.gather(*receives), 1)
+            second = await asyncio.wait_for(asyncio.gather(*(layer.receive(c) for c in channels)), 1)
+            return first, second
+
+        first, second = self.run_layers(scenario, layer)
+        self.assertEqual([message["n"] for message in first], [1, 1])
+        self.assertEqual([message["n"] for message in second], [2, 2])
+        self.assertEqual(layer.stats["local_deliveries"], 4)
+        self.assertEqual(layer.stats["remote_deliveries"], 0)
+
+    def test_remote_members_receive_through_redis(self):
+        server = fakeredis.FakeServer()
+        sender, other = fake_redis_layer(server), fake_redis_layer(server)
+
+        async def scenario():
+            local = await sender.new_channel()
+            remote = await other.new_channel()
+            await sender.group_add("game_a", local)
+            await other.group_add("game_a", remote)
+            await sender.group_send("game_a", {"type": "game.over", "winner": "left"})
+            return (
+                await asyncio.wait_for(sender.receive(local), 1),
+                await asyncio.wait_for(other.receive(remote), 1),
+            )
+
+        local_message, remote_message = self.run_layers(scenario, sender, other)
+        self.assertEqual(local_message, {"type": "game.over", "winner": "left"})
+        self.assertEqual(remote_message, {"type": "game.over", "winner": "left"})
+        self.assertEqual(sender.stats["local_deliveries"], 1)
+        self.assertEqual(sender.stats["remote_deliveries"], 1)
+
+    def test_remote_membership_is_cached_for_ttl(self):
+        server = fakeredis.FakeServer()
+        sender, other = fake_redis_layer(server, membership_ttl=0.1), fake_redis_layer(server)
+
+        async def scenario():
+            first = await other.new_channel()
+            await other.group_add("game_a", first)
+            before = await sender.remote_group_channels("game_a")
+            second = await other.new_channel()
+            await other.group_add("game_a", second)
+            cached = await sender.remote_group_channels("game_a")
+            await asyncio.sleep(0.15)
+            expired = await sender.remote_group_channels("game_a")
+            return [first], before, cached, sorted([first, second]), sorted(expired)
+
+        expected_before, before, cached, expected_after, expired = self.run_layers(scenario, sender, other)
+        self.assertEqual(before, expected_before)
+        self.assertEqual(cached, expected_before)
+        self.assertEqual(expired, expected_after)
+        self.assertEqual(sender.stats["membership_refreshes"], 2)
+
+    def test_remote_channel_added_here_receives_the_next_group_send(self):
+        server = fakeredis.FakeServer()
+        owner, frontier = fake_redis_layer(server, membership_ttl=60), fake_redis_layer(server)
+
+        async def scenario():
+            player = await frontier.new_channel()
+            await owner.group_add("game_a", player)
+            await owner.group_send("game_a", {"type": "players.update", "n": 1})  # cache con il solo player
+            # Il consumer virtuale dell'owner aggiunge il relay del frontier al gruppo
+            relay = await frontier.new_channel()
+            await owner.group_add("game_a", relay)
+            await owner.group_send("game_a", {"type": "wait.ready", "n": 2})
+            received = await asyncio.wait_for(frontier.receive(relay), 1)
+            await owner.group_discard("game_a", relay)
+            remaining = await owner.remote_group_channels("game_a")
+            return received, remaining, [player]
+
+        received, remaining, expected = self.run_layers(scenario, owner, frontier)
+        self.assertEqual(received, {"type": "wait.ready", "n": 2})
+        self.assertEqual(remaining, expected)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis non installato")
+class ShardRouterTests(SimpleTestCase):
+    class EchoConsumer:
+        """
+        Consumer minimo per RelaySession: risponde a ogni messaggio in maiuscolo.
+        """
+        def setup_connection(self):
+            self.closed = False
+
+        async def receive(self, text_data):
+            await self.base_send({"type": "websocket.send", "text": text_data.upper()})
+
+        async def disconnect(self, code):
+            self.closed = True
+
+    def run_workers(self, scenario, count=2):
+        server = fakeredis.FakeServer()
+
+        async def main():
+            routers = []
+            with mock.patch("pong_game_ws.sharding.redis.Redis.from_url",
+                            lambda url: fakeredis.FakeAsyncRedis(server=server)):
+                for _ in range(count):
+                    router = ShardRouter("redis://fake")
+                    await router.start(fake_redis_layer(server), self.EchoConsumer)
+                    routers.append(router)
+            try:
+                return await scenario(routers)
+            finally:
+                for router in routers:
+                    for task in router.tasks:
+                        task.cancel()
+                    await asyncio.gather(*router.tasks, return_exceptions=True)
+                    remote = router.channel_layer.remote_receives.values()
+                    for task in remote:
+                        task.cancel()
+                    await asyncio.gather(*remote, return_exceptions=True)
+
+        return asyncio.run(main())
+
+    def test_workers_agree_on_the_preferred_owner(self):
+        async def scenario(routers):
+            owners = []
+            for i in range(32):
+                owners.append([await router.owner_of(f"g{i}") for router in routers])
+            return owners, [routers[0].preferred_owner(f"g{i}") for i in range(32)], routers
+
+        owners, preferred, routers = self.run_workers(scenario)
+        workers = {router.worker_channel for router in routers}
+        for (first, second), expected in zip(owners, preferred):
+            self.assertEqual(first, second)
+            self.assertEqual(first, expected)
+        self.assertEqual({owner for owner, _ in owners}, workers)
+
+    def test_owner_is_kept_when_new_workers_join(self):
+        async def scenario(routers):
+            owner = await routers[0].owner_of("g1")
+            # Entra un nuovo worker che il ring ora preferirebbe per g1
+            routers[0].live_workers.add("specific.other!x")
+            routers[0].ring = [(0, "specific.other!x")]
+            return owner, routers[0].preferred_owner("g1"), await routers[0].owner_of("g1")
+
+        first, preferred, second = self.run_workers(scenario)
+        self.assertEqual(preferred, "specific.other!x")
+        self.assertEqual(first, second)
+
+    def test_dead_owner_is_replaced_once(self):
+        async def scenario(routers):
+            key = ShardRouter.OWNER_KEY.format("g1")
+            await routers[0].redis.set(key, "specific.dead!x")
+            owners = await asyncio.gather(*(router.owner_of("g1") for router in routers))
+            # Un secondo sostituto in ritardo non scavalca quello già scelto
+            late = await routers[1].redis.eval(
+                ShardRouter.REPLACE_OWNER_LUA, 1, key, "specific.dead!x", "specific.late!x", 60,
+            )
+            return owners, late.decode(), routers[0].preferred_owner("g1")
+
+        owners, late, preferred = self.run_workers(scenario)
+        self.assertEqual(owners, [preferred, preferred])
+        self.assertEqual(late, preferred)
+
+    def test_relay_round_trip(self):
+        async def scenario(routers):
+            owner, frontier = routers
+            channel = await frontier.channel_layer.new_channel()
+            await frontier.channel_layer.send(owner.worker_channel, {
+                "type": "relay.open", "channel": channel, "game_id": "g1",
+                "query_string": b"", "match": {"match_id": 1},
+            })
+            await frontier.channel_layer.send(owner.worker_channel, {
+                "type": "relay.receive", "channel": channel, "text": "ping",
+            })
+            reply = await asyncio.wait_for(frontier.channel_layer.receive(channel), 2)
+            session = owner.relays[channel]
+            await frontier.channel_layer.send(owner.worker_channel, {
+                "type": "relay.close", "channel": channel, "code": 1000,
+            })
+            await asyncio.wait_for(session.task, 2)
+            return reply, session.consumer, owner
+
+        reply, consumer, owner = self.run_workers(scenario)
+        self.assertEqual(reply, {"type": "relay.message", "message": {"type": "websocket.send", "text": "PING"}})
+        self.assertEqual(consumer.match_id, 1)
+        self.assertTrue(consumer.closed)
+        self.assertEqual(owner.relays, {})
+        self.assertEqual(owner.stats["relays_opened"], 1)
+
+    def test_relay_without_heartbeats_expires_as_a_disconnect(self):
+        async def scenario(routers):
+            owner, frontier = routers
+            owner.RELAY_TIMEOUT = 0.2
+            channel = await frontier.channel_layer.new_channel()
+            await frontier.channel_layer.send(owner.worker_channel, {
+                "type": "relay.open", "channel": channel, "game_id": "g1",
+                "query_string": b"", "match": {"match_id": 1},
+            })
+            # Finché arrivano gli heartbeat la sessione resta aperta
+            for _ in range(6):
+                await asyncio.sleep(0.08)
+                await frontier.channel_layer.send(owner.worker_channel, {"type": "relay.ping", "channel": channel})
+            session = owner.relays[channel]
+            alive = not session.task.done() and not session.consumer.closed
+            # Il processo di frontiera muore: nessun heartbeat né relay.close
+            await asyncio.wait_for(session.task, 2)
+            return alive, session.consumer, owner
+
+        alive, consumer, owner = self.run_workers(scenario)
+        self.assertTrue(alive)
+        self.assertTrue(consumer.closed)
+        self.assertEqual(owner.relays, {})
+        self.assertEqual(owner.stats["relays_expired"], 1)
+
+
+class MatchResultWriterTests(SimpleTestCase):
+    def test_updates_are_applied_in_order(self):
+        writer = MatchResultWriter()
+        match = Match(id=1, status='created')
+        changed = writer.apply(match, [
+            {"status": "in_game", "winner_id": None, "loser_id": None},
+            {"status": "aborted", "winner_id": None, "loser_id": None},
+        ])
+        self.assertTrue(changed)
+        self.assertEqual(match.status, 'aborted')
+
+    def test_finished_match_is_not_overwritten(self):
+        writer = MatchResultWriter()
+        match = Match(id=1, status='aborted')
+        changed = writer.apply(match, [{"finished": True, "points_player_1": 5, "points_player_2": 3}])
+        self.assertFalse(changed)
+        self.assertEqual(match.status, 'aborted')
+        self.assertIsNone(match.points_player_1)
+
+
+    def test_lock_is_only_on_the_match_table(self):
+        # In produzione il database è PostgreSQL: FOR UPDATE sui LEFT OUTER JOIN dei FK nullable
+        # viene rifiutato, il lock deve limitarsi alla riga del match
+        postgres = PostgresDatabaseWrapper({**connection.settings_dict, "ENGINE": "django.db.backends.postgresql"}, "pg")
+        with mock.patch.object(postgres, "get_autocommit", return_value=False):
+            sql, _ = locked_matches().filter(pk=1).query.get_compiler(connection=postgres).as_sql()
+        self.assertIn("LEFT OUTER JOIN", sql)
+        self.assertTrue(sql.endswith(f'FOR UPDATE OF {postgres.ops.quote_name(Match._meta.db_table)}'))
+
+
+class MatchResultWriterDatabaseTests(TransactionTestCase):
+    """
+    write_batch sul database di test. I modelli sono unmanaged (le tabelle appartengono
+    a user_mgmt), quindi le tabelle vengono create qui.
+    """
+
+    MODELS = (PongUser, Tournament, Match)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+        super().tearDownClass()
+
+    def tearDown(self):
+        # Il flush di TransactionTestCase salta le tabelle unmanaged
+        for model in reversed(self.MODELS):
+            model.objects.all().delete()
+
+    def test_batch_is_written_per_match(self):
+        alice = PongUser.objects.create(username="alice", trophies=10)
+        bob = PongUser.objects.create(username="bob", trophies=1)
+        finished = Match.objects.create(player_1=alice, player_2=bob, status="in_game")
+        aborted = Match.objects.create(player_1=alice, player_2=bob, status="created")
+
+        written, failed = MatchResultWriter().write_batch([
+            (finished.id, {"finished": True, "points_player_1": 5, "points_player_2": 3}),
+            (aborted.id, {"status": "aborted", "winner_id": None, "loser_id": None}),
+            (9999, {"status": "in_game"}),
+        ])
+
+        self.assertEqual((written, failed), (2, 1))
+        finished.refresh_from_db()
+        aborted.refresh_from_db()
+        self.assertEqual((finished.status, finished.winner_id, finished.loser_id), ("finished", alice.id, bob.id))
+        self.assertEqual(aborted.status, "aborted")
+        # Signal post_save: trofei aggiornati nella transazione del match
+        alice.refresh_from_db()
+        bob.refresh_from_db()
+        self.assertEqual((alice.trophies, bob.trophies), (13, 0))
+
+    def test_failing_match_does_not_undo_the_others(self):
+        alice = PongUser.objects.create(username="alice")
+        bob = PongUser.objects.create(username="bob")
+        first = Match.objects.create(player_1=alice, player_2=bob, status="created")
+        second = Match.objects.create(player_1=alice, player_2=bob, status="created")
+        writer = MatchResultWriter()
+        apply = writer.apply
+
+        def apply_or_fail(match, match_updates):
+            if match.id == first.id:
+                raise ValueError("boom")
+            return apply(match, match_updates)
+
+        with mock.patch.object(writer, "apply", apply_or_fail):
+            written, failed = writer.write_batch([
+                (first.id, {"status": "in_game"}),
+                (second.id, {"status": "in_game"}),
+            ])
+
+        self.assertEqual((written, failed), (1, 1))
+        self.assertEqual(Match.objects.get(pk=second.id).status, "in_game")
+        self.assertEqual(Match.objects.get(pk=first.id).status, "created")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MatchDescriptorTests(SimpleTestCase):
+    # SimpleTestCase vieta le query: il descrittore deve arrivare solo dalla cache
+    def test_descriptor_is_read_from_cache(self):
+        descriptor = {"match_id": 7, "status": "created", "player_1_id": 1, "player_2_id": 2}
+        cache.set(MATCH_DESCRIPTOR_KEY.format("abc"), descriptor)
+        self.assertEqual(get_match_descriptor("abc"), descriptor)
+
+        set_match_status("abc", "finished")
+        self.assertEqual(get_match_descriptor("abc")["status"], "finished")
+        self.assertEqual(cache.get(MATCH_DESCRIPTOR_KEY.format("abc"))["status"], "created")
+
+    def test_status_written_by_matchmaking_wins(self):
+        # Es. torneo annullato: il matchmaking riscrive solo la chiave di stato
+        cache.set(MATCH_DESCRIPTOR_KEY.format("def"), {"match_id": 8, "status": "created"})
+        cache.set(MATCH_STATUS_KEY.format("def"), "aborted")
+        self.assertEqual(get_match_descriptor("def")["status"], "aborted")
+
+    def test_unknown_game_returns_none(self):
+        self.assertIsNone(get_match_descriptor("missing"))
+
+
+class TokenCacheTests(SimpleTestCase):
+    def make_token(self):
+        token = AccessToken()
+        token["user_id"] = 1
+        return str(token), token.payload
+
+    def test_cached_token_returns_user_snapshot(self):
+        tokens = TokenCache()
+        raw, claims = self.make_token()
+        self.assertIsNone(tokens.get(raw))
+
+        tokens.put(raw, claims, PongUser(id=1, username="alice", trophies=30, profile_image="a.png"))
+        cached_claims, user = tokens.get(raw)
+        self.assertEqual(cached_claims["jti"], claims["jti"])
+        self.assertEqual((user.id, user.username, user.trophies), (1, "alice", 30))
+
+    def test_tampered_token_with_same_jti_misses(self):
+        tokens = TokenCache()
+        raw, claims = self.make_token()
+        tokens.put(raw, claims, PongUser(id=1, username="alice"))
+        header, payload, signature = raw.split(".")
+        self.assertIsNone(tokens.get(f"{header}.{payload}.{signature[::-1]}"))
+
+    def test_lru_eviction(self):
+        tokens = TokenCache(max_size=2)
+        issued = [self.make_token() for _ in range(3)]
+        for raw, claims in issued:
+            tokens.put(raw, claims, PongUser(id=1, username="alice"))
+        self.assertIsNone(tokens.get(issued[0][0]))
+        self.assertIsNotNone(tokens.get(issued[2][0]))
+        self.assertEqual(tokens.stats["evictions"], 1)
+
+
+class ReadinessTests(SimpleTestCase):
+    def test_move_before_start_signals_ready(self):
+        async def scenario():
+            game = PongGame("ready")
+            game.loop = asyncio.get_running_loop()
+            waiter = asyncio.create_task(game.ready_changed.wait())
+            await game.process_input("left", {"action": "move", "direction": "up"})
+            await asyncio.wait_for(waiter, timeout=1)
+            return game
+
+        game = asyncio.run(scenario())
+        self.assertEqual(game.ready, {"left": True, "right": False})
+
+    def test_ready_from_another_thread_wakes_the_loop(self):
+        async def scenario():
+            game = PongGame("ready")
+            game.loop = asyncio.get_running_loop()
+            # Come GameStateView.post: input elaborato in un altro thread con un proprio loop
+            await asyncio.to_thread(asyncio.run, game.process_input("right", {"action": "move"}))
+            await asyncio.wait_for(game.ready_changed.wait(), timeout=1)
+            return game
+
+        self.assertTrue(asyncio.run(scenario()).ready["right"])
+
+
+class InputQueueTests(SimpleTestCase):
+    def run_tick(self, game, messages):
+        async def scenario():
+            for direction in messages:
+                await game.process_input("left", {"action": "move", "direction": direction})
+            await game.update_game_state()
+        asyncio.run(scenario())
+
+    def make_game(self):
+        game = PongGame("inputs")
+        game.game_loop_running = True
+        ball = game.game_state.ball
+        ball.x, ball.y, ball.dx, ball.dy = 400, 300, 1, 0
+        return game
+
+    def test_paddle_moves_once_per_tick_in_latest_direction(self):
+        game = self.make_game()
+        start = game.snapshot()["left_paddle"]["y"]
+        self.run_tick(game, ["up", "up", "down"])
+        self.assertEqual(game.snapshot()["left_paddle"]["y"], start + PongGame.PADDLE_SPEED)
+        self.assertEqual(game.input_stats["coalesced"], 2)
+
+    def test_spam_is_rate_limited(self):
+        game = self.make_game()
+        start = game.snapshot()["left_paddle"]["y"]
+        self.run_tick(game, ["up"] * 50)
+        self.assertEqual(game.snapshot()["left_paddle"]["y"], start - PongGame.PADDLE_SPEED)
+        self.assertEqual(game.input_stats["rate_limited"], 50 - PongGame.MAX_INPUTS_PER_TICK)
+
+    def trajectory(self, game, messages_per_tick):
+        positions = []
+        for messages in messages_per_tick:
+            self.run_tick(game, messages)
+            positions.append(game.game_state.left_paddle.y)
+        return positions
+
+    def test_jittered_arrival_gives_the_same_trajectory(self):
+        # Il client invia un messaggio per frame, ma la rete ne raggruppa due in un tick e nessuno nel successivo
+        steady = [["up"]] * 12 + [["stop"]] + [[]] * 3
+        jittered = [["up"], ["up", "up"], [], ["up"], [], [], ["up", "up", "up"], ["up"], [], ["up"], ["up"], [],
+                    ["stop"]] + [[]] * 3
+        expected = self.trajectory(self.make_game(), steady)
+        self.assertEqual(self.trajectory(self.make_game(), jittered), expected)
+        start = PongGame.GAME_HEIGHT // 2 - PongGame.PADDLE_HEIGHT // 2
+        self.assertEqual(expected[11], start - 12 * PongGame.PADDLE_SPEED)
+        self.assertEqual(expected[12:], [expected[11]] * 4)  # "stop" ferma subito il paddle
+
+    def test_held_direction_expires_without_new_messages(self):
+        game = self.make_game()
+        positions = self.trajectory(game, [["down"]] + [[]] * (PongGame.HOLD_TICKS + 2))
+        start = PongGame.GAME_HEIGHT // 2 - PongGame.PADDLE_HEIGHT // 2
+        self.assertEqual(positions[PongGame.HOLD_TICKS - 1], start + PongGame.HOLD_TICKS * PongGame.PADDLE_SPEED)
+        self.assertEqual(positions[-1], positions[PongGame.HOLD_TICKS - 1])
+        self.assertIsNone(game.held["left"])
+
+
+class ReplayTests(SimpleTestCase):
+    class MemoryStore:
+        def __init__(self):
+            self.entries = []
+
+        def append(self, game_id, entry, reset=False):
+            self.entries.append(json.loads(json.dumps(entry)))
+
+    def record_match(self, store, seed, max_ticks=20000):
+        rng = random.Random(seed)
+        game = PongGame("recorded")
+        game.recorder = ReplayRecorder(store, game, chunk_size=50)
+        game.game_loop_running = True
+
+        async def play():
+            while not game.game_over and game.tick < max_ticks:
+                for side in ("left", "right"):
+                    for _ in range(rng.randint(0, 3)):
+                        direction = rng.choice(["up", "down", "stop"])
+                        await game.process_input(side, {"action": "move", "direction": direction})
+                await game.update_game_state()
+        asyncio.run(play())
+        game.recorder.finish(game)
+        return game
+
+    def test_replay_reproduces_recorded_match(self):
+        store = self.MemoryStore()
+        game = self.record_match(store, 7)
+
+        replayed, end, _ = asyncio.run(replay(store.entries))
+        self.assertEqual(replayed.tick, game.tick)
+        self.assertEqual(replayed.snapshot(), game.snapshot())
+        self.assertTrue(game.game_over)
+        self.assertEqual(end["ticks"], game.tick)
+
+    def test_recreated_game_replays_only_the_last_recording(self):
+        # Il MemoryStore ignora `reset`, come uno stream letto prima del DEL: vale l'ultimo "start"
+        store = self.MemoryStore()
+        self.record_match(store, 3, max_ticks=500)
+        game = self.record_match(store, 7)
+
+        replayed, end, _ = asyncio.run(replay(store.entries))
+        self.assertEqual(replayed.snapshot(), game.snapshot())
+        self.assertEqual(end["ticks"], game.tick)
+
+    @unittest.skipIf(fakeredis is None, "fakeredis non installato")
+    def test_start_entry_resets_the_stream(self):
+        connection = fakeredis.FakeAsyncRedis()
+        store = ReplayStore("redis://fake", ttl=60)
+        store.redis = connection
+
+        async def scenario():
+            for seed in (1, 2):
+                store.append("g1", {"type": "start", "seed": seed}, reset=True)
+                store.append("g1", {"type": "inputs", "inputs": [[1, "u", ""]]})
+            while store.queue.qsize():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            store.task.cancel()
+            return [json.loads(fields[b"entry"]) for _, fields in await connection.xrange(REPLAY_KEY.format("g1"))]
+
+        entries = asyncio.run(scenario())
+        self.assertEqual([entry["type"] for entry in entries], ["start", "inputs"])
+        self.assertEqual(entries[0]["seed"], 2)
+
+    def run_command(self, entries):
+        out = io.StringIO()
+        with mock.patch("pong_game_ws.management.commands.replay_match.replay_store.load", return_value=entries):
+            call_command("replay_match", "recorded", stdout=out)
+        return out.getvalue()
+
+    def test_command_reports_a_matching_replay(self):
+        store = self.MemoryStore()
+        self.record_match(store, 7)
+        self.assertIn("Replay matches the recorded result", self.run_command(store.entries))
+
+    def test_command_rejects_a_recording_without_ticks(self):
+        # Solo lo "start": replay() non esegue tick e non può misurare i tick al secondo
+        store = self.MemoryStore()
+        ReplayRecorder(store, PongGame("recorded"))
+        with self.assertRaisesRegex(CommandError, "ran no ticks"):
+            self.run_command(store.entries)
+
+    def test_command_rejects_an_unsupported_version(self):
+        with self.assertRaisesRegex(CommandError, "Unsupported replay version"):
+            self.run_command([{"type": "start", "v": 1, "seed": 0, "match_id": None}])
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_benchmark_is_reproducible(self):
+        first = run_benchmark(matches=4, ticks=1500, alloc_ticks=5, seed=3)
+        second = run_benchmark(matches=4, ticks=1500, alloc_ticks=5, seed=3)
+        self.assertGreater(first["games_finished"], 0)
+        self.assertEqual(first["games_finished"], second["games_finished"])
+
+    def test_regressions_are_reported(self):
+        baseline = {"tick_mean_rel": 0.010, "tick_p99_rel": 0.030}
+        result = {"tick_mean_rel": 0.013, "tick_p50_rel": 0.010, "tick_p99_rel": 0.033,
+                  "alloc_bytes_per_tick": 0, "memory_per_match_bytes": 0}
+        regressions = compare_with_baseline(result, baseline, tolerance=0.2)
+        self.assertEqual([name for name, *_ in regressions], ["tick_mean_rel"])
+
+    def test_absolute_timings_are_not_compared(self):
+        # Una macchina due volte più lenta raddoppia tempi e calibrazione: nessuna regressione
+        baseline = {"ticks_per_second": 1000, "tick_p99_us": 10, "tick_p99_rel": 0.03}
+        result = {"ticks_per_second": 500, "tick_p99_us": 20, "tick_mean_rel": 0.012, "tick_p50_rel": 0.010,
+                  "tick_p99_rel": 0.03, "alloc_bytes_per_tick": 0, "memory_per_match_bytes": 0}
+        self.assertEqual(compare_with_baseline(result, baseline, tolerance=0.2), [])
+
+    def test_saved_baseline_has_only_relative_timings(self):
+        result = run_benchmark(matches=2, ticks=200, alloc_ticks=2, seed=1)
+        self.assertGreater(result["tick_p50_rel"], 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            save_baseline(path, result)
+            baseline = load_baseline(path)
+        self.assertNotIn("ticks_per_second", baseline)
+        self.assertNotIn("tick_p99_us", baseline)
+        self.assertEqual(baseline["tick_p99_rel"], result["tick_p99_rel"])
+        self.assertEqual(compare_with_baseline(result, baseline, tolerance=0), [])
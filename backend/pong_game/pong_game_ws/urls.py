@@ -4,5 +4,6 @@ from . import views
 app_name = 'pong_game_ws'
 
 urlpatterns = [
+    path('game/stats/', views.GameStatsView.as_view(), name='game-stats'),
     path('game/<str:game_id>/state/', views.GameStateView.as_view(), name='game-state'),
 ]
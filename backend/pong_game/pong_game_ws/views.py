@@ -6,6 +6,16 @@ from rest_framework import status
 from django.core.cache import cache
 from .models import Match
 from .consumers import GameConsumer
+from .scheduler import tick_scheduler
+from .broadcast import broadcast_stats
+from .sharding import shard_router
+from .results import match_result_writer
+from .auth_cache import token_cache
+from .replay import replay_store
+from .send_rate import send_rate_stats
+from .mailbox import mailbox_stats
+from .spectators import spectator_hub
+from channels.layers import get_channel_layer
 import json
 
 class GameStateView(APIView):
@@ -64,7 +74,7 @@ class GameStateView(APIView):
                 "game_id": game_id,
                 "match_id": match_id,
                 "status": "active" if game_instance.game_loop_running else "waiting",
-                "game_state": game_instance.state,
+                "game_state": game_instance.snapshot(),
                 "players": {
                     "left_player": game_instance.left_player.username if game_instance.left_player else None,
                     "right_player": game_instance.right_player.username if game_instance.right_player else None,
@@ -195,3 +205,42 @@ class GameStateView(APIView):
                 {"error": f"Internal server error: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class GameStatsView(APIView):
+    """
+    GET: Restituisce le metriche del game loop di questo processo
+    (tick eseguiti, overrun, tick recuperati/scartati, partite attive, frame trasmessi,
+    consegne locali/remote del channel layer, partite inoltrate tra worker,
+    risultati dei match in attesa di scrittura, input accodati/scartati delle partite attive,
+    frequenza di invio dei frame di ogni partita, frame superati nelle code di invio,
+    spettatori connessi a questo processo).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        channel_layer = get_channel_layer()
+        inputs = {}
+        for game in GameConsumer.games.values():
+            for key, value in game.input_stats.items():
+                inputs[key] = inputs.get(key, 0) + value
+        return Response({
+            "games": len(GameConsumer.games),
+            "inputs": inputs,
+            "scheduler": tick_scheduler.snapshot(),
+            "broadcast": dict(broadcast_stats),
+            "send_rate": {
+                **send_rate_stats,
+                "games": {
+                    game_id: game.send_rate.snapshot()
+                    for game_id, game in GameConsumer.games.items() if game.send_rate
+                },
+            },
+            "mailbox": dict(mailbox_stats),
+            "spectators": spectator_hub.snapshot(),
+            "sharding": shard_router.snapshot(),
+            "results": match_result_writer.snapshot(),
+            "token_cache": token_cache.snapshot(),
+            "replay": replay_store.snapshot(),
+            "channel_layer": channel_layer.snapshot() if hasattr(channel_layer, "snapshot") else None,
+        })
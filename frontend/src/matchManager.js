@@ -9,6 +9,10 @@ export class MatchManager {
     #matchErrors = null;
     /** @type {JQuery.jqXHR | null} */
     #currentJqXHR = null; // Per memorizzare la richiesta AJAX corrente
+    /** @type {JQuery.jqXHR | null} */
+    #rankedStatusJqXHR = null; // GET ranked in long-poll in corso
+    /** @type {{password: string, gameId: string | null} | null} */
+    #passwordWait = null; // attesa di una partita privata in corso
 
     constructor(matchApiUrl) {
         this.#matchApiUrl = matchApiUrl;
@@ -21,6 +25,49 @@ export class MatchManager {
     }
 
     async matchPassword(password) {
+        // Il server risponde 202 (con il nostro game_id) se l'avversario non è ancora arrivato:
+        // la richiesta viene ripetuta in long-poll finché non arriva il match o un errore
+        const wait = { password, gameId: null };
+        this.#passwordWait = wait;
+        try {
+            while (true) {
+                const { data, status } = await this.#postPassword(password, wait.gameId);
+                if (status !== 202) {
+                    return data;
+                }
+                wait.gameId = data.game_id;
+            }
+        } finally {
+            if (this.#passwordWait === wait) {
+                this.#passwordWait = null;
+            }
+        }
+    }
+
+    /**
+     * Interrompe l'attesa di una partita privata e libera la password sul server,
+     * così il prossimo giocatore non viene accoppiato con chi ha lasciato la pagina.
+     */
+    cancelPasswordMatch() {
+        const wait = this.#passwordWait;
+        this.#passwordWait = null;
+        this.abortCurrentMatchRequest();
+        if (!wait || !wait.gameId) {
+            return;
+        }
+        $.ajax({
+            url: `${this.#matchApiUrl}/match/private-password/`,
+            method: "DELETE",
+            data: { password: wait.password, game_id: wait.gameId },
+        }).fail((jqXHR) => {
+            // 409: l'avversario era già arrivato, niente da annullare
+            if (jqXHR.status !== 409) {
+                console.error('MatchManager: private match cancel failed:', jqXHR.status);
+            }
+        });
+    }
+
+    #postPassword(password, gameId) {
         this.#isLoading = true;
         this.#matchErrors = {};
 
@@ -30,16 +77,18 @@ export class MatchManager {
         }
 
         return new Promise((resolve, reject) => {
+            const data = { password: password };
+            if (gameId) {
+                data.game_id = gameId;
+            }
             this.#currentJqXHR = $.ajax({
                 url: `${this.#matchApiUrl}/match/private-password/`,
                 method: "POST",
-                data: {
-                    password: password,
-                },
+                data: data,
             })
-            .done((data) => {
+            .done((data, textStatus, jqXHR) => {
                 this.#matchErrors = null;
-                resolve(data); // Risolve la Promise con i dati
+                resolve({ data, status: jqXHR.status }); // Risolve la Promise con i dati
             })
             .fail((jqXHR, textStatus, errorThrown) => {
                 if (textStatus === 'abort') {
@@ -119,11 +168,32 @@ export class MatchManager {
     }
 
     async matchTournament(tournamentId) {
-        return $.ajax({
-            url: `${this.#matchApiUrl}/match/tournament/${tournamentId}/`,
-            method: "POST",
-            contentType: "application/json",
-            data: JSON.stringify({ id: tournamentId })
+        // Il server risponde 202 (con il nostro game_id) finché l'avversario non arriva:
+        // la richiesta viene ripetuta con il game_id, ognuna resta aperta solo pochi secondi
+        let gameId = null;
+        while (true) {
+            const { data, status } = await this.#postTournament(tournamentId, gameId);
+            if (status !== 202) {
+                return data;
+            }
+            gameId = data.game_id;
+        }
+    }
+
+    #postTournament(tournamentId, gameId) {
+        const data = { id: tournamentId };
+        if (gameId) {
+            data.game_id = gameId;
+        }
+        return new Promise((resolve, reject) => {
+            $.ajax({
+                url: `${this.#matchApiUrl}/match/tournament/${tournamentId}/`,
+                method: "POST",
+                contentType: "application/json",
+                data: JSON.stringify(data)
+            })
+            .done((data, textStatus, jqXHR) => resolve({ data, status: jqXHR.status }))
+            .fail((jqXHR) => reject(jqXHR));
         });
     }
 
@@ -135,12 +205,30 @@ export class MatchManager {
         });
     }
 
-    async checkRankedMatchStatus() {
-        return $.ajax({
+    /**
+     * Stato della ricerca ranked. Con `wait` (secondi) il server risponde appena
+     * viene trovato l'avversario, oppure allo scadere dell'attesa.
+     * @param {number} [wait]
+     */
+    async checkRankedMatchStatus(wait = 0) {
+        this.#rankedStatusJqXHR = $.ajax({
             url: `${this.#matchApiUrl}/match/ranked/`,
             method: "GET",
-            dataType: "json"
+            dataType: "json",
+            data: wait ? { wait } : undefined,
         });
+        try {
+            return await this.#rankedStatusJqXHR;
+        } finally {
+            this.#rankedStatusJqXHR = null;
+        }
+    }
+
+    abortRankedStatusRequest() {
+        if (this.#rankedStatusJqXHR) {
+            this.#rankedStatusJqXHR.abort();
+            this.#rankedStatusJqXHR = null;
+        }
     }
 
     async cancelRankedMatch() {
@@ -152,7 +240,8 @@ export class MatchManager {
 
     destroy() {
         // Potresti voler annullare una richiesta in corso anche qui
-        this.abortCurrentMatchRequest();
+        this.cancelPasswordMatch();
+        this.abortRankedStatusRequest();
         console.debug(`MatchManager destroyed. #${this.#id}`);
         if (window.tools.matchManager === this) {
             window.tools.matchManager = null;
@@ -1,9 +1,24 @@
 // pongManager.js
-export function createPongManager(pongApiUrl) {
+export function createPongManager(pongApiUrl, { binary = false } = {}) {
 
 	let socket = null;
 	let gameId = null;
 	let accessToken = null;
+
+	// Protocollo v2: keyframe completi + delta con numero di sequenza
+	const PROTOCOL_VERSION = 2;
+	let lastSeq = null;
+	let snapshot = null;
+	let resyncRequested = false;
+
+	// Frame binario (?encoding=binary): layout fisso little endian da 44 byte
+	const BINARY_GAME_STATE = 1;
+	const BINARY_FRAME_SIZE = 44;
+
+	// Predizione lato client: ogni input ha un numero di sequenza, i frame riportano
+	// il tick del server e l'ultimo input elaborato per ciascun giocatore
+	let inputSeq = 0;
+	let playerSide = null;
   
 	// Callback registrabili dal frontend
 	const listeners = {
@@ -23,13 +38,29 @@ export function createPongManager(pongApiUrl) {
 	  gameId = _gameId;
 	  accessToken = localStorage.getItem("access_token");
 	  
-	  socket = new WebSocket(`${pongApiUrl}/ws/game/${gameId}/`);
+	  lastSeq = null;
+	  snapshot = null;
+	  resyncRequested = false;
+	  inputSeq = 0;
+	  playerSide = null;
+	  
+	  const encoding = binary ? "&encoding=binary" : "";
+	  socket = new WebSocket(`${pongApiUrl}/ws/game/${gameId}/?proto=${PROTOCOL_VERSION}${encoding}`);
+	  socket.binaryType = "arraybuffer";
   
 	  socket.onopen = () => {		
 		socket.send(accessToken);
 	  };
   
 	  socket.onmessage = (event) => {
+		if (event.data instanceof ArrayBuffer) {
+		  const frame = decodeBinaryFrame(event.data);
+		  if (frame) {
+			listeners.onGameState?.(frame.state, syncInfo(frame.tick, frame.ack));
+		  }
+		  return;
+		}
+
 		let data;
 		try {
 		  data = JSON.parse(event.data);
@@ -43,7 +74,32 @@ export function createPongManager(pongApiUrl) {
 		  case "game_state":
 			// console.log("[PongManager] Stato del gioco ricevuto:", data);
 			
-			listeners.onGameState?.(data.state);
+			if (data.v !== PROTOCOL_VERSION) {
+				listeners.onGameState?.(data.state, syncInfo(data.tick, data.ack));
+				break;
+			}
+			// Keyframe: sostituisce lo snapshot (ignora quelli più vecchi arrivati in ritardo)
+			if (lastSeq !== null && data.seq <= lastSeq) {
+				break;
+			}
+			snapshot = { ...data.state };
+			lastSeq = data.seq;
+			resyncRequested = false;
+			listeners.onGameState?.(expandSnapshot(snapshot), syncInfo(data.t, data.ack));
+			break;
+
+		  case "game_delta":
+			if (lastSeq !== null && data.seq <= lastSeq) {
+				break;
+			}
+			if (snapshot === null || data.seq !== lastSeq + 1) {
+				// Buco nella sequenza: serve di nuovo lo stato completo
+				requestResync();
+				break;
+			}
+			Object.assign(snapshot, data.d);
+			lastSeq = data.seq;
+			listeners.onGameState?.(expandSnapshot(snapshot), syncInfo(data.t, data.ack));
 			break;
   
 		  case "game_over":
@@ -62,9 +118,15 @@ export function createPongManager(pongApiUrl) {
 			listeners.onPlayersReady?.(data);
 			break;
 
+		  case "ping":
+			// Misura del RTT lato server: risponde subito con lo stesso id
+			socket.send(JSON.stringify({ action: "pong", id: data.id }));
+			break;
+
 		  case undefined:
 			// Gestione messaggio di autenticazione (non ha campo type)
 			if (data.message && data.message.includes("Authentication successful")) {
+				playerSide = data.player_side;
 				break;
 			}
 			// Se non è autenticazione, logga come messaggio sconosciuto
@@ -87,13 +149,83 @@ export function createPongManager(pongApiUrl) {
 	}
   
 	/**
-	 * Invia un comando di movimento (es. "up", "down").
+	 * Ricostruisce lo stato nel formato usato dai listener a partire dai campi compatti del protocollo v2.
+	 */
+	function expandSnapshot(s) {
+	  return {
+		ball: { x: s.bx, y: s.by, dx: s.bdx, dy: s.bdy },
+		left_paddle: { y: s.lp },
+		right_paddle: { y: s.rp },
+		left_score: s.ls,
+		right_score: s.rs,
+	  };
+	}
+
+	/**
+	 * Tick del server e ultimo input di questo giocatore già applicato (null se il server non li invia).
+	 * Gli input con seq > lastInput vanno riapplicati sopra lo stato ricevuto.
+	 */
+	function syncInfo(tick, ack) {
+	  if (tick === undefined || !ack) {
+		return { tick: null, lastInput: null, pendingInputs: null };
+	  }
+	  const lastInput = playerSide === "right" ? ack[1] : ack[0];
+	  return { tick, lastInput, pendingInputs: inputSeq - lastInput };
+	}
+
+	/**
+	 * Decodifica un frame di stato binario (vedi BINARY_FRAME in pong_game_ws/protocol.py).
+	 */
+	function decodeBinaryFrame(buffer) {
+	  const view = new DataView(buffer);
+	  if (view.byteLength < BINARY_FRAME_SIZE || view.getUint8(0) !== BINARY_GAME_STATE) {
+		console.warn("[PongManager] Frame binario non valido");
+		return null;
+	  }
+	  const seq = view.getUint32(2, true);
+	  if (lastSeq !== null && seq <= lastSeq) {
+		return null;
+	  }
+	  lastSeq = seq;
+	  const state = {
+		ball: {
+		  x: view.getFloat32(6, true),
+		  y: view.getFloat32(10, true),
+		  dx: view.getFloat32(14, true),
+		  dy: view.getFloat32(18, true),
+		},
+		left_paddle: { y: view.getFloat32(22, true) },
+		right_paddle: { y: view.getFloat32(26, true) },
+		left_score: view.getUint8(30),
+		right_score: view.getUint8(31),
+	  };
+	  return {
+		state,
+		tick: view.getUint32(32, true),
+		ack: [view.getUint32(36, true), view.getUint32(40, true)],
+	  };
+	}
+
+	/**
+	 * Chiede al server un keyframe completo (una sola richiesta finché non arriva).
+	 */
+	function requestResync() {
+	  if (resyncRequested || !socket || socket.readyState !== WebSocket.OPEN) {
+		return;
+	  }
+	  resyncRequested = true;
+	  socket.send(JSON.stringify({ action: "resync" }));
+	}
+
+	/**
+	 * Invia un comando di movimento ("up", "down" o "stop" al rilascio).
 	 */
 	function sendMove(direction) {
 	  if (socket && socket.readyState === WebSocket.OPEN) {
 		socket.send(JSON.stringify({
 		  action: "move",
 		  direction: direction,
+		  seq: ++inputSeq,
 		}));
 	  } else {
 		console.warn("[PongManager] Connessione non pronta, comando ignorato.");
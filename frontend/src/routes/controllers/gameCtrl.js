@@ -496,6 +496,12 @@ export class GameController {
                 this.moveUp = false;
             } else if (event.key === "ArrowDown") {
                 this.moveDown = false;
+            } else {
+                return;
+            }
+            // Il server mantiene l'ultima direzione ad ogni tick: al rilascio va fermato subito
+            if (!this.moveUp && !this.moveDown) {
+                this.pongManager.sendMove("stop");
             }
         };
 
@@ -62,6 +62,11 @@ export class PrivateMatchController {
         }
     }
 
+    // Cleanup quando si esce dalla pagina: libera la password se si stava aspettando
+    destroy() {
+        window.tools.matchManager?.cancelPasswordMatch();
+    }
+
     #generatePIN(inputElement) {
         const pin = Math.floor(100000 + Math.random() * 900000).toString();
         inputElement.value = "";
@@ -1,6 +1,6 @@
 export class RankedMatchController {
     titleSuffix = "";
-    #pollingInterval = null;
+    #polling = false;
 
     init() {
         this.#bindEvents();
@@ -57,51 +57,60 @@ export class RankedMatchController {
     }
 
     #startPolling() {
-        if (this.#pollingInterval) {
-            clearInterval(this.#pollingInterval);
+        if (this.#polling) {
+            return;
         }
+        this.#polling = true;
+        this.#waitForMatch();
+    }
 
-        this.#pollingInterval = setInterval(async () => {
+    async #waitForMatch() {
+        // Long-poll: ogni richiesta resta aperta finché il worker trova l'avversario (max 25s)
+        while (this.#polling) {
             try {
                 const matchManager = window.tools.matchManager;
-                const response = await matchManager.checkRankedMatchStatus();
+                const response = await matchManager.checkRankedMatchStatus(25);
+                if (!this.#polling) {
+                    return;
+                }
 
                 if (response && response.game_id) {
                     this.#stopPolling();
                     localStorage.setItem("game_id", response.game_id);
                     window.location.hash = "#game?type=ranked";
+                    return;
                 }
-                // Se status è ancora "waiting", continua il polling
+                // Se status è ancora "waiting", rifà subito la richiesta
+                console.log("Searching for ranked match...");
             } catch (error) {
+                if (!this.#polling) {
+                    return; // richiesta annullata da stopPolling
+                }
                 if (error.status === 404) {
                     this.#stopPolling();
                     this.#showForm();
-                } else if (error.status === 202) {
-                    // Ancora in attesa, continua il polling
-                    console.log("Searching for ranked match...");
                 } else {
                     console.error("RankedMatch: Polling error:", error);
                     this.#stopPolling();
                     this.#showForm();
                     this.#showError("Error during matchmaking");
                 }
+                return;
             }
-        }, 2000); // Polling ogni 2 secondi
+        }
     }
 
     #stopPolling() {
-        if (this.#pollingInterval) {
-            clearInterval(this.#pollingInterval);
-            this.#pollingInterval = null;
-        }
+        this.#polling = false;
+        window.tools.matchManager?.abortRankedStatusRequest();
     }
 
     async #cancelRankedSearch() {
         try {
+            this.#stopPolling();
             const matchManager = window.tools.matchManager;
             await matchManager.cancelRankedMatch();
             
-            this.#stopPolling();
             this.#showForm();
         } catch (error) {
             console.error("RankedMatch: Error cancelling search:", error);